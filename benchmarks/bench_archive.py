@@ -0,0 +1,109 @@
+"""
+Description:
+Measures backup throughput on a synthetic mixed folder: text-like files that deflate
+well next to photos, videos and archives (random bytes) that do not. The previous
+single-threaded archive_all, which deflated everything and recomputed the common path
+for every member, is run first unless --skip-legacy is given, then the parallel
+archiver. Both archives are checked with ZipFile.testzip.
+
+Usage: python benchmarks/bench_archive.py [--size-gb N] [--workers N] [--skip-legacy] [--dir PATH]
+
+Authors: Nolan Donovan, Adam Lahouar, Evan Donohoe
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "desktop"))
+
+import functions  # noqa: E402
+from archiver import DEFAULT_ARCHIVE_WORKERS  # noqa: E402
+
+# (extension, share of the total size, whether the contents compress, file sizes to pick from)
+MIX = [
+    ("txt", 0.15, True, [4 * 1024, 64 * 1024, 1024 ** 2]),
+    ("csv", 0.15, True, [1024 ** 2, 32 * 1024 ** 2]),
+    ("jpg", 0.2, False, [512 * 1024, 4 * 1024 ** 2]),
+    ("mp4", 0.35, False, [64 * 1024 ** 2, 512 * 1024 ** 2]),
+    ("zip", 0.15, False, [8 * 1024 ** 2, 128 * 1024 ** 2]),
+]
+
+WORDS = [b"invoice", b"total", b"2023", b"report", b"customer", b"download", b"amount", b"\n", b",", b"status"]
+BLOCK_SIZE = 1024 * 1024
+
+
+def build_tree(root: str, total_bytes: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    text_block = b" ".join(rng.choice(WORDS) for _ in range(BLOCK_SIZE // 5))[:BLOCK_SIZE]
+
+    for extension, share, compressible, sizes in MIX:
+        remaining = int(total_bytes * share)
+        index = 0
+        while remaining > 0:
+            size = min(rng.choice(sizes), remaining)
+            folder = os.path.join(root, f"folder {index % 10}")
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, f"{extension} file {index}.{extension}"), "wb") as stream:
+                written = 0
+                while written < size:
+                    length = min(BLOCK_SIZE, size - written)
+                    # Text blocks get a unique prefix so that files do not repeat each other exactly
+                    block = (b"%d " % rng.getrandbits(32) + text_block)[:length] if compressible else os.urandom(length)
+                    stream.write(block)
+                    written += length
+            remaining -= size
+            index += 1
+
+
+def legacy_archive_all(list_of_files, archive_name):
+    with zipfile.ZipFile(archive_name, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for file in list_of_files:
+            archive.write(file.path, os.path.relpath(file.path, os.path.commonpath([f.path for f in list_of_files])))
+
+
+def report(label: str, seconds: float, total_bytes: int, archive_name: str) -> None:
+    with zipfile.ZipFile(archive_name) as archive:
+        status = "ok" if archive.testzip() is None else "CORRUPT"
+    archive_size = os.path.getsize(archive_name)
+    print(f"{label:12} {seconds:8.1f} s   {total_bytes / seconds / 1024 ** 2:8.1f} MB/s   "
+          f"archive {archive_size / 1024 ** 3:6.2f} GB ({archive_size / total_bytes:5.1%})   {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-gb", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=DEFAULT_ARCHIVE_WORKERS)
+    parser.add_argument("--skip-legacy", action="store_true")
+    parser.add_argument("--dir", help="folder to create the synthetic files and archives in (default: a temp folder)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_archive_", dir=args.dir)
+    try:
+        root = os.path.join(work_dir, "Downloads")
+        build_tree(root, int(args.size_gb * 1024 ** 3))
+        files = list(functions.get_all_files_in_path(root).values())
+        total_bytes = sum(file.size for file in files)
+        print(f"{len(files)} files, {total_bytes / 1024 ** 3:.2f} GB, {args.workers} workers")
+
+        archive_name = os.path.join(work_dir, "archive.zip")
+        if not args.skip_legacy:
+            start = time.perf_counter()
+            legacy_archive_all(files, archive_name)
+            report("legacy", time.perf_counter() - start, total_bytes, archive_name)
+            os.remove(archive_name)
+
+        start = time.perf_counter()
+        functions.archive_all(files, archive_name, max_workers=args.workers)
+        report("archiver", time.perf_counter() - start, total_bytes, archive_name)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
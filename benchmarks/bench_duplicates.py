@@ -0,0 +1,89 @@
+"""
+Description:
+Compares the name-based functions.get_duplicates with the staged, content-verified
+duplicates.get_duplicate_files on a synthetic folder. The folder mixes "(1)" copies,
+renamed copies, many same-size files with different contents and unique files, so both
+the running time and the accuracy of each approach are reported.
+
+Usage: python benchmarks/bench_duplicates.py [--files N] [--same-size N] [--workers N]
+
+Authors: Evan Donohoe, Nolan Donovan, Adam Lahouar
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "desktop"))
+
+import functions  # noqa: E402
+from duplicates import DEFAULT_HASH_WORKERS, get_duplicate_files  # noqa: E402
+
+
+def build_tree(root: str, file_count: int, same_size_count: int, seed: int = 0) -> set[str]:
+    """
+    Writes the synthetic folder and returns the paths of the copies that should be flagged
+    """
+    rng = random.Random(seed)
+    expected: set[str] = set()
+
+    def write(name: str, data: bytes) -> str:
+        path = os.path.join(root, name)
+        with open(path, "wb") as stream:
+            stream.write(data)
+        return path
+
+    for i in range(file_count):
+        data = rng.randbytes(rng.choice([512, 6 * 1024, 64 * 1024, 512 * 1024]))
+        write(f"file {i}.bin", data)
+
+        roll = rng.random()
+        if roll < 0.1:
+            expected.add(write(f"file {i} (1).bin", data))
+        elif roll < 0.15:
+            expected.add(write(f"renamed copy {i}.bin", data))
+
+    # Same size as each other but unrelated names and contents, the worst case for pairwise name checks
+    for i in range(same_size_count):
+        write(f"scan_{rng.getrandbits(64):016x}.bin", rng.randbytes(16 * 1024))
+
+    return expected
+
+
+def report(label: str, seconds: float, flagged: set[str], expected: set[str]) -> None:
+    correct = len(flagged & expected)
+    print(f"{label:24} {seconds * 1000:9.1f} ms   flagged {len(flagged):6}   "
+          f"correct {correct:6}   wrong {len(flagged) - correct:6}   missed {len(expected) - correct:6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=5_000)
+    parser.add_argument("--same-size", type=int, default=10_000,
+                        help="number of distinct, unrelated files that all share one size")
+    parser.add_argument("--workers", type=int, default=DEFAULT_HASH_WORKERS)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_duplicates_")
+    try:
+        expected = build_tree(root, args.files, args.same_size)
+        files = list(functions.get_all_files_in_path(root, max_depth=0).values())
+        print(f"{len(files)} files, {len(expected)} planted duplicates")
+
+        start = time.perf_counter()
+        legacy = {file.path for file in functions.get_duplicates(files)}
+        report("get_duplicates", time.perf_counter() - start, legacy, expected)
+
+        start = time.perf_counter()
+        staged = {file.path for file in get_duplicate_files(files, args.workers)}
+        report("get_duplicate_files", time.perf_counter() - start, staged, expected)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Description:
+Measures the memory used per File object. The previous File implementation (a plain
+class with a __dict__, the full path and eagerly formatted dates) is reproduced below
+as LegacyFile so both can be compared on the same synthetic paths.
+
+Usage: python benchmarks/bench_file_memory.py [--files N] [--directories N]
+
+Authors: Nolan Donovan, Evan Donohoe, Adam Lahouar
+"""
+
+import argparse
+import datetime
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "desktop"))
+
+from file import File  # noqa: E402
+
+EXTENSIONS = ["pdf", "jpg", "png", "zip", "exe", "docx", "mp4", "txt"]
+
+
+class LegacyFile:
+    """
+    The File class as it was before it switched to __slots__
+    """
+
+    def __init__(self, path, size, last_accessed, date_added):
+        self.path = path
+        self.name, self.type = os.path.splitext(os.path.basename(path))
+        self.type = self.type.strip('.').lower()
+        self.size = size
+        self.last_accessed = last_accessed
+        self.date_added = date_added
+        self.last_accessed_formatted = datetime.datetime.fromtimestamp(self.last_accessed).strftime('%Y/%m/%d %H:%M')
+        self.date_added_formatted = datetime.datetime.fromtimestamp(self.date_added).strftime('%Y/%m/%d %H:%M')
+        self.checked = False
+
+
+def synthetic_metadata(file_count: int, directory_count: int) -> list[tuple[str, int, float, float]]:
+    root = os.path.join(os.path.expanduser("~"), "Downloads")
+    now = time.time()
+    return [
+        (
+            os.path.join(root, f"folder {i % directory_count}", f"download {i}.{EXTENSIONS[i % len(EXTENSIONS)]}"),
+            i * 37,
+            now - i,
+            now - 2 * i,
+        )
+        for i in range(file_count)
+    ]
+
+
+def measure(factory, metadata) -> tuple[float, float]:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    objects = [factory(*row) for row in metadata]
+    elapsed = time.perf_counter() - start
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return used / len(metadata), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200_000)
+    parser.add_argument("--directories", type=int, default=50)
+    args = parser.parse_args()
+
+    metadata = synthetic_metadata(args.files, args.directories)
+
+    # The path strings themselves are shared input, so they are allocated before tracing starts
+    legacy_bytes, legacy_seconds = measure(LegacyFile, metadata)
+    compact_bytes, compact_seconds = measure(File.from_metadata, metadata)
+
+    print(f"{args.files} files in {args.directories} directories")
+    print(f"LegacyFile:  {legacy_bytes:8.1f} bytes/file  {legacy_seconds:6.2f} s to build")
+    print(f"File:        {compact_bytes:8.1f} bytes/file  {compact_seconds:6.2f} s to build")
+    print(f"Saved {1 - compact_bytes / legacy_bytes:.0%} per file")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Description:
+Times the identify and sort queries on a FileStore against the per-file Python loops
+they replaced, on synthetic File objects built without touching the disk. The results
+of both versions are compared so the benchmark doubles as a consistency check.
+
+Usage: python benchmarks/bench_identify.py [--files N]
+
+Authors: Evan Donohoe, Nolan Donovan, Adam Lahouar
+"""
+
+import argparse
+import operator
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "desktop"))
+
+import functions  # noqa: E402
+from file import File  # noqa: E402
+from filestore import FileStore  # noqa: E402
+
+EXTENSIONS = ["pdf", "jpg", "png", "zip", "exe", "msi", "docx", "mp4", "txt", ""]
+NAMES = ["setup", "report", "photo", "windows_update", "installer", "invoice", "song", "notes"]
+
+
+def legacy_identify_installers(list_of_files):
+    return [
+        file for file in list_of_files
+        if file.type in functions.INSTALLER_TYPES
+        and any(substring in file.name.lower() for substring in functions.INSTALLER_SUBSTRINGS)
+    ]
+
+
+def legacy_identify_old_files(list_of_files, threshold):
+    current_datetime = datetime.now()
+    return [
+        file for file in list_of_files
+        if current_datetime - datetime.fromtimestamp(file.date_added) > threshold
+        and current_datetime - datetime.fromtimestamp(file.last_accessed) > threshold
+    ]
+
+
+def legacy_identify_large_files(list_of_files, size_threshold):
+    return [file for file in list_of_files if file.size > size_threshold]
+
+
+def legacy_sort(list_of_files, attribute, descending=False):
+    return sorted(list_of_files, key=operator.attrgetter(attribute), reverse=descending)
+
+
+def synthetic_files(file_count: int, seed: int = 0) -> list[File]:
+    rng = random.Random(seed)
+    now = time.time()
+    files = list()
+    for i in range(file_count):
+        extension = rng.choice(EXTENSIONS)
+        name = f"{rng.choice(NAMES)} {i}" + (f".{extension}" if extension else "")
+        # Dates are whole hours so both old-file implementations agree regardless of DST offsets
+        added = now - 3600 * rng.randrange(24 * 365 * 3)
+        files.append(File.from_metadata(
+            os.path.join("/downloads", f"folder {i % 100}", name),
+            int(rng.lognormvariate(13, 2.5)),
+            added + 3600 * rng.randrange(24 * 30),
+            added,
+        ))
+    return files
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    files = synthetic_files(args.files)
+    store, build_seconds = timed(FileStore, files)
+    print(f"{args.files} files, FileStore built in {build_seconds * 1000:.0f} ms")
+
+    year = timedelta(days=365)
+    queries = [
+        ("identify_installers", legacy_identify_installers, (files,), store.identify_installers,
+         (functions.INSTALLER_SUBSTRINGS, functions.INSTALLER_TYPES)),
+        ("identify_old_files", legacy_identify_old_files, (files, year), store.identify_old_files, (year,)),
+        ("identify_large_files", legacy_identify_large_files, (files, 500 * 1024 ** 2),
+         store.identify_large_files, (500 * 1024 ** 2,)),
+        ("sort by size", legacy_sort, (files, "size", True), store.sort_by, ("size", True)),
+        ("sort by name", legacy_sort, (files, "name"), store.sort_by, ("name",)),
+        ("sort by type", legacy_sort, (files, "type", True), store.sort_by, ("type", True)),
+    ]
+
+    # The first FileStore call includes building any lazily cached columns it needs
+    for label, legacy, legacy_args, vectorized, vectorized_args in queries:
+        expected, legacy_seconds = timed(legacy, *legacy_args)
+        result, first_seconds = timed(vectorized, *vectorized_args)
+        _, repeat_seconds = timed(vectorized, *vectorized_args)
+        status = "ok" if result == expected else "MISMATCH"
+        print(f"{label:22} loop {legacy_seconds * 1000:8.1f} ms   FileStore first {first_seconds * 1000:7.1f} ms"
+              f"   repeat {repeat_seconds * 1000:7.1f} ms   {len(result):8} files   {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Description:
+Times file name searches on a TrigramIndex against the lowercase-and-scan loop of
+functions.search_by_filename, on synthetic File objects built without touching the disk.
+The results of both versions are compared so the benchmark doubles as a consistency check.
+
+Usage: python benchmarks/bench_search.py [--files N]
+
+Authors: Adam Lahouar, Evan Donohoe, Nolan Donovan
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "desktop"))
+
+import functions  # noqa: E402
+from bench_identify import synthetic_files, timed  # noqa: E402
+from indexes import TrigramIndex  # noqa: E402
+
+QUERIES = ["s", "in", "rep", "report", "invoice 12", "windows_update 4999", "1234", "no such file"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=500_000)
+    args = parser.parse_args()
+
+    files = synthetic_files(args.files)
+    files_dict = {file.path: file for file in files}
+    index, build_seconds = timed(TrigramIndex, files)
+    print(f"{args.files} files, TrigramIndex built in {build_seconds * 1000:.0f} ms")
+
+    for query in QUERIES:
+        expected, scan_seconds = timed(functions.search_by_filename, files_dict, query)
+        result, index_seconds = timed(index.search, query)
+        status = "ok" if {file.path for file in result} == set(expected) else "MISMATCH"
+        print(f"{query!r:24} scan {scan_seconds * 1000:8.1f} ms   index {index_seconds * 1000:7.2f} ms"
+              f"   {len(result):8} files   {status}")
+
+
+if __name__ == "__main__":
+    main()
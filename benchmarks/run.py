@@ -0,0 +1,306 @@
+"""
+Description:
+Runs every stage of the application against synthetic Downloads folders (see
+synthetic.py) and saves the results as JSON, so that two runs can be compared to catch
+regressions. The stages are, in order: scanning the folder (get_all_files_in_path),
+building the FileStore, the name-based get_duplicates, the content-based
+identify_duplicates, the identify_installers/old/large queries, filling the file table
+(FileTable.update_table_contents, skipped without PyQt5) and archive_all.
+
+Each stage is timed --repeats times, then run once more under tracemalloc for its peak
+memory (Python and NumPy allocations). Throughput is given in files per second, and in
+bytes per second for archive_all, which reads the file contents. A tree is built for every
+combination of the --files, --sizes, --extensions, --depth and --duplicate-rate values.
+
+Usage: python benchmarks/run.py run [--files N ...] [--sizes PROFILE ...] [--output FILE] [...]
+       python benchmarks/run.py compare BASELINE.json CURRENT.json [--threshold 0.1]
+
+Authors: Evan Donohoe, Adam Lahouar, Nolan Donovan
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "desktop"))
+
+import functions  # noqa: E402
+from file import File  # noqa: E402
+from filestore import FileStore  # noqa: E402
+from synthetic import DEFAULT_SPEC, EXTENSION_MIXES, SIZE_PROFILES, TreeSpec, build_tree  # noqa: E402
+
+STAGES = ["scan", "filestore", "get_duplicates", "identify_duplicates", "identify_installers", "identify_old_files",
+          "identify_large_files", "update_table_contents", "archive_all"]
+
+# Same as the GUI's default thresholds
+OLD_THRESHOLD = timedelta(days=365)
+LARGE_THRESHOLD = 500 * 1024 ** 2
+
+# archive_all only gets the first files of the tree up to this many bytes, so large trees stay quick to run
+DEFAULT_ARCHIVE_BYTES = 1024 ** 3
+
+RESULTS_VERSION = 1
+
+
+class Stage:
+    """
+    A step to benchmark: setup (not timed) returns the arguments of run, which is timed
+    run's result is kept in the context under the stage's name for the later stages
+    Stages that read file contents return the files they read, for their throughput in bytes
+    """
+
+    def __init__(self, name: str, run: Callable[..., Any], setup: Callable[[dict], tuple] = None,
+                 reads_contents: bool = False):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda context: ())
+        self.reads_contents = reads_contents
+
+
+def build_stages(archive_bytes: int, work_dir: str) -> list[Stage]:
+    archive_name = os.path.join(work_dir, "archive.zip")
+
+    def archive_setup(context: dict) -> tuple:
+        if os.path.exists(archive_name):
+            os.remove(archive_name)
+        selected: list[File] = list()
+        total = 0
+        for file in context["files"]:
+            if total + file.size > archive_bytes:
+                break
+            selected.append(file)
+            total += file.size
+        return selected, archive_name
+
+    def archive_run(files: list[File], name: str) -> list[File]:
+        # archive_all prints a line when done, which would end up in the results when they go to stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            functions.archive_all(files, name, resume=False)
+        return files
+
+    def table_setup(context: dict) -> tuple:
+        from filetable import FileTable
+
+        return FileTable(dict()), context["files"]
+
+    def table_run(table, files: list[File]):
+        table.update_table_contents(files)
+        return files
+
+    return [
+        Stage("scan", lambda root, depth: list(functions.get_all_files_in_path(root, max_depth=depth).values()),
+              lambda context: (context["root"], context["spec"].depth)),
+        Stage("filestore", FileStore, lambda context: (context["files"],)),
+        Stage("get_duplicates", functions.get_duplicates, lambda context: (context["files"],)),
+        Stage("identify_duplicates", functions.identify_duplicates, lambda context: (context["files"],)),
+        Stage("identify_installers", functions.identify_installers, lambda context: (context["filestore"],)),
+        Stage("identify_old_files", functions.identify_old_files,
+              lambda context: (context["filestore"], OLD_THRESHOLD)),
+        Stage("identify_large_files", functions.identify_large_files,
+              lambda context: (context["filestore"], LARGE_THRESHOLD)),
+        Stage("update_table_contents", table_run, table_setup),
+        Stage("archive_all", archive_run, archive_setup, reads_contents=True),
+    ]
+
+
+def measure(stage: Stage, context: dict, repeats: int, track_memory: bool) -> tuple[Any, dict]:
+    seconds: list[float] = list()
+    result = None
+    for _ in range(repeats):
+        arguments = stage.setup(context)
+        gc.collect()
+        start = time.perf_counter()
+        result = stage.run(*arguments)
+        seconds.append(time.perf_counter() - start)
+
+    peak_memory = None
+    if track_memory:
+        arguments = stage.setup(context)
+        gc.collect()
+        tracemalloc.start()
+        stage.run(*arguments)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    # Files handled: the stage's input for the queries, what it found for the scan
+    items = len(result) if stage.name in ("scan", "archive_all") else len(context["files"])
+    median = statistics.median(seconds)
+    record = {
+        "stage": stage.name,
+        "items": items,
+        "result_items": len(result) if hasattr(result, "__len__") else None,
+        "repeats": repeats,
+        "seconds": seconds,
+        "median_seconds": median,
+        "min_seconds": min(seconds),
+        "items_per_second": items / median if median else None,
+        "peak_memory_bytes": peak_memory,
+    }
+    if stage.reads_contents:
+        processed_bytes = sum(file.size for file in result)
+        record["bytes"] = processed_bytes
+        record["bytes_per_second"] = processed_bytes / median if median else None
+    return result, record
+
+
+def run_tree(spec: TreeSpec, stage_names: list[str], repeats: int, track_memory: bool, archive_bytes: int,
+             directory: Optional[str]) -> list[dict]:
+    work_dir = tempfile.mkdtemp(prefix="bench_run_", dir=directory)
+    records: list[dict] = list()
+    try:
+        root = os.path.join(work_dir, "Downloads")
+        start = time.perf_counter()
+        manifest = build_tree(root, spec)
+        log(f"{spec.label}: built {manifest.files} files ({manifest.total_size / 1024 ** 3:.2f} GB) "
+            f"in {time.perf_counter() - start:.1f} s")
+
+        context: dict = {"root": root, "spec": spec}
+        for stage in build_stages(archive_bytes, work_dir):
+            # scan and filestore feed every later stage, so they always run
+            if stage.name not in stage_names and stage.name not in ("scan", "filestore"):
+                continue
+            try:
+                result, record = measure(stage, context, repeats, track_memory)
+            except ImportError as error:
+                log(f"  {stage.name:22} skipped: {error}")
+                records.append({"tree": spec.label, "spec": spec._asdict(), "stage": stage.name,
+                                "skipped": str(error)})
+                continue
+
+            context["files" if stage.name == "scan" else stage.name] = result
+            if stage.name in stage_names:
+                records.append({"tree": spec.label, "spec": spec._asdict(), **record})
+                log(f"  {stage.name:22} {record['median_seconds'] * 1000:10.1f} ms   "
+                    f"{(record['items_per_second'] or 0):12.0f} files/s   "
+                    f"peak {(record['peak_memory_bytes'] or 0) / 1024 ** 2:8.1f} MB")
+    finally:
+        shutil.rmtree(work_dir)
+    return records
+
+
+def compare(baseline: dict, current: dict, threshold: float, min_seconds: float) -> int:
+    """
+    Prints the change of every stage present in both runs and returns the number of regressions:
+    stages whose median time or peak memory grew by more than threshold (times below min_seconds are noise)
+    """
+    baseline_records = {(record["tree"], record["stage"]): record for record in baseline["results"]
+                        if "skipped" not in record}
+    regressions = 0
+    print(f"{'tree':44} {'stage':22} {'baseline':>10} {'current':>10} {'time':>8} {'memory':>8}")
+    for record in current["results"]:
+        previous = baseline_records.get((record["tree"], record["stage"]))
+        if previous is None or "skipped" in record:
+            continue
+
+        time_ratio = record["median_seconds"] / previous["median_seconds"] if previous["median_seconds"] else 1.0
+        memory_ratio = None
+        if record.get("peak_memory_bytes") and previous.get("peak_memory_bytes"):
+            memory_ratio = record["peak_memory_bytes"] / previous["peak_memory_bytes"]
+
+        slower = time_ratio > 1 + threshold and record["median_seconds"] >= min_seconds
+        bigger = memory_ratio is not None and memory_ratio > 1 + threshold
+        regressions += slower or bigger
+        print(f"{record['tree']:44} {record['stage']:22} {previous['median_seconds'] * 1000:8.1f}ms "
+              f"{record['median_seconds'] * 1000:8.1f}ms {time_ratio - 1:+7.0%}{'!' if slower else ' '}"
+              f"{'' if memory_ratio is None else f'{memory_ratio - 1:+7.0%}'}{'!' if bigger else ''}")
+
+    print(f"\n{regressions} regressions (over {threshold:.0%})")
+    return regressions
+
+
+def environment() -> dict:
+    import numpy
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def log(text: str) -> None:
+    print(text, file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="benchmark the stages and save the results")
+    run_parser.add_argument("--files", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    run_parser.add_argument("--sizes", choices=SIZE_PROFILES, nargs="+", default=[DEFAULT_SPEC.sizes])
+    run_parser.add_argument("--extensions", choices=EXTENSION_MIXES, nargs="+", default=[DEFAULT_SPEC.extensions])
+    run_parser.add_argument("--depth", type=int, nargs="+", default=[DEFAULT_SPEC.depth])
+    run_parser.add_argument("--duplicate-rate", type=float, nargs="+", default=[DEFAULT_SPEC.duplicate_rate])
+    run_parser.add_argument("--seed", type=int, default=DEFAULT_SPEC.seed)
+    run_parser.add_argument("--stages", choices=STAGES, nargs="+", default=STAGES)
+    run_parser.add_argument("--repeats", type=int, default=3)
+    run_parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run of each stage")
+    run_parser.add_argument("--archive-bytes", type=int, default=DEFAULT_ARCHIVE_BYTES,
+                            help="bytes of files given to archive_all (default: 1 GB)")
+    run_parser.add_argument("--dir", help="folder to build the trees in (default: a temp folder)")
+    run_parser.add_argument("--output", default="-", help="file to save the results to (default: stdout)")
+
+    compare_parser = commands.add_parser("compare", help="compare two saved runs, exits with 1 on regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown (default: 0.1)")
+    compare_parser.add_argument("--min-seconds", type=float, default=0.005,
+                                help="stages faster than this are not reported as slower (default: 0.005)")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as baseline_stream, open(args.current) as current_stream:
+            regressions = compare(json.load(baseline_stream), json.load(current_stream), args.threshold,
+                                  args.min_seconds)
+        sys.exit(1 if regressions else 0)
+
+    # The table needs a QApplication, created offscreen if PyQt5 is installed
+    try:
+        from PyQt5.QtWidgets import QApplication
+
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        application = QApplication(sys.argv[:1])  # noqa: F841
+    except ImportError:
+        pass
+
+    results: list[dict] = list()
+    for files, sizes, extensions, depth, duplicate_rate in itertools.product(
+            args.files, args.sizes, args.extensions, args.depth, args.duplicate_rate):
+        spec = TreeSpec(files, sizes, extensions, depth, duplicate_rate, args.seed)
+        results.extend(run_tree(spec, args.stages, args.repeats, not args.no_memory, args.archive_bytes, args.dir))
+
+    document = {"version": RESULTS_VERSION, "environment": environment(), "results": results}
+    if args.output == "-":
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as stream:
+            json.dump(document, stream, indent=2)
+        log(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
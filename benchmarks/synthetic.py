@@ -0,0 +1,174 @@
+"""
+Description:
+Builds reproducible synthetic Downloads folders for the benchmarks. A TreeSpec sets the
+number of files, their size distribution, the mix of extensions, how deep the folders
+nest and how many files are "(1)"-style duplicates of another one. The same spec and
+seed always give the same names, sizes and contents.
+
+Files are written as a short header that is unique to the file (or shared with the
+original, for duplicates) and then extended to their full size with truncate, so on most
+file systems a tree of a million files or many GB takes little time and disk space.
+Access and modification times are spread over the last three years; the creation time
+the File class reads on Linux cannot be set, so it is always the time the tree was built.
+
+Usage: python benchmarks/synthetic.py DEST [--files N] [--sizes PROFILE] [--extensions MIX]
+                                         [--depth N] [--duplicate-rate R] [--seed N]
+
+Authors: Adam Lahouar, Nolan Donovan, Evan Donohoe
+"""
+
+import argparse
+import os
+import random
+import time
+from typing import NamedTuple
+
+# (mu, sigma) of the lognormal distribution file sizes are drawn from, and the largest size allowed
+SIZE_PROFILES: dict[str, tuple[float, float, int]] = {
+    # Mostly documents and small images, median around 60 KB
+    "small": (11.0, 1.5, 64 * 1024 ** 2),
+    # A typical Downloads folder, median around 160 KB with a long tail of large files
+    "mixed": (12.0, 2.0, 2 * 1024 ** 3),
+    # Videos, disk images and archives, median around 25 MB
+    "large": (17.0, 1.5, 16 * 1024 ** 3),
+}
+
+# Relative weights of the extensions, "" is a file without an extension
+EXTENSION_MIXES: dict[str, dict[str, int]] = {
+    "downloads": {
+        "pdf": 20, "jpg": 15, "png": 10, "zip": 10, "exe": 6, "msi": 2, "dmg": 2, "docx": 8, "xlsx": 4,
+        "mp4": 4, "mp3": 3, "txt": 6, "csv": 4, "pptx": 2, "py": 1, "torrent": 1, "": 2,
+    },
+    "media": {"jpg": 30, "png": 15, "heic": 10, "mp4": 25, "mov": 10, "mp3": 8, "wav": 2},
+    "documents": {"pdf": 40, "docx": 20, "xlsx": 10, "pptx": 5, "txt": 15, "csv": 10},
+    "installers": {"exe": 50, "msi": 20, "dmg": 15, "pkg": 10, "zip": 5},
+}
+
+NAMES = ["setup", "report", "photo", "windows_update", "installer", "invoice", "song", "notes", "IMG", "scan",
+         "statement", "resume", "presentation", "backup", "download"]
+
+# Subfolders per folder, so deep trees spread out instead of forming one long chain
+FOLDER_FANOUT = 4
+
+HEADER_SIZE = 64
+
+# Files at most this large are written out in full rather than extended with truncate
+DENSE_LIMIT = HEADER_SIZE
+
+
+class TreeSpec(NamedTuple):
+    files: int = 10_000
+    sizes: str = "mixed"
+    extensions: str = "downloads"
+    # 0 puts every file directly inside the root
+    depth: int = 1
+    # Share of files that are "name (1).ext" copies of an earlier file
+    duplicate_rate: float = 0.05
+    seed: int = 0
+
+    @property
+    def label(self) -> str:
+        return f"{self.files}f-{self.sizes}-{self.extensions}-d{self.depth}-dup{self.duplicate_rate:g}-s{self.seed}"
+
+
+DEFAULT_SPEC = TreeSpec()
+
+
+class TreeManifest(NamedTuple):
+    root: str
+    files: int
+    total_size: int
+    # Paths of the "(1)" copies, which have the same contents as their original
+    duplicates: list[str]
+
+
+def build_tree(root: str, spec: TreeSpec) -> TreeManifest:
+    """
+    Writes the files described by spec into root, which is created if needed
+    """
+    rng = random.Random(spec.seed)
+    mu, sigma, max_size = SIZE_PROFILES[spec.sizes]
+    mix = EXTENSION_MIXES[spec.extensions]
+    extensions, weights = list(mix), list(mix.values())
+    folders = _folders(root, spec.depth, spec.files)
+    now = time.time()
+
+    # (path, size, header) of the files that are not duplicates, for the copies to pick from
+    originals: list[tuple[str, int, bytes]] = list()
+    duplicates: list[str] = list()
+    paths: set[str] = set()
+    total_size = 0
+
+    for i in range(spec.files):
+        folder = folders[i % len(folders)]
+        if originals and rng.random() < spec.duplicate_rate:
+            original_path, size, header = rng.choice(originals)
+            # Next to the original, as browsers name a second download of the same file
+            stem, extension = os.path.splitext(original_path)
+            number = 1
+            while f"{stem} ({number}){extension}" in paths:
+                number += 1
+            path = f"{stem} ({number}){extension}"
+            duplicates.append(path)
+        else:
+            extension = rng.choices(extensions, weights)[0]
+            name = f"{rng.choice(NAMES)} {i}" + (f".{extension}" if extension else "")
+            path = os.path.join(folder, name)
+            size = min(int(rng.lognormvariate(mu, sigma)), max_size)
+            header = rng.randbytes(HEADER_SIZE)
+            originals.append((path, size, header))
+
+        paths.add(path)
+        _write_file(path, size, header)
+        modified = now - rng.randrange(3 * 365 * 24 * 3600)
+        os.utime(path, (modified + rng.randrange(30 * 24 * 3600), modified))
+        total_size += size
+
+    return TreeManifest(root, spec.files, total_size, duplicates)
+
+
+def _folders(root: str, depth: int, file_count: int) -> list[str]:
+    """
+    Creates and returns the folders files are spread over: root and FOLDER_FANOUT subfolders per folder
+    down to depth levels, capped so that every folder gets a few files
+    """
+    folders = [root]
+    level = [root]
+    for _ in range(depth):
+        if len(folders) * FOLDER_FANOUT > max(1, file_count // 8):
+            break
+        level = [os.path.join(parent, f"folder {j}") for parent in level for j in range(FOLDER_FANOUT)]
+        folders.extend(level)
+
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+    return folders
+
+
+def _write_file(path: str, size: int, header: bytes) -> None:
+    with open(path, "wb") as stream:
+        stream.write(header[:size])
+        if size > DENSE_LIMIT:
+            stream.truncate(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dest", help="folder to create the tree in")
+    parser.add_argument("--files", type=int, default=DEFAULT_SPEC.files)
+    parser.add_argument("--sizes", choices=SIZE_PROFILES, default=DEFAULT_SPEC.sizes)
+    parser.add_argument("--extensions", choices=EXTENSION_MIXES, default=DEFAULT_SPEC.extensions)
+    parser.add_argument("--depth", type=int, default=DEFAULT_SPEC.depth)
+    parser.add_argument("--duplicate-rate", type=float, default=DEFAULT_SPEC.duplicate_rate)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SPEC.seed)
+    args = parser.parse_args()
+
+    spec = TreeSpec(args.files, args.sizes, args.extensions, args.depth, args.duplicate_rate, args.seed)
+    start = time.perf_counter()
+    manifest = build_tree(args.dest, spec)
+    print(f"{manifest.files} files ({manifest.total_size / 1024 ** 3:.2f} GB, {len(manifest.duplicates)} duplicates) "
+          f"written to {manifest.root} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
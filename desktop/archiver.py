@@ -0,0 +1,539 @@
+"""
+Description:
+This file contains the archive engine behind "Export Downloads Folder as Zip" and the
+command line archive command (backups are snapshots, see backup.py). Members are read
+in order and cut into fixed-size chunks, which are deflated on a thread pool the same
+way pigz does it: every chunk is compressed with the end of the previous chunk as its
+dictionary and ends on a byte boundary, so the compressed chunks of a file simply
+concatenate into one deflate stream. Compressed chunks are written back in order, so
+the result is an ordinary zip that any tool can open.
+
+Files whose contents are already compressed (photos, videos, archives) gain nothing
+from deflating and are stored as they are.
+
+The archive is written to <name>.part and only renamed once it is complete. Every few
+hundred MB the members written so far are recorded in a <name>.checkpoint sidecar,
+after the data they point to has been flushed to disk. A job that was cancelled, crashed
+or lost power is continued from its last checkpoint by running it again: the part file is
+cut back to the checkpoint, its central directory is rebuilt from the sidecar and only
+the remaining files are archived.
+
+Authors: Adam Lahouar, Nolan Donovan, Evan Donohoe
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Collection, Iterable, Optional, Union
+
+import instrumentation
+from file import File
+
+# Size of the pieces files are cut into, each one is a separate compression job
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+# Deflate can refer back at most 32 KB, so that much of the previous chunk primes the next one
+DICTIONARY_SIZE = 32 * 1024
+
+DEFAULT_ARCHIVE_WORKERS = os.cpu_count() or 1
+
+# Chunks read ahead of the one being written, per worker, which bounds memory use
+CHUNKS_IN_FLIGHT_PER_WORKER = 4
+
+PART_SUFFIX = ".part"
+CHECKPOINT_SUFFIX = ".checkpoint"
+CHECKPOINT_VERSION = 1
+
+# A checkpoint is taken at the first member boundary after this many bytes or seconds since the last one
+CHECKPOINT_BYTES = 256 * 1024 * 1024
+CHECKPOINT_INTERVAL = 30.0
+
+# ZipInfo attributes recorded in checkpoints, enough to rebuild the central directory entry of a member
+CHECKPOINT_ATTRIBUTES = ["filename", "date_time", "compress_type", "CRC", "compress_size", "file_size",
+                         "header_offset", "external_attr", "create_system", "create_version", "extract_version",
+                         "flag_bits"]
+
+# Size of the reads when verifying an archive
+VERIFY_CHUNK_SIZE = 1024 * 1024
+
+# Zip records, see the APPNOTE of the zip format. Fields that overflow 32 (or 16) bits are set to all ones
+# and the actual values go into a zip64 extra field or the zip64 end of central directory
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+CENTRAL_DIRECTORY_ENTRY = struct.Struct("<4s6H3L5H2L")
+END_OF_CENTRAL_DIRECTORY = struct.Struct("<4s4H2LH")
+ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4sQ2H2L4Q")
+ZIP64_END_LOCATOR = struct.Struct("<4sLQL")
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_VERSION = 45
+DEFLATED_VERSION = 20
+STORED_VERSION = 10
+# Flag bit telling that the member name is UTF-8 rather than code page 437
+UTF8_FLAG = 0x800
+
+
+@instrumentation.traced("archive")
+def archive_files(files: Iterable[File], archive_name: str, stored_extensions: Collection[str] = (),
+                  max_workers: int = DEFAULT_ARCHIVE_WORKERS,
+                  on_progress: Optional[Callable[[int, int], None]] = None,
+                  is_cancelled: Optional[Callable[[], bool]] = None, resume: bool = True) -> list[str]:
+    """
+    Writes the given files to a zip at archive_name, named relative to the folder they have in common
+    Files whose extension (lowercase) is in stored_extensions are stored without compression
+    on_progress is called with the bytes archived so far and the total after every chunk
+    If resume is set and an unfinished archive of the same name has a checkpoint, the files it already
+    holds are kept and not archived again. Otherwise any unfinished archive of that name is started over
+    Returns the paths of the files that could not be read
+    If the job is cancelled, the archive is left unfinished (see unfinished_archives)
+    """
+    files = list(files)
+    root = _common_root(files)
+    total_bytes = sum(file.size for file in files)
+    skipped: list[str] = list()
+
+    part_name = archive_name + PART_SUFFIX
+    checkpoint = _Checkpoint(archive_name + CHECKPOINT_SUFFIX)
+    restored = checkpoint.load() if resume and os.path.exists(part_name) else None
+
+    if restored is None:
+        checkpoint.start()
+        stream = open(part_name, "wb")
+        done_members: list[zipfile.ZipInfo] = list()
+    else:
+        done_members, end_offset = restored
+        # Members recorded after the last commit, or a line cut short, must not be read as part of a later commit
+        checkpoint.rewrite(done_members, end_offset)
+        stream = open(part_name, "r+b")
+        # Anything after the checkpoint may be a partly written member
+        stream.truncate(end_offset)
+        stream.seek(end_offset)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="archiver") as executor:
+            writer = _MemberWriter(stream, done_members, total_bytes, on_progress, checkpoint)
+            pending: deque[tuple[str, Union[Future, bytes, zipfile.ZipInfo, None]]] = deque()
+            max_pending = max_workers * CHUNKS_IN_FLIGHT_PER_WORKER
+
+            for file in files:
+                if is_cancelled and is_cancelled():
+                    break
+
+                arcname = os.path.relpath(file.path, root)
+                if arcname in writer.names:
+                    writer.add_progress(file.size)
+                    continue
+
+                compress = file.type.lower() not in stored_extensions
+                try:
+                    zinfo = zipfile.ZipInfo.from_file(file.path, arcname, strict_timestamps=False)
+                    source = open(file.path, "rb")
+                except OSError:
+                    skipped.append(file.path)
+                    continue
+
+                zinfo.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+                zinfo.file_size = file.size
+                pending.append(("start", zinfo))
+
+                # A member cut short by a cancel is dropped rather than recorded with part of its data
+                end = "end"
+                with source:
+                    for chunk, dictionary, last in _read_chunks(source):
+                        if is_cancelled and is_cancelled():
+                            end = "abort"
+                            break
+                        pending.append(("chunk", executor.submit(_deflate, chunk, dictionary, last) if compress
+                                        else chunk))
+                        pending.append(("raw", chunk))
+                        while len(pending) > max_pending:
+                            writer.handle(*pending.popleft())
+
+                pending.append((end, None))
+
+            while pending:
+                writer.handle(*pending.popleft())
+
+            if is_cancelled and is_cancelled():
+                writer.commit()
+            writer.finish()
+    finally:
+        stream.close()
+
+    if not (is_cancelled and is_cancelled()):
+        os.replace(part_name, archive_name)
+        checkpoint.remove()
+
+    return skipped
+
+
+def unfinished_archives(directory: str) -> list[str]:
+    """
+    Returns the names of the archives in directory that were left unfinished and can be resumed
+    """
+    names: list[str] = list()
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(CHECKPOINT_SUFFIX):
+            archive_name = os.path.join(directory, filename[:-len(CHECKPOINT_SUFFIX)])
+            if os.path.exists(archive_name + PART_SUFFIX):
+                names.append(archive_name)
+    return names
+
+
+def discard_unfinished_archive(archive_name: str) -> None:
+    for path in (archive_name + PART_SUFFIX, archive_name + CHECKPOINT_SUFFIX):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@instrumentation.traced("archive.verify")
+def verify_archive(archive_name: str, max_workers: int = DEFAULT_ARCHIVE_WORKERS,
+                   on_progress: Optional[Callable[[int, int], None]] = None,
+                   is_cancelled: Optional[Callable[[], bool]] = None) -> list[str]:
+    """
+    Reads every member of the archive back and checks it against its CRC-32, on a thread pool
+    Each thread reads through its own handle on the archive, so members are decompressed in parallel
+    Returns the names of the members that are damaged or cannot be read
+    """
+    with zipfile.ZipFile(archive_name) as archive:
+        # Largest first, so one big member does not end up alone at the end
+        members = sorted(archive.infolist(), key=lambda zinfo: zinfo.file_size, reverse=True)
+    total_bytes = sum(zinfo.file_size for zinfo in members)
+
+    local = threading.local()
+    handles: list[zipfile.ZipFile] = list()
+    lock = threading.Lock()
+    done_bytes = 0
+
+    def verify(zinfo: zipfile.ZipInfo) -> bool:
+        nonlocal done_bytes
+        if is_cancelled and is_cancelled():
+            return True
+
+        handle = getattr(local, "archive", None)
+        if handle is None:
+            handle = local.archive = zipfile.ZipFile(archive_name)
+            with lock:
+                handles.append(handle)
+
+        try:
+            with handle.open(zinfo) as member:
+                while member.read(VERIFY_CHUNK_SIZE):
+                    pass
+            intact = True
+        except (zipfile.BadZipFile, OSError, EOFError, zlib.error):
+            intact = False
+
+        with lock:
+            done_bytes += zinfo.file_size
+            if on_progress:
+                on_progress(done_bytes, total_bytes)
+        return intact
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="verifier") as executor:
+            results = list(executor.map(verify, members))
+    finally:
+        for handle in handles:
+            handle.close()
+
+    return [zinfo.filename for zinfo, intact in zip(members, results) if not intact]
+
+
+def _common_root(files: list[File]) -> str:
+    # Computed once from the folders, so a single file is still named relative to its folder
+    if not files:
+        return ""
+    return os.path.commonpath({file.directory for file in files})
+
+
+def _read_chunks(stream: BinaryIO) -> Iterable[tuple[bytes, bytes, bool]]:
+    """
+    Yields each chunk of the stream with the bytes preceding it (up to DICTIONARY_SIZE) and whether it is the last one
+    An empty stream yields a single empty chunk
+    """
+    dictionary = b""
+    chunk = stream.read(ARCHIVE_CHUNK_SIZE)
+    while True:
+        next_chunk = stream.read(ARCHIVE_CHUNK_SIZE)
+        yield chunk, dictionary, not next_chunk
+        if not next_chunk:
+            return
+        dictionary = chunk[-DICTIONARY_SIZE:]
+        chunk = next_chunk
+
+
+def _deflate(chunk: bytes, dictionary: bytes, last: bool) -> bytes:
+    instrumentation.count("bytes_compressed", len(chunk))
+    # Raw deflate (negative window bits), as zip members have no zlib header
+    if dictionary:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(chunk) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class _Checkpoint:
+    """
+    Sidecar file recording the members of an unfinished archive
+    It is appended to while archiving: a line per finished member, then a commit line with the offset the
+    part file is valid up to. Members after the last commit line are ignored when loading, and are dropped
+    by rewriting the sidecar before an archive is resumed
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pending: list[str] = list()
+
+    def start(self) -> None:
+        with open(self.path, "w", encoding="utf-8") as stream:
+            stream.write(json.dumps({"version": CHECKPOINT_VERSION}) + "\n")
+        self._pending.clear()
+
+    def load(self) -> Optional[tuple[list[zipfile.ZipInfo], int]]:
+        """
+        Returns the committed members and the offset they end at, or None if there is no usable checkpoint
+        """
+        committed: Optional[tuple[list[zipfile.ZipInfo], int]] = None
+        try:
+            with open(self.path, encoding="utf-8") as stream:
+                if json.loads(stream.readline()).get("version") != CHECKPOINT_VERSION:
+                    return None
+
+                members: list[zipfile.ZipInfo] = list()
+                for line in stream:
+                    record = json.loads(line)
+                    if "end_offset" in record:
+                        committed = (list(members), record["end_offset"])
+                    else:
+                        members.append(_zinfo_from_record(record))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            # A line cut short by a crash ends the usable part of the checkpoint
+            pass
+
+        return committed
+
+    def rewrite(self, members: list[zipfile.ZipInfo], end_offset: int) -> None:
+        """
+        Replaces the sidecar with one holding exactly the given committed members, without ever leaving
+        a partly written sidecar in its place
+        """
+        lines = [json.dumps({"version": CHECKPOINT_VERSION})]
+        lines += [json.dumps(_zinfo_to_record(zinfo)) for zinfo in members]
+        lines.append(json.dumps({"end_offset": end_offset}))
+
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as stream:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+            os.fsync(stream.fileno())
+        os.replace(temporary_path, self.path)
+        self._pending.clear()
+
+    def add(self, zinfo: zipfile.ZipInfo) -> None:
+        self._pending.append(json.dumps(_zinfo_to_record(zinfo)))
+
+    def commit(self, archive_stream: BinaryIO, end_offset: int) -> None:
+        # The data must be on disk before the checkpoint says it is there
+        archive_stream.flush()
+        os.fsync(archive_stream.fileno())
+
+        lines = self._pending + [json.dumps({"end_offset": end_offset})]
+        with open(self.path, "a", encoding="utf-8") as stream:
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+            os.fsync(stream.fileno())
+        self._pending.clear()
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _zinfo_to_record(zinfo: zipfile.ZipInfo) -> dict[str, Any]:
+    record = {attribute: getattr(zinfo, attribute) for attribute in CHECKPOINT_ATTRIBUTES}
+    record["extra"] = zinfo.extra.hex()
+    return record
+
+
+def _zinfo_from_record(record: dict[str, Any]) -> zipfile.ZipInfo:
+    zinfo = zipfile.ZipInfo(record["filename"], tuple(record["date_time"]))
+    for attribute in CHECKPOINT_ATTRIBUTES[2:]:
+        setattr(zinfo, attribute, record[attribute])
+    zinfo.extra = bytes.fromhex(record["extra"])
+    return zinfo
+
+
+class _MemberWriter:
+    """
+    Writes already compressed members to the part file, the same way ZipFile.open(name, "w") does: a local
+    header is written first and rewritten with the CRC and sizes once the data is known. The records are
+    written here rather than through ZipFile, whose writing internals differ between Python versions
+    Finished members are recorded in the checkpoint, which is committed every CHECKPOINT_BYTES or CHECKPOINT_INTERVAL
+    """
+
+    def __init__(self, stream: BinaryIO, members: list[zipfile.ZipInfo], total_bytes: int,
+                 on_progress: Optional[Callable[[int, int], None]], checkpoint: _Checkpoint):
+        self._stream = stream
+        self._members = list(members)
+        self.names: set[str] = {zinfo.filename for zinfo in members}
+        self._total_bytes = total_bytes
+        self._on_progress = on_progress
+        self._written_bytes = 0
+
+        # Where the last finished member ends, the next member or the central directory goes there
+        self._end_offset = stream.tell()
+        self._checkpoint = checkpoint
+        self._checkpoint_offset = self._end_offset
+        self._checkpoint_time = time.monotonic()
+
+        self._zinfo: Optional[zipfile.ZipInfo] = None
+        self._zip64 = False
+
+    def add_progress(self, size: int) -> None:
+        self._written_bytes += size
+        if self._on_progress:
+            self._on_progress(self._written_bytes, self._total_bytes)
+
+    def handle(self, kind: str, value: Union[Future, bytes, zipfile.ZipInfo, None]) -> None:
+        if kind == "start":
+            self._start(value)
+        elif kind == "chunk":
+            data = value.result() if isinstance(value, Future) else value
+            self._stream.write(data)
+            self._zinfo.compress_size += len(data)
+        elif kind == "raw":
+            self._zinfo.CRC = zlib.crc32(value, self._zinfo.CRC)
+            self._zinfo.file_size += len(value)
+            self.add_progress(len(value))
+        elif kind == "end":
+            self._end()
+        else:
+            # Cancelled part way: the member is left out, its data is overwritten or cut off later
+            self._zinfo = None
+
+    def commit(self) -> None:
+        self._checkpoint.commit(self._stream, self._end_offset)
+        self._checkpoint_offset = self._end_offset
+        self._checkpoint_time = time.monotonic()
+
+    def finish(self) -> None:
+        """
+        Writes the central directory of the finished members after the last of them
+        """
+        stream = self._stream
+        stream.seek(self._end_offset)
+        stream.write(b"".join(_central_directory_entry(zinfo) for zinfo in self._members))
+        stream.write(_end_of_central_directory(len(self._members), stream.tell() - self._end_offset,
+                                               self._end_offset))
+        # Whatever a dropped member left behind must not follow the end record
+        stream.truncate()
+
+    def _start(self, zinfo: zipfile.ZipInfo) -> None:
+        # Decided up front because the header is rewritten in place and must keep its length
+        self._zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        zinfo.file_size = 0
+        zinfo.compress_size = 0
+        zinfo.CRC = 0
+        zinfo.header_offset = self._end_offset
+        zinfo.flag_bits = _encode_name(zinfo.filename)[1]
+        zinfo.extract_version = max(
+            ZIP64_VERSION if self._zip64 else 0,
+            DEFLATED_VERSION if zinfo.compress_type == zipfile.ZIP_DEFLATED else STORED_VERSION,
+        )
+        zinfo.create_version = max(zinfo.create_version, zinfo.extract_version)
+
+        self._stream.seek(zinfo.header_offset)
+        self._stream.write(_local_header(zinfo, self._zip64))
+        self._zinfo = zinfo
+
+    def _end(self) -> None:
+        stream, zinfo = self._stream, self._zinfo
+        if not self._zip64 and max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+            # The file grew past the limit while it was read, its header has no room for the sizes
+            raise zipfile.LargeZipFile(f"{zinfo.filename} grew too large while it was archived")
+
+        end = stream.tell()
+        stream.seek(zinfo.header_offset)
+        stream.write(_local_header(zinfo, self._zip64))
+        stream.seek(end)
+
+        self._members.append(zinfo)
+        self.names.add(zinfo.filename)
+        self._end_offset = end
+        self._zinfo = None
+
+        self._checkpoint.add(zinfo)
+        if end - self._checkpoint_offset >= CHECKPOINT_BYTES \
+                or time.monotonic() - self._checkpoint_time >= CHECKPOINT_INTERVAL:
+            self.commit()
+
+
+def _encode_name(filename: str) -> tuple[bytes, int]:
+    # The name and its flag bits, names that are not ASCII are marked as UTF-8
+    try:
+        return filename.encode("ascii"), 0
+    except UnicodeEncodeError:
+        return filename.encode("utf-8"), UTF8_FLAG
+
+
+def _dos_date_time(date_time: tuple[int, ...]) -> tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    return (year - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+
+def _local_header(zinfo: zipfile.ZipInfo, zip64: bool) -> bytes:
+    name, _ = _encode_name(zinfo.filename)
+    dos_date, dos_time = _dos_date_time(zinfo.date_time)
+    extra = zinfo.extra
+    if zip64:
+        # The local zip64 field always holds both sizes
+        extra = struct.pack("<2H2Q", ZIP64_EXTRA_ID, 16, zinfo.file_size, zinfo.compress_size) + extra
+        compress_size = file_size = 0xFFFFFFFF
+    else:
+        compress_size, file_size = zinfo.compress_size, zinfo.file_size
+    return LOCAL_HEADER.pack(b"PK\x03\x04", zinfo.extract_version, zinfo.flag_bits, zinfo.compress_type,
+                             dos_time, dos_date, zinfo.CRC, compress_size, file_size, len(name),
+                             len(extra)) + name + extra
+
+
+def _central_directory_entry(zinfo: zipfile.ZipInfo) -> bytes:
+    name, _ = _encode_name(zinfo.filename)
+    dos_date, dos_time = _dos_date_time(zinfo.date_time)
+
+    # Only the values that overflow go into the zip64 field, in this order
+    zip64_values = [value for value in (zinfo.file_size, zinfo.compress_size, zinfo.header_offset)
+                    if value >= 0xFFFFFFFF]
+    extra = zinfo.extra
+    if zip64_values:
+        extra = struct.pack(f"<2H{len(zip64_values)}Q", ZIP64_EXTRA_ID, 8 * len(zip64_values),
+                            *zip64_values) + extra
+    file_size, compress_size, header_offset = (min(value, 0xFFFFFFFF) for value in
+                                               (zinfo.file_size, zinfo.compress_size, zinfo.header_offset))
+    extract_version = max(zinfo.extract_version, ZIP64_VERSION if zip64_values else 0)
+    create_version = max(zinfo.create_version, extract_version)
+
+    return CENTRAL_DIRECTORY_ENTRY.pack(b"PK\x01\x02", zinfo.create_system << 8 | create_version,
+                                        extract_version, zinfo.flag_bits, zinfo.compress_type, dos_time,
+                                        dos_date, zinfo.CRC, compress_size, file_size, len(name), len(extra), 0,
+                                        0, 0, zinfo.external_attr, header_offset) + name + extra
+
+
+def _end_of_central_directory(count: int, size: int, offset: int) -> bytes:
+    record = b""
+    if count >= 0xFFFF or size >= 0xFFFFFFFF or offset >= 0xFFFFFFFF:
+        # The zip64 record follows the central directory, and the locator tells readers where it is
+        zip64_offset = offset + size
+        record = ZIP64_END_OF_CENTRAL_DIRECTORY.pack(b"PK\x06\x06", ZIP64_END_OF_CENTRAL_DIRECTORY.size - 12,
+                                                     ZIP64_VERSION, ZIP64_VERSION, 0, 0, count, count, size, offset)
+        record += ZIP64_END_LOCATOR.pack(b"PK\x06\x07", 0, zip64_offset, 1)
+    return record + END_OF_CENTRAL_DIRECTORY.pack(b"PK\x05\x06", 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                                                  min(size, 0xFFFFFFFF), min(offset, 0xFFFFFFFF), 0)
@@ -0,0 +1,298 @@
+"""
+Description:
+This file contains the BackupStore class, an incremental, content-addressed backup
+store kept in the user's data directory. Files are cut into fixed-size chunks that are
+stored once under the hash of their contents, so a renamed or duplicated file costs no
+extra space. A snapshot is a list of the files of a folder with the chunks making up each
+one. A new snapshot only reads the files whose size or modification time differ from the
+previous snapshot of the same folder, and only writes the chunks the store does not have
+yet, so backing up a mostly unchanged folder costs one stat call per file.
+
+Layout of the store:
+    chunks/<first 2 hex digits>/<hash>    one chunk, zlib-compressed ("Z" prefix) or raw ("R" prefix)
+    snapshots/<id>.snapshot                a JSON summary line, then one JSON line per file
+
+Chunks are never deleted, even when no snapshot refers to them anymore.
+
+Authors: Evan Donohoe, Nolan Donovan, Adam Lahouar
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Collection, Iterable, NamedTuple, Optional
+
+import instrumentation
+from file import File
+from paths import get_data_dir
+
+BACKUP_DIRNAME = "backups"
+SNAPSHOT_SUFFIX = ".snapshot"
+
+# Files are stored in chunks of this size, so an unchanged chunk of a changed file is not written again
+BACKUP_CHUNK_SIZE = 4 * 1024 * 1024
+
+DEFAULT_BACKUP_WORKERS = min(8, os.cpu_count() or 1)
+
+COMPRESSED_CHUNK = b"Z"
+RAW_CHUNK = b"R"
+
+# (path relative to the snapshot root, size, modification time in ns, chunk hashes)
+SnapshotEntry = tuple[str, int, int, list[str]]
+
+
+class SnapshotInfo(NamedTuple):
+    id: str
+    root: str
+    created: float
+    file_count: int
+    total_size: int
+
+
+class BackupResult(NamedTuple):
+    # None if the backup was cancelled
+    snapshot: Optional[SnapshotInfo]
+    # Paths of the files that could not be read
+    skipped: list[str]
+    # Bytes of new chunks written to the store, before compression
+    new_bytes: int
+
+
+class BackupStore:
+    """
+    Initializes the store at the given directory (backups/ in the user data directory by default)
+    """
+
+    def __init__(self, store_dir: str = None):
+        self.store_dir: str = store_dir or os.path.join(get_data_dir(), BACKUP_DIRNAME)
+        self._chunks_dir = os.path.join(self.store_dir, "chunks")
+        self._snapshots_dir = os.path.join(self.store_dir, "snapshots")
+
+        os.makedirs(self._chunks_dir, exist_ok=True)
+        os.makedirs(self._snapshots_dir, exist_ok=True)
+
+    def list_snapshots(self, root: str = None) -> list[SnapshotInfo]:
+        """
+        Returns the snapshots in the store, newest first, optionally only those of the given folder
+        Only the summary line of each snapshot is read
+        """
+        snapshots: list[SnapshotInfo] = list()
+        for filename in os.listdir(self._snapshots_dir):
+            if not filename.endswith(SNAPSHOT_SUFFIX):
+                continue
+            try:
+                with open(os.path.join(self._snapshots_dir, filename), encoding="utf-8") as stream:
+                    snapshot = SnapshotInfo(**json.loads(stream.readline()))
+            except (OSError, ValueError, TypeError):
+                continue
+            if root is None or snapshot.root == os.path.abspath(root):
+                snapshots.append(snapshot)
+
+        snapshots.sort(key=lambda snapshot: snapshot.created, reverse=True)
+        return snapshots
+
+    @instrumentation.traced("backup")
+    def backup(self, files: Iterable[File], root: str, stored_extensions: Collection[str] = (),
+               max_workers: int = DEFAULT_BACKUP_WORKERS,
+               on_progress: Optional[Callable[[int, int], None]] = None,
+               is_cancelled: Optional[Callable[[], bool]] = None) -> BackupResult:
+        """
+        Takes a snapshot of the given files, which are named relative to root
+        Chunks of files whose extension (lowercase) is in stored_extensions are not compressed
+        on_progress is called with the bytes backed up so far and the total after every file
+        """
+        root = os.path.abspath(root)
+        files = list(files)
+        total_bytes = sum(file.size for file in files)
+
+        previous_snapshots = self.list_snapshots(root)
+        previous_entries = {
+            entry[0]: entry for entry in (self._read_entries(previous_snapshots[0].id) if previous_snapshots else ())
+        }
+
+        progress_lock = threading.Lock()
+        done_bytes = 0
+
+        def back_up(file: File) -> tuple[Optional[SnapshotEntry], int]:
+            nonlocal done_bytes
+            if is_cancelled and is_cancelled():
+                return None, 0
+
+            relative_path = os.path.relpath(file.path, root)
+            result = self._back_up_file(file, relative_path, previous_entries.get(relative_path),
+                                        file.type.lower() not in stored_extensions)
+
+            if on_progress:
+                with progress_lock:
+                    done_bytes += file.size
+                    on_progress(done_bytes, total_bytes)
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="backup") as executor:
+            results = list(executor.map(back_up, files))
+
+        if is_cancelled and is_cancelled():
+            # The chunks written so far are kept, so the next backup does not have to write them again
+            return BackupResult(None, list(), sum(new_bytes for _, new_bytes in results))
+
+        entries = [entry for entry, _ in results if entry is not None]
+        skipped = [file.path for file, (entry, _) in zip(files, results) if entry is None]
+        snapshot = SnapshotInfo(
+            id=datetime.now().strftime("%Y%m%d-%H%M%S-%f"),
+            root=root,
+            created=time.time(),
+            file_count=len(entries),
+            total_size=sum(entry[1] for entry in entries),
+        )
+        self._write_snapshot(snapshot, entries)
+
+        return BackupResult(snapshot, skipped, sum(new_bytes for _, new_bytes in results))
+
+    @instrumentation.traced("backup.restore")
+    def restore(self, snapshot_id: str, destination: str, max_workers: int = DEFAULT_BACKUP_WORKERS,
+                on_progress: Optional[Callable[[int, int], None]] = None,
+                is_cancelled: Optional[Callable[[], bool]] = None) -> list[str]:
+        """
+        Writes the files of the given snapshot into destination, replacing files with the same name
+        Files are restored in parallel, each one is written to a temporary name and renamed once complete
+        Returns the relative paths of the files that could not be restored
+        """
+        destination = os.path.abspath(destination)
+        entries = self._read_entries(snapshot_id)
+        total_bytes = sum(entry[1] for entry in entries)
+
+        progress_lock = threading.Lock()
+        done_bytes = 0
+
+        def restore_entry(entry: SnapshotEntry) -> bool:
+            nonlocal done_bytes
+            if is_cancelled and is_cancelled():
+                return True
+
+            restored = self._restore_file(entry, destination)
+
+            if on_progress:
+                with progress_lock:
+                    done_bytes += entry[1]
+                    on_progress(done_bytes, total_bytes)
+            return restored
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="restore") as executor:
+            results = list(executor.map(restore_entry, entries))
+
+        return [entry[0] for entry, restored in zip(entries, results) if not restored]
+
+    def _back_up_file(self, file: File, relative_path: str, previous_entry: Optional[SnapshotEntry],
+                      compress: bool) -> tuple[Optional[SnapshotEntry], int]:
+        """
+        Returns the snapshot entry of the file and the bytes of new chunks written for it
+        The entry is None if the file could not be read
+        """
+        try:
+            stat_result = os.stat(file.path)
+
+            # Same size and modification time as in the previous snapshot, so the file is not read at all
+            if previous_entry is not None and previous_entry[1:3] == (stat_result.st_size, stat_result.st_mtime_ns):
+                return (relative_path, stat_result.st_size, stat_result.st_mtime_ns, previous_entry[3]), 0
+
+            chunk_hashes: list[str] = list()
+            new_bytes = 0
+            size = 0
+            with open(file.path, "rb") as stream:
+                while True:
+                    chunk = stream.read(BACKUP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    instrumentation.count("bytes_hashed", len(chunk))
+                    chunk_hash = hashlib.blake2b(chunk, digest_size=32).hexdigest()
+                    if self._write_chunk(chunk_hash, chunk, compress):
+                        new_bytes += len(chunk)
+                    chunk_hashes.append(chunk_hash)
+                    size += len(chunk)
+        except OSError:
+            return None, 0
+
+        # The size read, in case the file changed since it was stat'ed
+        return (relative_path, size, stat_result.st_mtime_ns, chunk_hashes), new_bytes
+
+    def _chunk_path(self, chunk_hash: str) -> str:
+        return os.path.join(self._chunks_dir, chunk_hash[:2], chunk_hash)
+
+    def _write_chunk(self, chunk_hash: str, chunk: bytes, compress: bool) -> bool:
+        """
+        Stores the chunk unless the store already has it, returns whether it was written
+        """
+        path = self._chunk_path(chunk_hash)
+        if os.path.exists(path):
+            return False
+
+        data = RAW_CHUNK + chunk
+        if compress:
+            instrumentation.count("bytes_compressed", len(chunk))
+            compressed = zlib.compress(chunk, 1)
+            if len(compressed) < len(chunk):
+                data = COMPRESSED_CHUNK + compressed
+
+        # Written under a temporary name first, so a chunk file is always complete
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as stream:
+            stream.write(data)
+        os.replace(temporary_path, path)
+        return True
+
+    def _read_chunk(self, chunk_hash: str) -> bytes:
+        with open(self._chunk_path(chunk_hash), "rb") as stream:
+            data = stream.read()
+
+        chunk = zlib.decompress(data[1:]) if data[:1] == COMPRESSED_CHUNK else data[1:]
+        if hashlib.blake2b(chunk, digest_size=32).hexdigest() != chunk_hash:
+            raise ValueError(f"Chunk {chunk_hash} is corrupted")
+        return chunk
+
+    def _restore_file(self, entry: SnapshotEntry, destination: str) -> bool:
+        relative_path, _, mtime_ns, chunk_hashes = entry
+
+        # Never write outside of destination, whatever the snapshot says
+        path = os.path.normpath(os.path.join(destination, relative_path))
+        if os.path.commonpath([destination, path]) != destination:
+            return False
+
+        temporary_path = path + ".restoring"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temporary_path, "wb") as stream:
+                for chunk_hash in chunk_hashes:
+                    stream.write(self._read_chunk(chunk_hash))
+            os.replace(temporary_path, path)
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        except (OSError, ValueError, zlib.error):
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            return False
+
+        return True
+
+    def _snapshot_path(self, snapshot_id: str) -> str:
+        return os.path.join(self._snapshots_dir, snapshot_id + SNAPSHOT_SUFFIX)
+
+    def _read_entries(self, snapshot_id: str) -> list[SnapshotEntry]:
+        with open(self._snapshot_path(snapshot_id), encoding="utf-8") as stream:
+            stream.readline()
+            return [tuple(json.loads(line)) for line in stream]
+
+    def _write_snapshot(self, snapshot: SnapshotInfo, entries: list[SnapshotEntry]) -> None:
+        # Written under a temporary name first, so a snapshot only appears once it is complete
+        path = self._snapshot_path(snapshot.id)
+        with open(path + ".tmp", "w", encoding="utf-8") as stream:
+            stream.write(json.dumps(snapshot._asdict()) + "\n")
+            for entry in entries:
+                stream.write(json.dumps(entry) + "\n")
+        os.replace(path + ".tmp", path)
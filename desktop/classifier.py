@@ -0,0 +1,434 @@
+"""
+Description:
+This file contains the content sniffer that tells what a file really is from its first
+bytes rather than its name, so installers named "app-1.2.exe", images without an extension
+and archives renamed to .pdf are still identified and organized correctly.
+
+Reads are bounded: at most HEAD_SIZE bytes from the start of a file, plus the last 512
+bytes for disk images (whose signature is at the end) and one 16 byte read to tell MSI
+installers from other OLE files. Files are read in batches on a thread pool, and every
+result is cached in the user's cache directory under the file's (device, inode) along
+with its size and modification time. Classifying a folder again only reads the files
+that are new or changed since, each of the others costs a single stat call.
+
+A file's kind is a short name such as "pdf", "png", "msi" or "zip", or None if its
+contents were not recognized (plain text files, for example).
+
+Authors: Adam Lahouar, Nolan Donovan, Evan Donohoe
+"""
+
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+
+import instrumentation
+from file import File
+from paths import get_cache_dir
+
+CACHE_FILENAME = "classifier.sqlite3"
+
+# Bump whenever the sniffer learns new kinds or the table changes, so that cached results are computed again
+SCHEMA_VERSION = 2
+
+# Bytes read from the start of every file, enough for every signature below
+HEAD_SIZE = 4096
+
+# UDIF disk images (.dmg) end with a 512 byte "koly" trailer
+DMG_TRAILER_SIZE = 512
+
+# Reading a file costs little next to waiting on the disk, so more threads than cores help
+DEFAULT_CLASSIFY_WORKERS = 16
+
+# Files read per task on the thread pool
+CLASSIFY_BATCH_SIZE = 256
+# Keys per cache query, two parameters each stay within SQLite's limit of 999 parameters on older versions
+LOOKUP_CHUNK_SIZE = 400
+
+# Kinds of content that are installers whatever their name
+INSTALLER_KINDS = frozenset(["exe-installer", "msi", "dmg", "pkg"])
+
+# Category each kind is organized into (the folder names of functions.directory_dict), and the extensions
+# the kind can legitimately have. A file whose extension is one of them keeps the category of its extension,
+# e.g. a .docx is a zip file, but belongs with the documents
+KINDS: dict[str, tuple[str, frozenset[str]]] = {
+    kind: (category, frozenset(extensions.split()))
+    for kind, category, extensions in [
+        ("exe", "Executables", "exe dll sys scr com cpl ocx efi"),
+        ("exe-installer", "Executables", "exe"),
+        ("msi", "Executables", "msi msp"),
+        ("dmg", "Executables", "dmg img sparseimage"),
+        ("pkg", "Executables", "pkg mpkg xar xip"),
+        ("elf", "Executables", "so bin run appimage o"),
+        ("macho", "Executables", "dylib bundle so class"),
+        ("jar", "Executables", "jar war ear"),
+        ("apk", "Executables", "apk aab xapk"),
+        ("pdf", "Documents", "pdf ai"),
+        ("rtf", "Documents", "rtf doc"),
+        ("ole", "Documents", "doc dot xls xlt ppt pps pot msg pub vsd msi msp"),
+        ("docx", "Documents", "docx docm dotx dotm"),
+        ("odt", "Documents", "odt ott"),
+        ("epub", "Documents", "epub"),
+        ("ooxml", "Documents", "docx docm xlsx xlsm pptx ppsx pptm vsdx"),
+        ("xlsx", "Spreadsheets", "xlsx xlsm xltx xltm"),
+        ("ods", "Spreadsheets", "ods ots numbers"),
+        ("pptx", "Presentations", "pptx ppsx pptm potx"),
+        ("odp", "Presentations", "odp otp key"),
+        ("png", "Images", "png apng"),
+        ("jpeg", "Images", "jpg jpeg jpe jfif"),
+        ("gif", "Images", "gif"),
+        ("bmp", "Images", "bmp dib"),
+        ("tiff", "Images", "tif tiff dng nef cr2 arw"),
+        ("webp", "Images", "webp"),
+        ("heic", "Images", "heic heif avif"),
+        ("icns", "Images", "icns"),
+        ("psd", "Images", "psd psb"),
+        ("mp4", "Video", "mp4 m4v m4a m4b mov 3gp 3g2 f4v"),
+        ("mov", "Video", "mov qt mp4"),
+        ("avi", "Video", "avi"),
+        ("mkv", "Video", "mkv webm mka mk3d"),
+        ("flv", "Video", "flv"),
+        ("mpeg", "Video", "mpg mpeg vob m2v ts"),
+        ("asf", "Video", "wmv wma asf"),
+        ("mp3", "Audio", "mp3"),
+        ("m4a", "Audio", "m4a m4b m4r mp4"),
+        ("flac", "Audio", "flac"),
+        ("ogg", "Audio", "ogg oga ogv opus spx"),
+        ("wav", "Audio", "wav"),
+        ("aiff", "Audio", "aif aiff aifc"),
+        ("zip", "Archives", "zip jar apk xpi epub whl ipa cbz crx nupkg vsix kmz 3mf odt ods odp docx xlsx pptx "
+                            "pages numbers key"),
+        ("gzip", "Archives", "gz tgz svgz"),
+        ("bzip2", "Archives", "bz2 tbz2 tbz"),
+        ("xz", "Archives", "xz txz"),
+        ("zstd", "Archives", "zst tzst"),
+        ("7z", "Archives", "7z"),
+        ("rar", "Archives", "rar"),
+        ("tar", "Archives", "tar"),
+        ("ttf", "Fonts", "ttf otf dfont"),
+        ("otf", "Fonts", "otf ttf"),
+        ("ttc", "Fonts", "ttc otc"),
+        ("woff", "Fonts", "woff"),
+        ("woff2", "Fonts", "woff2"),
+    ]
+}
+
+# (offset, signature, kind) of the kinds recognized by a fixed signature alone, checked in order
+SIGNATURES: list[tuple[int, bytes, str]] = [
+    (0, b"%PDF-", "pdf"),
+    (0, b"\x89PNG\r\n\x1a\n", "png"),
+    (0, b"\xff\xd8\xff", "jpeg"),
+    (0, b"GIF87a", "gif"),
+    (0, b"GIF89a", "gif"),
+    (0, b"II*\x00", "tiff"),
+    (0, b"MM\x00*", "tiff"),
+    (0, b"icns", "icns"),
+    (0, b"8BPS", "psd"),
+    (0, b"{\\rtf", "rtf"),
+    (0, b"\x7fELF", "elf"),
+    (0, b"\xfe\xed\xfa\xce", "macho"),
+    (0, b"\xfe\xed\xfa\xcf", "macho"),
+    (0, b"\xce\xfa\xed\xfe", "macho"),
+    (0, b"\xcf\xfa\xed\xfe", "macho"),
+    (0, b"\xca\xfe\xba\xbe", "macho"),
+    (0, b"xar!", "pkg"),
+    (0, b"\x1a\x45\xdf\xa3", "mkv"),
+    (0, b"FLV\x01", "flv"),
+    (0, b"\x00\x00\x01\xba", "mpeg"),
+    (0, b"\x00\x00\x01\xb3", "mpeg"),
+    (0, b"\x30\x26\xb2\x75\x8e\x66\xcf\x11\xa6\xd9\x00\xaa\x00\x62\xce\x6c", "asf"),
+    (0, b"ID3", "mp3"),
+    (0, b"\xff\xfb", "mp3"),
+    (0, b"\xff\xf3", "mp3"),
+    (0, b"\xff\xf2", "mp3"),
+    (0, b"fLaC", "flac"),
+    (0, b"OggS", "ogg"),
+    (0, b"\x1f\x8b", "gzip"),
+    (0, b"BZh", "bzip2"),
+    (0, b"\xfd7zXZ\x00", "xz"),
+    (0, b"\x28\xb5\x2f\xfd", "zstd"),
+    (0, b"7z\xbc\xaf\x27\x1c", "7z"),
+    (0, b"Rar!\x1a\x07", "rar"),
+    (257, b"ustar", "tar"),
+    (0, b"\x00\x01\x00\x00\x00", "ttf"),
+    (0, b"OTTO", "otf"),
+    (0, b"ttcf", "ttc"),
+    (0, b"wOFF", "woff"),
+    (0, b"wOF2", "woff2"),
+]
+
+OLE_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+# Sector shifts of version 3 (512 byte sectors) and version 4 (4096 byte sectors) compound files
+OLE_SECTOR_SHIFTS = (9, 12)
+
+# Class ID of the root storage of Windows Installer packages, {000C1084-0000-0000-C000-000000000046}
+MSI_CLSID = bytes.fromhex("84100c0000000000c000000000000046")
+
+# Sections only found in the installers made by NSIS and by WiX (Burn bundles)
+INSTALLER_SECTIONS = frozenset([b".ndata", b".wixburn"])
+
+# ISO base media brands (ftyp) that are not plain MP4 video
+FTYP_BRANDS = {
+    b"heic": "heic", b"heix": "heic", b"hevc": "heic", b"mif1": "heic", b"msf1": "heic", b"avif": "heic",
+    b"qt  ": "mov", b"M4A ": "m4a", b"M4B ": "m4a",
+}
+
+RIFF_FORMATS = {b"WEBP": "webp", b"AVI ": "avi", b"WAVE": "wav"}
+
+# Mimetypes stored first in OpenDocument and EPUB files
+ZIP_MIMETYPES = {
+    b"application/vnd.oasis.opendocument.text": "odt",
+    b"application/vnd.oasis.opendocument.spreadsheet": "ods",
+    b"application/vnd.oasis.opendocument.presentation": "odp",
+    b"application/epub+zip": "epub",
+}
+
+
+def get_kind_category(kind: str) -> str:
+    return KINDS[kind][0]
+
+
+def content_category(kind: Optional[str], extension: str) -> Optional[str]:
+    """
+    Returns the category a file of the given kind belongs in if its extension does not fit its contents,
+    None if the extension does (or the contents were not recognized) and it decides the category
+    """
+    if kind is None or kind not in KINDS:
+        return None
+    category, extensions = KINDS[kind]
+    return None if extension.lower() in extensions else category
+
+
+def sniff(head: bytes) -> Optional[str]:
+    """
+    Returns the kind of a file starting with the given bytes, None if it is not recognized
+    OLE files are returned as "ole", classify_path tells MSI installers apart with one more read
+    """
+    if head.startswith(b"MZ"):
+        return _sniff_executable(head)
+    if head.startswith(b"PK\x03\x04"):
+        return _sniff_zip(head)
+    if head.startswith(OLE_SIGNATURE):
+        return "ole"
+    if head[4:8] == b"ftyp":
+        return FTYP_BRANDS.get(head[8:12], "mp4")
+    if head.startswith(b"RIFF"):
+        return RIFF_FORMATS.get(head[8:12])
+    if head.startswith(b"FORM") and head[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    # "BM" alone is too common at the start of text files, the reserved header fields must be zero too
+    if head.startswith(b"BM") and len(head) >= 14 and head[6:10] == b"\x00\x00\x00\x00":
+        return "bmp"
+
+    for offset, signature, kind in SIGNATURES:
+        if head.startswith(signature, offset):
+            return kind
+    return None
+
+
+def _sniff_executable(head: bytes) -> str:
+    # The PE header follows the DOS stub, at the offset stored at 0x3C
+    pe_offset = int.from_bytes(head[0x3C:0x40], "little")
+    if head[pe_offset:pe_offset + 4] != b"PE\x00\x00":
+        return "exe"
+
+    section_count = int.from_bytes(head[pe_offset + 6:pe_offset + 8], "little")
+    optional_header_size = int.from_bytes(head[pe_offset + 20:pe_offset + 22], "little")
+    sections = pe_offset + 24 + optional_header_size
+    for number in range(section_count):
+        name = head[sections + 40 * number:sections + 40 * number + 8].rstrip(b"\x00")
+        if name in INSTALLER_SECTIONS:
+            return "exe-installer"
+    return "exe"
+
+
+def _sniff_zip(head: bytes) -> str:
+    # The first member's local header: name length at 26, extra field length at 28, name at 30
+    name_length = int.from_bytes(head[26:28], "little")
+    extra_length = int.from_bytes(head[28:30], "little")
+    name = head[30:30 + name_length]
+
+    if name == b"mimetype":
+        data = head[30 + name_length + extra_length:]
+        for mimetype, kind in ZIP_MIMETYPES.items():
+            if data.startswith(mimetype):
+                return kind
+    if name == b"[Content_Types].xml" or name.startswith((b"_rels/", b"docProps/")):
+        # The names of the following members tell the Office application apart
+        for folder, kind in ((b"word/", "docx"), (b"xl/", "xlsx"), (b"ppt/", "pptx")):
+            if folder in head:
+                return kind
+        return "ooxml"
+    if name.startswith(b"META-INF/"):
+        return "jar"
+    if name == b"AndroidManifest.xml":
+        return "apk"
+    return "zip"
+
+
+def classify_path(path: str) -> Optional[str]:
+    """
+    Returns the kind of the file at path from a few bounded reads, None if it is not recognized or cannot be read
+    """
+    try:
+        with open(path, "rb", buffering=0) as stream:
+            head = stream.read(HEAD_SIZE)
+            kind = sniff(head)
+            if kind == "ole":
+                return "msi" if _ole_root_clsid(stream, head) == MSI_CLSID else "ole"
+            if kind is None and len(head) == HEAD_SIZE:
+                size = os.fstat(stream.fileno()).st_size
+                if size >= HEAD_SIZE + DMG_TRAILER_SIZE:
+                    stream.seek(size - DMG_TRAILER_SIZE)
+                    if stream.read(4) == b"koly":
+                        return "dmg"
+            return kind
+    except (OSError, ValueError, OverflowError):
+        return None
+
+
+def _ole_root_clsid(stream: BinaryIO, head: bytes) -> Optional[bytes]:
+    # The root directory entry starts the first directory sector and holds the class ID at 0x50
+    # The header is not trusted: a sector shift the format does not allow or an entry past the end is no MSI
+    sector_shift = int.from_bytes(head[0x1E:0x20], "little")
+    if sector_shift not in OLE_SECTOR_SHIFTS:
+        return None
+    first_directory_sector = int.from_bytes(head[0x30:0x34], "little")
+    offset = (first_directory_sector + 1) * (1 << sector_shift) + 0x50
+    if offset + 16 <= len(head):
+        return head[offset:offset + 16]
+    if offset + 16 > os.fstat(stream.fileno()).st_size:
+        return None
+    stream.seek(offset)
+    return stream.read(16)
+
+
+class ClassificationCache:
+    """
+    Initializes the cache stored at the given database path (the user cache directory by default)
+    Files are looked up by (device, inode), so renamed and moved files are still found, and a result
+    only counts while the file keeps the size and modification time it had when it was read
+    """
+
+    def __init__(self, database_path: str = None):
+        self.database_path: str = database_path or os.path.join(get_cache_dir(), CACHE_FILENAME)
+
+        with self._connect() as connection:
+            if connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS kinds")
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            # Devices and inodes are stored as 8 byte blobs, SQLite integers are signed and some file systems
+            # (network and FUSE mounts among them) report inode numbers of 2 ** 63 and above
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS kinds (device BLOB NOT NULL, inode BLOB NOT NULL, "
+                "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, kind TEXT, PRIMARY KEY (device, inode))"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A fresh connection per operation keeps the cache usable from worker threads
+        connection = sqlite3.connect(self.database_path)
+        try:
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def lookup(self, keys: list[tuple[int, int]]) -> dict[tuple[int, int], tuple[int, int, Optional[str]]]:
+        """
+        Returns (size, mtime_ns, kind) of the cached files among the given (device, inode) keys
+        """
+        found: dict[tuple[int, int], tuple[int, int, Optional[str]]] = dict()
+        with self._connect() as connection:
+            for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+                chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+                rows = connection.execute(
+                    "SELECT device, inode, size, mtime_ns, kind FROM kinds WHERE (device, inode) IN "
+                    f"(VALUES {', '.join(['(?, ?)'] * len(chunk))})",
+                    [number for key in chunk for number in _key_blobs(key)])
+                found.update(((_from_blob(device), _from_blob(inode)), (size, mtime_ns, kind))
+                             for device, inode, size, mtime_ns, kind in rows)
+        return found
+
+    def save(self, rows: list[tuple[int, int, int, int, Optional[str]]]) -> None:
+        """
+        Saves (device, inode, size, mtime_ns, kind) rows, replacing what was cached for the same files
+        """
+        if rows:
+            with self._connect() as connection:
+                connection.executemany("INSERT OR REPLACE INTO kinds VALUES (?, ?, ?, ?, ?)",
+                                       [(*_key_blobs(row[:2]), *row[2:]) for row in rows])
+
+
+def _key_blobs(key: tuple[int, int]) -> tuple[bytes, bytes]:
+    return key[0].to_bytes(8, "big"), key[1].to_bytes(8, "big")
+
+
+def _from_blob(blob: bytes) -> int:
+    return int.from_bytes(blob, "big")
+
+
+@instrumentation.traced("classify")
+def classify_files(files: Iterable[File], cache: Optional[ClassificationCache] = None,
+                   max_workers: int = DEFAULT_CLASSIFY_WORKERS,
+                   on_progress: Optional[Callable[[int, int], None]] = None,
+                   is_cancelled: Optional[Callable[[], bool]] = None) -> dict[str, Optional[str]]:
+    """
+    Returns the kind of every file by path, reading only the files the cache has no current result for
+    on_progress is called with the files classified so far and the total after every batch
+    Once is_cancelled returns True no more files are read; the ones left out are missing from the result
+    """
+    files = list(files)
+
+    def classify_batch(batch: list[File]) -> list[tuple[str, Optional[str], Optional[tuple]]]:
+        # (path, kind, row to cache) of every file, the row is None for files that were not read
+        results = list()
+        stat_results: list[tuple[File, Optional[os.stat_result]]] = list()
+        for file in batch:
+            try:
+                stat_results.append((file, os.stat(file.path)))
+            except OSError:
+                stat_results.append((file, None))
+
+        # Only the batch's own files are looked up, the cache can hold far more files than are being classified
+        keys = [(stat_result.st_dev, stat_result.st_ino) for _, stat_result in stat_results if stat_result]
+        known = cache.lookup(keys) if cache is not None and keys else dict()
+
+        for file, stat_result in stat_results:
+            if is_cancelled and is_cancelled():
+                break
+            if stat_result is None:
+                results.append((file.path, None, None))
+                continue
+
+            key = (stat_result.st_dev, stat_result.st_ino)
+            cached = known.get(key)
+            if cached is not None and cached[:2] == (stat_result.st_size, stat_result.st_mtime_ns):
+                results.append((file.path, cached[2], None))
+                continue
+
+            kind = classify_path(file.path)
+            results.append((file.path, kind, (*key, stat_result.st_size, stat_result.st_mtime_ns, kind)))
+        return results
+
+    kinds: dict[str, Optional[str]] = dict()
+    new_rows: list[tuple] = list()
+    batches = [files[start:start + CLASSIFY_BATCH_SIZE] for start in range(0, len(files), CLASSIFY_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="classifier") as executor:
+        for results in executor.map(classify_batch, batches):
+            for path, kind, row in results:
+                kinds[path] = kind
+                # File systems without inode numbers report 0, such files are read every time
+                if row is not None and row[1]:
+                    new_rows.append(row)
+            instrumentation.count("files_sniffed", sum(row is not None for _, _, row in results))
+            if on_progress:
+                on_progress(len(kinds), len(files))
+
+    # Saved even if cancelled, so the files read so far are not read again
+    if cache is not None:
+        cache.save(new_rows)
+    return kinds
@@ -0,0 +1,357 @@
+"""
+Description:
+Running this file runs OrganizeMyDownloads without the GUI, e.g. from cron on a headless
+server. It never imports PyQt5. Each command prints its results as one JSON document, or
+with --format ndjson as one JSON object per line followed by a {"summary": ...} line, which
+lets results stream out while a large folder is still being scanned.
+
+    python desktop/cli.py scan [PATH...]
+    python desktop/cli.py identify {duplicates,installers,old,large,all} [PATH...]
+    python desktop/cli.py archive [PATH] [--output NAME]
+    python desktop/cli.py backup [PATH]
+    python desktop/cli.py organize [PATH] [--dry-run]
+    python desktop/cli.py delete [--recycle] PATH... (or - to read paths or NDJSON from stdin)
+
+For example, to recycle the installers in the Downloads folder:
+
+    python desktop/cli.py identify installers --format ndjson | python desktop/cli.py delete --recycle -
+
+PATH defaults to the Downloads folder. scan and identify take several folders, which are
+scanned concurrently, and --exclude leaves out files and folders matching a glob pattern.
+The exit status is 0 if everything succeeded, 1 if some files could not be handled and 2
+for invalid arguments.
+
+Authors: Nolan Donovan, Adam Lahouar, Evan Donohoe
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import date, timedelta
+from typing import Iterable, Optional, TextIO
+
+from file import Action, File
+from roots import make_root
+from scanner import DEFAULT_MAX_DEPTH, DOWNLOADS_FOLDER, ScanRoot, scan_roots
+
+# Modules that are only needed by some commands (functions, which loads NumPy, the archiver,
+# the backup store...) are imported inside those commands, once scanning has started, so that
+# starting up stays fast
+
+# Same as the GUI, directory listing is mostly waiting on the disk
+SCAN_WORKERS = 8
+
+# Defaults of the "old" and "large" identify queries, the GUI's default thresholds
+DEFAULT_OLDER_THAN_DAYS = 365
+DEFAULT_LARGER_THAN = "500MB"
+
+SIZE_UNITS = {"": 1, "B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+IDENTIFY_KINDS = ("duplicates", "installers", "old", "large", "all")
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+
+
+class Output:
+    """
+    Writes the records of a command either all at once as a JSON document ({"summary": ..., "results": [...]})
+    or as they come as NDJSON, one record per line followed by a {"summary": ...} line
+    """
+
+    def __init__(self, output_format: str, stream: TextIO = sys.stdout):
+        self.ndjson = output_format == "ndjson"
+        self.stream = stream
+        self.results: list[dict] = list()
+
+    def add(self, record: dict) -> None:
+        if self.ndjson:
+            self.stream.write(json.dumps(record) + "\n")
+        else:
+            self.results.append(record)
+
+    def add_files(self, files: Iterable[File]) -> None:
+        for file in files:
+            self.add(file_record(file))
+
+    def finish(self, summary: dict) -> None:
+        if self.ndjson:
+            self.stream.write(json.dumps({"summary": summary}) + "\n")
+        else:
+            json.dump({"summary": summary, "results": self.results}, self.stream, indent=2)
+            self.stream.write("\n")
+        self.stream.flush()
+
+
+def file_record(file: File) -> dict:
+    return {
+        "path": file.path,
+        "root": file.root,
+        "name": file.name,
+        "type": file.type,
+        "size": file.size,
+        "last_accessed": file.last_accessed,
+        "date_added": file.date_added,
+    }
+
+
+def parse_size(text: str) -> int:
+    """
+    Parses a size such as "500MB", "1.5 GB" or "4096" (bytes)
+    """
+    number = text.strip().upper().rstrip("BKMGT ")
+    unit = text.strip().upper()[len(number):].strip()
+    if unit and not unit.endswith("B"):
+        unit += "B"
+    try:
+        return int(float(number) * SIZE_UNITS[unit])
+    except (KeyError, ValueError):
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r}")
+
+
+def get_roots(args: argparse.Namespace) -> list[ScanRoot]:
+    paths = args.paths if "paths" in args else [args.path]
+    return [make_root(path, args.depth, args.exclude) for path in paths]
+
+
+def scan(args: argparse.Namespace, output: Optional[Output] = None) -> dict[str, File]:
+    """
+    Scans the folders given as arguments, streaming the files to output as each folder is listed if it is given
+    """
+    on_batch = output.add_files if output is not None and output.ndjson else None
+    files = scan_roots(get_roots(args), args.workers, on_batch)
+    if output is not None and not output.ndjson:
+        output.add_files(files.values())
+    return files
+
+
+def command_scan(args: argparse.Namespace, output: Output) -> int:
+    files = scan(args, output)
+    output.finish({"roots": [root.path for root in get_roots(args)], "files": len(files),
+                   "total_size": sum(file.size for file in files.values())})
+    return EXIT_OK
+
+
+def command_identify(args: argparse.Namespace, output: Output) -> int:
+    files = scan(args)
+
+    import functions
+    from filestore import FileStore
+
+    file_store = FileStore(files.values())
+    if args.kind == "all":
+        # Every query and the user's own rules, in a single evaluation that names the rule each file matched
+        from rules import load_rules
+
+        rule_matches = functions.identify_all(file_store, timedelta(days=args.older_than), args.larger_than,
+                                              load_rules())
+        for match in rule_matches:
+            output.add({**file_record(match.file), "rule": match.rule})
+        output.finish({"kind": args.kind, "files": len(rule_matches),
+                       "total_size": sum(match.file.size for match in rule_matches)})
+        return EXIT_OK
+
+    if args.kind == "duplicates":
+        matches = functions.identify_duplicates(files.values())
+    elif args.kind == "installers":
+        matches = functions.identify_installers(file_store)
+    elif args.kind == "old":
+        matches = functions.identify_old_files(file_store, timedelta(days=args.older_than))
+    else:
+        matches = functions.identify_large_files(file_store, args.larger_than)
+
+    output.add_files(matches)
+    output.finish({"kind": args.kind, "files": len(matches), "total_size": sum(file.size for file in matches)})
+    return EXIT_OK
+
+
+def command_archive(args: argparse.Namespace, output: Output) -> int:
+    files = scan(args)
+
+    import functions
+    from archiver import archive_files, verify_archive
+
+    # archive_files rather than functions.archive_all, which prints to stdout
+    skipped = archive_files(list(files.values()), args.output, functions.STORED_EXTENSIONS, resume=not args.no_resume)
+    damaged = [] if args.no_verify else verify_archive(args.output)
+    for path in skipped:
+        output.add({"path": path, "error": "Could not be read"})
+    for name in damaged:
+        output.add({"path": name, "error": "Damaged in the archive"})
+
+    output.finish({"archive": os.path.abspath(args.output), "files": len(files) - len(skipped),
+                   "skipped": len(skipped), "damaged": len(damaged), "verified": not args.no_verify})
+    return EXIT_FAILURES if skipped or damaged else EXIT_OK
+
+
+def command_backup(args: argparse.Namespace, output: Output) -> int:
+    files = scan(args)
+
+    import functions
+    from backup import BackupStore
+
+    result = BackupStore(args.store).backup(files.values(), args.path, functions.STORED_EXTENSIONS)
+    for path in result.skipped:
+        output.add({"path": path, "error": "Could not be read"})
+
+    output.finish({"snapshot": result.snapshot.id, "root": result.snapshot.root,
+                   "files": result.snapshot.file_count, "total_size": result.snapshot.total_size,
+                   "new_bytes": result.new_bytes, "skipped": len(result.skipped)})
+    return EXIT_FAILURES if result.skipped else EXIT_OK
+
+
+def command_organize(args: argparse.Namespace, output: Output) -> int:
+    files = scan(args)
+
+    import functions
+    from organizer import execute_moves
+
+    moves = functions.plan_organize(files.values(), args.path)
+    if args.dry_run:
+        for move in moves:
+            output.add({"path": move.file.path, "destination": move.destination})
+        output.finish({"planned": len(moves), "dry_run": True})
+        return EXIT_OK
+
+    results = execute_moves(moves)
+    for result in results:
+        output.add({"path": result.move.file.path, "destination": result.move.destination,
+                    "moved": result.moved, "error": result.error})
+
+    failed = sum(not result.moved for result in results)
+    output.finish({"moved": len(results) - failed, "failed": failed, "dry_run": False})
+    return EXIT_FAILURES if failed else EXIT_OK
+
+
+def command_delete(args: argparse.Namespace, output: Output) -> int:
+    from removal import remove_files
+
+    files: list[File] = list()
+    missing: list[str] = list()
+    for path in read_paths(args.paths):
+        try:
+            files.append(File(path))
+        except OSError:
+            missing.append(path)
+
+    results = remove_files(files, Action.RECYCLE if args.recycle else Action.DELETE)
+    for result in results:
+        output.add({"path": result.file.path, "removed": result.removed, "error": result.error})
+    for path in missing:
+        output.add({"path": path, "removed": False, "error": "No such file"})
+
+    removed = [result.file for result in results if result.removed]
+    failed = len(results) - len(removed) + len(missing)
+    output.finish({"removed": len(removed), "failed": failed, "freed": sum(file.size for file in removed),
+                   "recycled": args.recycle})
+    return EXIT_FAILURES if failed else EXIT_OK
+
+
+def read_paths(arguments: list[str]) -> Iterable[str]:
+    """
+    Yields the paths given as arguments, where "-" reads one path per line from stdin
+    Lines of NDJSON output from this CLI are read for their "path", summary lines are skipped
+    """
+    for argument in arguments:
+        if argument != "-":
+            yield os.path.abspath(argument)
+            continue
+
+        for line in sys.stdin:
+            line = line.rstrip("\n")
+            if line.startswith("{"):
+                path = json.loads(line).get("path")
+                if path:
+                    yield path
+            elif line:
+                yield os.path.abspath(line)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Organize your Downloads folder without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_command(name: str, handler, help_text: str) -> argparse.ArgumentParser:
+        command = commands.add_parser(name, help=help_text)
+        command.set_defaults(handler=handler, command_parser=command)
+        command.add_argument("--format", choices=("json", "ndjson"), default="json",
+                             help="one JSON document (default) or one JSON object per line")
+        return command
+
+    # Added after a command's own positional arguments, since the folder is optional
+    def add_scan_arguments(command: argparse.ArgumentParser, multiple: bool = False) -> None:
+        if multiple:
+            command.add_argument("paths", nargs="*", default=[DOWNLOADS_FOLDER], metavar="PATH",
+                                 help="folders to scan, concurrently (default: the Downloads folder)")
+        else:
+            command.add_argument("path", nargs="?", default=DOWNLOADS_FOLDER,
+                                 help="folder to scan (default: the Downloads folder)")
+        command.add_argument("--depth", type=int, default=DEFAULT_MAX_DEPTH,
+                             help=f"subfolder levels to scan (default: {DEFAULT_MAX_DEPTH})")
+        command.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                             help="leave out files and folders matching the pattern, may be repeated")
+        command.add_argument("--workers", type=int, default=SCAN_WORKERS,
+                             help=f"threads listing folders, per folder given (default: {SCAN_WORKERS})")
+
+    add_scan_arguments(add_command("scan", command_scan, "list the files in the folders"), multiple=True)
+
+    identify = add_command("identify", command_identify, "list the files matching a cleanup query")
+    identify.add_argument("kind", choices=IDENTIFY_KINDS)
+    add_scan_arguments(identify, multiple=True)
+    identify.add_argument("--older-than", type=int, default=DEFAULT_OLDER_THAN_DAYS, metavar="DAYS",
+                          help=f"threshold of the old query in days (default: {DEFAULT_OLDER_THAN_DAYS})")
+    identify.add_argument("--larger-than", type=parse_size, default=parse_size(DEFAULT_LARGER_THAN), metavar="SIZE",
+                          help=f"threshold of the large query, e.g. 1GB (default: {DEFAULT_LARGER_THAN})")
+
+    archive = add_command("archive", command_archive, "export the folder as a zip archive")
+    add_scan_arguments(archive)
+    archive.add_argument("--output", default=None, help="archive name (default: downloads_archive_<date>.zip)")
+    archive.add_argument("--no-resume", action="store_true", help="start over instead of continuing an unfinished "
+                                                                  "archive of the same name")
+    archive.add_argument("--no-verify", action="store_true", help="do not read the archive back to check it")
+
+    backup = add_command("backup", command_backup, "take an incremental snapshot into the backup store")
+    add_scan_arguments(backup)
+    backup.add_argument("--store", default=None, help="backup store folder (default: the one the GUI uses)")
+
+    organize = add_command("organize", command_organize, "move the files into a folder per file type")
+    add_scan_arguments(organize)
+    organize.add_argument("--dry-run", action="store_true", help="only print where each file would go")
+
+    delete = add_command("delete", command_delete, "delete or recycle the given files")
+    delete.add_argument("paths", nargs="+", metavar="PATH", help="file to remove, - reads paths from stdin")
+    delete.add_argument("--recycle", action="store_true", help="move the files to the trash instead")
+
+    return parser
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """
+    Parses the command line, letting folders come after options too ("identify large --larger-than 1GB ~/Downloads")
+    argparse cannot intermix options and positional arguments behind subcommands, so the command is found
+    first and its own parser reads the rest
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args, _ = build_parser().parse_known_args(argv)
+    command_arguments = argv[argv.index(args.command) + 1:]
+    return args.command_parser.parse_intermixed_args(command_arguments, argparse.Namespace(command=args.command))
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    if getattr(args, "path", None):
+        args.path = os.path.abspath(args.path)
+    if args.command == "archive" and args.output is None:
+        args.output = f"downloads_archive_{date.today()}.zip"
+
+    try:
+        return args.handler(args, Output(args.format))
+    except OSError as error:
+        # e.g. the backup store or the archive could not be written
+        print(f"cli.py {args.command}: {error}", file=sys.stderr)
+        return EXIT_FAILURES
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+Description:
+This file contains the copy engine behind "Copy selected files to folder". Files are
+copied on a few threads at once, and the bytes are moved by the kernel rather than
+through Python: on Linux a copy is first attempted as a reflink (the copy shares the
+original's blocks until either is changed, so it is instant on Btrfs and XFS), then with
+copy_file_range and then with sendfile. Plain reads and writes are only used where none
+of those are available. A file whose copy at the destination already has the same size
+and modification time is skipped, so copying the same selection again is cheap.
+
+Every file is copied to a temporary name that is renamed once complete, so a cancelled
+or failed copy never leaves a partial file under the real name.
+
+Authors: Adam Lahouar, Evan Donohoe, Nolan Donovan
+"""
+
+import errno
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, NamedTuple, Optional
+
+import instrumentation
+from file import File
+from organizer import free_name
+# Error reported for the files that were not copied because the job was cancelled
+from removal import CANCELLED
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+# A few copies at once keep the destination disk busy, more only make them compete for it
+DEFAULT_COPY_WORKERS = 4
+
+# Bytes handed to the kernel per call, progress and cancellation are checked between calls
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+COPYING_SUFFIX = ".copying"
+
+# ioctl request that clones a whole file on Linux (FICLONE from linux/fs.h)
+FICLONE = 0x40049409
+
+# Errors meaning a copy method is not supported for this pair of files, rather than that the copy failed
+UNSUPPORTED_ERRORS = frozenset(
+    code for code in (
+        errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY,
+        getattr(errno, "ENOTSUP", None), getattr(errno, "ENOTSOCK", None),
+    ) if code is not None
+)
+
+
+class CopyResult(NamedTuple):
+    file: File
+    destination: str
+    # None if the file was copied or skipped
+    error: Optional[str]
+    # The destination already had an identical copy
+    skipped: bool = False
+
+    @property
+    def copied(self) -> bool:
+        return self.error is None and not self.skipped
+
+
+class _CopyCancelled(Exception):
+    pass
+
+
+@instrumentation.traced("copy")
+def copy_files(files: Iterable[File], destination_directory: str, max_workers: int = DEFAULT_COPY_WORKERS,
+               on_progress: Optional[Callable[[int, int], None]] = None,
+               is_cancelled: Optional[Callable[[], bool]] = None) -> list[CopyResult]:
+    """
+    Copies the files into destination_directory, keeping their names and modification times
+    A file already there with a different size or modification time is replaced; when two of the
+    given files have the same name, the later ones get a " (n)" suffix
+    on_progress is called with the bytes copied (or skipped) so far and the total
+    Returns a result for every file, in the order they were given
+    """
+    files = list(files)
+    destination_directory = os.path.abspath(destination_directory)
+    total_bytes = sum(file.size for file in files)
+
+    taken_names: set[str] = set()
+    destinations: list[str] = list()
+    for file in files:
+        filename = free_name(os.path.basename(file.path), taken_names)
+        taken_names.add(os.path.normcase(filename))
+        destinations.append(os.path.join(destination_directory, filename))
+
+    progress_lock = threading.Lock()
+    done_bytes = 0
+
+    def add_progress(length: int) -> None:
+        nonlocal done_bytes
+        if on_progress:
+            with progress_lock:
+                done_bytes += length
+                on_progress(done_bytes, total_bytes)
+
+    def copy(file: File, destination: str) -> CopyResult:
+        if is_cancelled and is_cancelled():
+            return CopyResult(file, destination, CANCELLED)
+        if _is_identical(file.path, destination):
+            add_progress(file.size)
+            return CopyResult(file, destination, None, skipped=True)
+        try:
+            _copy_file(file.path, destination, add_progress, is_cancelled)
+        except _CopyCancelled:
+            return CopyResult(file, destination, CANCELLED)
+        except OSError as error:
+            return CopyResult(file, destination, error.strerror or str(error))
+        return CopyResult(file, destination, None)
+
+    os.makedirs(destination_directory, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="copier") as executor:
+        return list(executor.map(copy, files, destinations))
+
+
+def _is_identical(source: str, destination: str) -> bool:
+    try:
+        source_stat = os.stat(source)
+        destination_stat = os.stat(destination)
+    except OSError:
+        return False
+    return (source_stat.st_size, source_stat.st_mtime_ns) == (destination_stat.st_size, destination_stat.st_mtime_ns)
+
+
+def _copy_file(source: str, destination: str, add_progress: Callable[[int], None],
+               is_cancelled: Optional[Callable[[], bool]]) -> None:
+    temporary_path = destination + COPYING_SUFFIX
+    try:
+        with open(source, "rb") as source_stream, open(temporary_path, "wb") as destination_stream:
+            source_fd, destination_fd = source_stream.fileno(), destination_stream.fileno()
+            size = os.fstat(source_fd).st_size
+
+            if _reflink(source_fd, destination_fd):
+                add_progress(size)
+            elif _kernel_copy(source_fd, destination_fd, size, add_progress, is_cancelled) < size:
+                # The kernel cannot copy between these files, read and write them instead
+                _buffered_copy(source_stream, destination_stream, add_progress, is_cancelled)
+
+        shutil.copystat(source, temporary_path)
+        os.replace(temporary_path, destination)
+    except BaseException:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        raise
+
+
+def _reflink(source_fd: int, destination_fd: int) -> bool:
+    """
+    Returns whether the destination was made a clone of the source, which only some Linux file systems support
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        fcntl.ioctl(destination_fd, FICLONE, source_fd)
+    except OSError as error:
+        if error.errno in UNSUPPORTED_ERRORS:
+            return False
+        raise
+    return True
+
+
+def _kernel_copy(source_fd: int, destination_fd: int, size: int, add_progress: Callable[[int], None],
+                 is_cancelled: Optional[Callable[[], bool]]) -> int:
+    """
+    Copies with copy_file_range, or sendfile where that is not supported, without the data passing through Python
+    Returns the bytes copied, which is less than size if neither is supported for these files
+    """
+    copied = 0
+    for copy_call in (getattr(os, "copy_file_range", None), _sendfile):
+        if copy_call is None:
+            continue
+        try:
+            while copied < size:
+                if is_cancelled and is_cancelled():
+                    raise _CopyCancelled()
+                length = copy_call(source_fd, destination_fd, min(COPY_CHUNK_SIZE, size - copied))
+                if length == 0:
+                    # The file got shorter since it was stat'ed
+                    return size
+                copied += length
+                add_progress(length)
+            return copied
+        except OSError as error:
+            # A method that fails part way through is a real error, not a missing feature
+            if error.errno not in UNSUPPORTED_ERRORS or copied:
+                raise
+    return copied
+
+
+def _sendfile(source_fd: int, destination_fd: int, count: int) -> int:
+    # Unlike copy_file_range, sendfile takes no offsets here, so both files must be at the current position
+    if not sys.platform.startswith("linux"):
+        # Elsewhere sendfile only writes to sockets
+        raise OSError(errno.ENOTSOCK, os.strerror(errno.ENOTSOCK))
+    return os.sendfile(destination_fd, source_fd, None, count)
+
+
+def _buffered_copy(source_stream, destination_stream, add_progress: Callable[[int], None],
+                   is_cancelled: Optional[Callable[[], bool]]) -> None:
+    while True:
+        if is_cancelled and is_cancelled():
+            raise _CopyCancelled()
+        chunk = source_stream.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            return
+        destination_stream.write(chunk)
+        add_progress(len(chunk))
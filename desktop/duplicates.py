@@ -0,0 +1,142 @@
+"""
+Description:
+This file contains the content-verified duplicate detection used by "Identify Duplicate Files".
+Candidates are narrowed down in stages so that most files are never read:
+    1. Files are bucketed by size, and files with a unique size are dropped
+    2. The first and last few KB of the remaining files are hashed
+    3. Files that still collide are hashed in full, in fixed-size chunks
+Hashing runs on a thread pool; each worker holds a single chunk buffer, so memory use
+is bounded by the number of workers rather than by file sizes. The partial hashes are
+the first half of the reported progress and the full hashes the second.
+
+Authors: Evan Donohoe, Adam Lahouar, Nolan Donovan
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Hashable, Iterable, Optional
+
+import instrumentation
+from file import File
+
+# Bytes hashed from each end of a file in the partial hash stage
+PARTIAL_HASH_BYTES = 4 * 1024
+
+# Size of the buffer used when hashing whole files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_HASH_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def find_duplicate_groups(files: Iterable[File], max_workers: int = DEFAULT_HASH_WORKERS,
+                          on_progress: Optional[Callable[[int, int], None]] = None,
+                          is_cancelled: Optional[Callable[[], bool]] = None) -> list[list[File]]:
+    """
+    Returns groups of files with identical contents, each group holding at least two files
+    Empty files and files that cannot be read are never reported
+    on_progress is called with the files hashed so far and the total, counting each stage as half
+    Once is_cancelled returns True no more files are read and the groups found may be incomplete
+    """
+    size_buckets: dict[int, list[File]] = dict()
+    for file in files:
+        if file.size > 0:
+            size_buckets.setdefault(file.size, list()).append(file)
+
+    candidates = [bucket for bucket in size_buckets.values() if len(bucket) > 1]
+
+    def stage_progress(stage: int) -> Optional[Callable[[int, int], None]]:
+        if on_progress is None:
+            return None
+        return lambda done, total: on_progress(stage * total + done, 2 * total)
+
+    def cancellable(hash_function: Callable[[File], Optional[Hashable]]) -> Callable[[File], Optional[Hashable]]:
+        if is_cancelled is None:
+            return hash_function
+        # Files left once cancelled are not read, and so never reported
+        return lambda file: None if is_cancelled() else hash_function(file)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hasher") as executor:
+        with instrumentation.span("identify.duplicates.partial_hash"):
+            candidates = _split_groups(candidates, cancellable(_partial_hash), executor, stage_progress(0))
+
+        # Files small enough for the partial hash to have covered all of their bytes are already verified
+        verified = [group for group in candidates if group[0].size <= 2 * PARTIAL_HASH_BYTES]
+        unverified = [group for group in candidates if group[0].size > 2 * PARTIAL_HASH_BYTES]
+        with instrumentation.span("identify.duplicates.full_hash"):
+            verified.extend(_split_groups(unverified, cancellable(_full_hash), executor, stage_progress(1)))
+
+    if on_progress:
+        on_progress(1, 1)
+    return verified
+
+
+@instrumentation.traced("identify.duplicates")
+def get_duplicate_files(files: Iterable[File], max_workers: int = DEFAULT_HASH_WORKERS,
+                        on_progress: Optional[Callable[[int, int], None]] = None,
+                        is_cancelled: Optional[Callable[[], bool]] = None) -> list[File]:
+    """
+    Returns every duplicate except one file per group, which is kept as the original
+    The original is the file with the shortest name (so "report.pdf" is kept over "report (1).pdf"),
+    then the one added first
+    """
+    duplicates: list[File] = list()
+    for group in find_duplicate_groups(files, max_workers, on_progress, is_cancelled):
+        group.sort(key=lambda file: (len(file.name), file.date_added, file.path))
+        duplicates.extend(group[1:])
+
+    return duplicates
+
+
+def _split_groups(groups: list[list[File]], hash_function: Callable[[File], Optional[Hashable]],
+                  executor: ThreadPoolExecutor,
+                  on_progress: Optional[Callable[[int, int], None]] = None) -> list[list[File]]:
+    """
+    Splits each group by the given hash, keeping only the sub-groups that still have several files
+    """
+    files = [file for group in groups for file in group]
+    buckets: dict[tuple[int, Hashable], list[File]] = dict()
+
+    for done, (file, digest) in enumerate(zip(files, executor.map(hash_function, files)), 1):
+        if digest is not None:
+            buckets.setdefault((file.size, digest), list()).append(file)
+        if on_progress:
+            on_progress(done, len(files))
+
+    return [bucket for bucket in buckets.values() if len(bucket) > 1]
+
+
+def _partial_hash(file: File) -> Optional[bytes]:
+    try:
+        with open(file.path, "rb") as stream:
+            head = stream.read(PARTIAL_HASH_BYTES)
+            if file.size > 2 * PARTIAL_HASH_BYTES:
+                stream.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+            tail = stream.read(PARTIAL_HASH_BYTES)
+    except OSError:
+        return None
+
+    instrumentation.count("bytes_hashed", len(head) + len(tail))
+    return hashlib.blake2b(head + tail, digest_size=16).digest()
+
+
+def _full_hash(file: File) -> Optional[bytes]:
+    digest = hashlib.blake2b(digest_size=32)
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+
+    hashed = 0
+
+    try:
+        with open(file.path, "rb", buffering=0) as stream:
+            while True:
+                read = stream.readinto(buffer)
+                if not read:
+                    break
+                digest.update(view[:read])
+                hashed += read
+    except OSError:
+        return None
+
+    instrumentation.count("bytes_hashed", hashed)
+    return digest.digest()
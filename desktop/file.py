@@ -7,37 +7,91 @@ Authors: Adam Lahouar, Nolan Donovan, Evan Donohoe
 
 import datetime
 import os
+import sys
 from enum import Enum
-
-import send2trash
+from typing import Optional
 
 
 class Action(Enum):
     DELETE = 0
     ARCHIVE = 1
+    RECYCLE = 2
+
+
+DATE_FORMAT = '%Y/%m/%d %H:%M'
 
 
 class File:
     """
     Initializes a file object with the given path
+    If a stat result for the path is already available (e.g. from os.scandir), it is used
+    instead of stat'ing the file again
+
+    Files are kept compact so that very large folders fit in memory: there is no per-instance
+    __dict__, the parent directory and extension strings are interned and shared between files,
+    the full path is rebuilt from them on access and the formatted dates are only built when first displayed
+    """
+
+    __slots__ = (
+        "_location", "name", "_extension", "type", "size", "last_accessed", "date_added",
+        "_last_accessed_formatted", "_date_added_formatted", "checked", "action", "root",
+    )
+
+    def __init__(self, path, stat_result: os.stat_result = None):
+        if stat_result is None:
+            stat_result = os.stat(path)
+
+        self._init_metadata(path, stat_result.st_size, stat_result.st_atime, stat_result.st_ctime)
+
     """
+    Creates a file object from previously recorded metadata without touching the disk
+    """
+
+    @classmethod
+    def from_metadata(cls, path: str, size: int, last_accessed: float, date_added: float,
+                      root: Optional[str] = None) -> "File":
+        file = cls.__new__(cls)
+        file._init_metadata(path, size, last_accessed, date_added)
+        file.root = root
+        return file
 
-    def __init__(self, path):
-        self.path: str = path
+    def _init_metadata(self, path: str, size: int, last_accessed: float, date_added: float) -> None:
+        basename = os.path.basename(path)
+        # Everything before the file name, including the trailing separator, shared by files in the same folder
+        self._location: str = sys.intern(path[:len(path) - len(basename)])
         self.name: str
-        self.type: str
-        self.name, self.type = os.path.splitext(os.path.basename(path))
-        self.type = self.type.strip('.').lower()
-        self.size: int = os.path.getsize(path)
-        self.last_accessed: float = os.path.getatime(path)
-        self.date_added: float = os.path.getctime(path)
-        self.last_accessed_formatted: str = datetime.datetime.fromtimestamp(self.last_accessed).strftime(
-            '%Y/%m/%d %H:%M'
-        )
-        self.date_added_formatted: str = datetime.datetime.fromtimestamp(self.date_added).strftime(
-            '%Y/%m/%d %H:%M'
-        )
+        self.name, extension = os.path.splitext(basename)
+        self._extension: str = sys.intern(extension)
+        self.type: str = sys.intern(extension.strip('.').lower())
+        self.size: int = size
+        self.last_accessed: float = last_accessed
+        self.date_added: float = date_added
+        self._last_accessed_formatted: Optional[str] = None
+        self._date_added_formatted: Optional[str] = None
         self.checked: bool = False
+        self.action: Optional[Action] = None
+        # The scanned folder the file was found under, shared by all of its files
+        self.root: Optional[str] = None
+
+    @property
+    def path(self) -> str:
+        return self._location + self.name + self._extension
+
+    @property
+    def directory(self) -> str:
+        return os.path.dirname(self.path)
+
+    @property
+    def last_accessed_formatted(self) -> str:
+        if self._last_accessed_formatted is None:
+            self._last_accessed_formatted = datetime.datetime.fromtimestamp(self.last_accessed).strftime(DATE_FORMAT)
+        return self._last_accessed_formatted
+
+    @property
+    def date_added_formatted(self) -> str:
+        if self._date_added_formatted is None:
+            self._date_added_formatted = datetime.datetime.fromtimestamp(self.date_added).strftime(DATE_FORMAT)
+        return self._date_added_formatted
 
     """
     Returns a string representation of the file object
@@ -58,10 +112,13 @@ class File:
     """
 
     def recycle(self):
+        # Imported on first use, loading the trash support is a noticeable part of the CLI's start up time
+        import send2trash
+
         try:
             send2trash.send2trash(self.path)
             return True
-        except send2trash.TrashPermissionError or OSError:
+        except (send2trash.TrashPermissionError, OSError):
             return False
 
     """
@@ -0,0 +1,158 @@
+"""
+Description:
+This file contains the FileStore class, a columnar copy of a list of File objects.
+Sizes, dates and extensions are kept in NumPy arrays next to the list of paths so
+the identify and sort queries run as vectorized mask and argsort operations, and
+are mapped back to the original File objects at the end.
+
+Authors: Evan Donohoe, Adam Lahouar, Nolan Donovan
+"""
+
+import time
+from datetime import timedelta
+from typing import Iterable, Optional
+
+import numpy as np
+
+import instrumentation
+from file import File
+
+SORTABLE_ATTRIBUTES = ["name", "size", "type", "last_accessed"]
+
+
+class FileStore:
+    """
+    Initializes the store with the given files, keeping their order
+    """
+
+    @instrumentation.traced("filestore.build")
+    def __init__(self, files: Iterable[File]):
+        self.files: list[File] = list(files)
+        self.paths: list[str] = [file.path for file in self.files]
+
+        count = len(self.files)
+        self.sizes: np.ndarray = np.fromiter((file.size for file in self.files), dtype=np.int64, count=count)
+        self.last_accessed: np.ndarray = np.fromiter(
+            (file.last_accessed for file in self.files), dtype=np.float64, count=count
+        )
+        self.date_added: np.ndarray = np.fromiter(
+            (file.date_added for file in self.files), dtype=np.float64, count=count
+        )
+
+        # Each distinct extension gets a small integer code, self.extensions[code] maps it back
+        codes: dict[str, int] = dict()
+        self.extension_codes: np.ndarray = np.fromiter(
+            (codes.setdefault(file.type, len(codes)) for file in self.files), dtype=np.int32, count=count
+        )
+        self.extensions: list[str] = list(codes)
+        self._codes_by_extension: dict[str, int] = codes
+
+        # Object array of the files so selections can be gathered without a Python loop
+        self._file_array: np.ndarray = np.empty(count, dtype=object)
+        self._file_array[:] = self.files
+
+        # Built on first use, as only some queries need the names. Names stay Python strings: a NumPy
+        # string array is as wide as the longest name for every file
+        self._lower_names: Optional[list[str]] = None
+        self._name_ranks: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def _select(self, selector: np.ndarray) -> list[File]:
+        # selector is either a boolean mask or an array of indices
+        return self._file_array[selector].tolist()
+
+    def _get_lower_names(self, indices: np.ndarray) -> list[str]:
+        # A query on a few candidates lowercases only their names
+        if self._lower_names is None and len(indices) == len(self.files):
+            self._lower_names = [file.name.lower() for file in self.files]
+        if self._lower_names is not None:
+            return [self._lower_names[index] for index in indices.tolist()]
+        return [self.files[index].name.lower() for index in indices.tolist()]
+
+    def _get_name_ranks(self) -> np.ndarray:
+        if self._name_ranks is None:
+            self._name_ranks = _ranks([file.name for file in self.files])
+        return self._name_ranks
+
+    def extension_mask(self, extensions: Iterable[str]) -> np.ndarray:
+        codes = [self._codes_by_extension[extension] for extension in extensions
+                 if extension in self._codes_by_extension]
+        return np.isin(self.extension_codes, codes)
+
+    def larger_than_mask(self, size_threshold: int) -> np.ndarray:
+        return self.sizes > size_threshold
+
+    def older_than_mask(self, threshold: timedelta, now: float = None) -> np.ndarray:
+        cutoff = (time.time() if now is None else now) - threshold.total_seconds()
+        return (self.date_added < cutoff) & (self.last_accessed < cutoff)
+
+    def name_mask(self, substrings: Iterable[str], candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns a mask of the files whose lowercase name contains any of the (lowercase) substrings
+        If a mask of candidates is given, only their names are checked and the rest are False
+        """
+        indices = np.arange(len(self.files)) if candidates is None else np.flatnonzero(candidates)
+        substrings = list(substrings)
+        matches = np.fromiter((any(substring in name for substring in substrings)
+                               for name in self._get_lower_names(indices)), dtype=bool, count=len(indices))
+
+        mask = np.zeros(len(self.files), dtype=bool)
+        mask[indices[matches]] = True
+        return mask
+
+    def files_mask(self, files: Iterable[File]) -> np.ndarray:
+        """
+        Returns a mask of the given files, which must be File objects of this store
+        """
+        wanted = {id(file) for file in files}
+        return np.fromiter((id(file) in wanted for file in self.files), dtype=bool, count=len(self.files))
+
+    def select(self, mask: np.ndarray) -> list[File]:
+        return self._select(mask)
+
+    def identify_large_files(self, size_threshold: int) -> list[File]:
+        return self._select(self.larger_than_mask(size_threshold))
+
+    def identify_old_files(self, threshold: timedelta, now: float = None) -> list[File]:
+        """
+        Returns the files that have not been created or accessed within the given threshold
+        """
+        return self._select(self.older_than_mask(threshold, now))
+
+    def identify_installers(self, substrings: list[str], installer_types: list[str]) -> list[File]:
+        # Only the files with an installer extension need their names checked
+        return self._select(self.name_mask(substrings, self.extension_mask(installer_types)))
+
+    def sort_by(self, attribute: str, descending: bool = False) -> list[File]:
+        """
+        Returns the files sorted by one of SORTABLE_ATTRIBUTES
+        Like sorted(), the sort is stable in both directions
+        """
+        if attribute == "size":
+            keys = self.sizes
+        elif attribute == "last_accessed":
+            keys = self.last_accessed
+        elif attribute == "type":
+            # Rank the extension codes alphabetically so the codes sort like the strings
+            keys = _ranks(self.extensions)[self.extension_codes]
+        elif attribute == "name":
+            keys = self._get_name_ranks()
+        else:
+            return list(self.files)
+
+        return self._select(np.argsort(-keys if descending else keys, kind="stable"))
+
+
+def _ranks(strings: list[str]) -> np.ndarray:
+    """
+    Returns the rank of every string in sorted order, equal strings sharing a rank
+    """
+    ranks = np.empty(len(strings), dtype=np.int64)
+    rank, previous = -1, None
+    for index in sorted(range(len(strings)), key=strings.__getitem__):
+        if rank < 0 or strings[index] != previous:
+            rank, previous = rank + 1, strings[index]
+        ranks[index] = rank
+    return ranks
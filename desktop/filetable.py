@@ -1,151 +1,435 @@
 """
 Description:
-This file contains the code for the FileTable class, which is used to unify the QTableWidget
-and the File class.
+This file contains the code for the FileTable class, which is used to unify the QTableView
+and the File class. The files are held by FileTableModel and only the rows that are visible
+are ever turned into cells. Filters are answered by a TrigramIndex (file name) and an
+ExtensionIndex (extension or category) over every loaded file, and only the matching
+files are handed to the model, so a filter costs time in proportion to its results
+rather than to the number of files.
 
 Authors: Adam Lahouar, Evan Donohoe, Nolan Donovan
 """
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QTableWidget, QHeaderView, QTableWidgetItem
+from operator import attrgetter
+from typing import Any, Callable, Optional
 
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtWidgets import QTableView, QHeaderView
+
+import instrumentation
 from file import File
-from functions import format_file_size
+from functions import format_file_size, get_category
+from indexes import ExtensionIndex, TrigramIndex
 
 HEADER_LABELS = ["Filename", "Location", "Size", "Date Last Accessed", "Date Added", "Selected"]
 
+NAME_COLUMN = 0
+LOCATION_COLUMN = 1
+SIZE_COLUMN = 2
+LAST_ACCESSED_COLUMN = 3
+DATE_ADDED_COLUMN = 4
+SELECTED_COLUMN = 5
+
+# Every cell returns its File for FILE_ROLE and a sortable value for SORT_ROLE
+FILE_ROLE = Qt.UserRole
+SORT_ROLE = Qt.UserRole + 1
+
+# Columns whose sort key is a File attribute
+SORT_ATTRIBUTES = {
+    SIZE_COLUMN: "size",
+    LAST_ACCESSED_COLUMN: "last_accessed",
+    DATE_ADDED_COLUMN: "date_added",
+}
+
 
 def _get_file_location(file: File) -> str:
     length_to_strip = len(file.name) + 1 + len(file.type)
     return file.path[:-length_to_strip]
 
 
-class FileTable(QTableWidget):
-    def __init__(self, files: dict, *args, **kwargs):
-        super(FileTable, self).__init__(*args, **kwargs)
+class FileTableModel(QAbstractTableModel):
+    def __init__(self, *args, **kwargs):
+        super(FileTableModel, self).__init__(*args, **kwargs)
 
-        self._all_files = files
-        self._selected_files = {}
-        self.displayed_files = {}
+        self._files: list[File] = list()
+        self._selected_files: dict[str, File] = dict()
+        # Rule that selected each file identified by the rule engine, shown as the row's tooltip
+        self._matched_rules: dict[str, str] = dict()
 
-        self._initialize_table_properties()
-        self.update_table_contents(list(files.values()))
+        # Row of each file in self._files, rebuilt whenever the rows are replaced or reordered
+        self._rows_by_path: dict[str, int] = dict()
 
-    def _initialize_table_properties(self):
-        # Set up header labels
-        self.setColumnCount(len(HEADER_LABELS))
-        self.setHorizontalHeaderLabels(HEADER_LABELS)
-
-        # Set column widths
-        self.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
-        for column in range(1, len(HEADER_LABELS)):
-            self.horizontalHeader().setSectionResizeMode(column, QHeaderView.ResizeToContents)
+        # Last sort requested from the header, reapplied when the rows are replaced
+        self._sort_column: Optional[int] = None
+        self._sort_order = Qt.AscendingOrder
 
-        # Set up sorting
-        self.horizontalHeader().setSortIndicatorShown(True)
-        self.horizontalHeader().sortIndicatorChanged.connect(self.sortItems)
-        self.itemChanged.connect(self._handle_user_selection)
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._files)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(HEADER_LABELS)
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole) -> Any:
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return HEADER_LABELS[section]
+        return super(FileTableModel, self).headerData(section, orientation, role)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+
+        file = self._files[index.row()]
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            if column == NAME_COLUMN:
+                return f"{file.name}.{file.type}"
+            if column == LOCATION_COLUMN:
+                return _get_file_location(file)
+            if column == SIZE_COLUMN:
+                return format_file_size(file.size)
+            if column == LAST_ACCESSED_COLUMN:
+                return file.last_accessed_formatted
+            if column == DATE_ADDED_COLUMN:
+                return file.date_added_formatted
+            return None
+
+        if role == Qt.CheckStateRole and column == SELECTED_COLUMN:
+            return Qt.Checked if file.path in self._selected_files else Qt.Unchecked
+
+        if role == Qt.ToolTipRole and file.path in self._matched_rules:
+            return f"Identified by rule: {self._matched_rules[file.path]}"
+
+        if role == Qt.TextAlignmentRole and column >= SIZE_COLUMN:
+            return Qt.AlignCenter
+
+        if role == FILE_ROLE:
+            return file
+
+        if role == SORT_ROLE:
+            return self._sort_key(file, column)
+
+        return None
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        if not index.isValid():
+            return Qt.NoItemFlags
+
+        # Every cell is read-only except for the checkbox
+        if index.column() == SELECTED_COLUMN:
+            return Qt.ItemIsUserCheckable | Qt.ItemIsEnabled
+        return Qt.ItemIsSelectable | Qt.ItemIsEnabled
+
+    def setData(self, index: QModelIndex, value: Any, role: int = Qt.EditRole) -> bool:
+        if not index.isValid() or role != Qt.CheckStateRole or index.column() != SELECTED_COLUMN:
+            return False
+
+        self.set_selection([self._files[index.row()]], value == Qt.Checked)
+        return True
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.AscendingOrder) -> None:
+        self._sort_column, self._sort_order = column, order
+        self.layoutAboutToBeChanged.emit()
+
+        old_files = self._files
+        self._files = self._sorted(old_files)
+
+        # Move any persistent indexes (e.g. the view's current cell) along with their rows
+        new_rows = {id(file): row for row, file in enumerate(self._files)}
+        old_indexes = self.persistentIndexList()
+        new_indexes = [self.index(new_rows[id(old_files[index.row()])], index.column()) for index in old_indexes]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self._index_rows()
+
+        self.layoutChanged.emit()
+
+    def _sorted(self, files: list[File]) -> list[File]:
+        if self._sort_column is None:
+            return list(files)
+
+        return sorted(files, key=self._sort_key_function(self._sort_column),
+                      reverse=self._sort_order == Qt.DescendingOrder)
+
+    def _sort_key_function(self, column: int) -> Callable[[File], Any]:
+        # Plain attributes are read directly, which is much faster than going through _sort_key per file
+        attribute = SORT_ATTRIBUTES.get(column)
+        if attribute is not None:
+            return attrgetter(attribute)
+        return lambda file: self._sort_key(file, column)
+
+    def _sort_key(self, file: File, column: int) -> Any:
+        if column == NAME_COLUMN:
+            return f"{file.name}.{file.type}"
+        if column == LOCATION_COLUMN:
+            return file.directory
+        if column == SIZE_COLUMN:
+            return file.size
+        if column == LAST_ACCESSED_COLUMN:
+            return file.last_accessed
+        if column == DATE_ADDED_COLUMN:
+            return file.date_added
+        return file.path in self._selected_files
+
+    @instrumentation.traced("table.set_files")
+    def set_files(self, files: list[File]) -> None:
+        instrumentation.count("rows_built", len(files))
+        self.beginResetModel()
+        self._files = self._sorted(files)
+        self._index_rows()
+        self.endResetModel()
+
+    def add_files(self, files: list[File]) -> None:
+        """
+        Appends rows for the given files without resetting the model
+        """
+        if not files:
+            return
 
-        # Connect checkbox to file selection
-        self.itemChanged.connect(self._handle_user_selection)
+        instrumentation.count("rows_built", len(files))
+        first_row = len(self._files)
+        self.beginInsertRows(QModelIndex(), first_row, first_row + len(files) - 1)
+        self._files.extend(files)
+        for row, file in enumerate(files, first_row):
+            self._rows_by_path[file.path] = row
+        self.endInsertRows()
+
+    def update_files(self, files: list[File]) -> None:
+        """
+        Replaces the rows of files whose path is already in the model and appends the others
+        """
+        new_files: list[File] = list()
+        for file in files:
+            row = self._rows_by_path.get(file.path)
+            if row is None:
+                new_files.append(file)
+                continue
+
+            self._files[row] = file
+            if file.path in self._selected_files:
+                self._selected_files[file.path] = file
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(HEADER_LABELS) - 1))
 
-    def update_table_contents(self, files_to_display: list[File]):
-        # Clear previous contents
-        self.setRowCount(0)
-        self.displayed_files.clear()
+        self.add_files(new_files)
 
-        # Display new files
-        for row, file in enumerate(files_to_display):
-            self.insertRow(row)
+    def remove_files(self, paths: list[str]) -> None:
+        """
+        Removes the rows of the given paths, as well as any selection of them
+        """
+        rows = sorted((self._rows_by_path[path] for path in paths if path in self._rows_by_path), reverse=True)
+        for path in paths:
+            self._selected_files.pop(path, None)
 
-            row_items = self._get_widgets_from_file(file)
-            for column, item in enumerate(row_items):
-                self.setItem(row, column, item)
+        if not rows:
+            return
 
-            self.displayed_files[file.path] = file
+        # Remove contiguous runs of rows together, starting from the bottom so earlier rows keep their numbers
+        start = 0
+        while start < len(rows):
+            end = start
+            while end + 1 < len(rows) and rows[end + 1] == rows[end] - 1:
+                end += 1
+
+            first_row, last_row = rows[end], rows[start]
+            self.beginRemoveRows(QModelIndex(), first_row, last_row)
+            del self._files[first_row:last_row + 1]
+            self.endRemoveRows()
+            start = end + 1
+
+        # Only rows below the first removed one moved
+        for path in paths:
+            self._rows_by_path.pop(path, None)
+        self._index_rows(rows[-1])
+
+    def _index_rows(self, first_row: int = 0) -> None:
+        if first_row == 0:
+            self._rows_by_path = dict()
+        for row in range(first_row, len(self._files)):
+            self._rows_by_path[self._files[row].path] = row
+
+    def file_at(self, row: int) -> File:
+        return self._files[row]
+
+    def get_files(self) -> list[File]:
+        return list(self._files)
+
+    def set_selection(self, files: list[File], selected: bool, rules: Optional[list[str]] = None) -> None:
+        """
+        Checks or unchecks all of the given files in one pass
+        rules, if given, names the rule that selected each of the files
+        Files that are not currently rows of the model are still added to or removed from the selection
+        A single dataChanged signal covering the affected rows is emitted at the end
+        """
+        first_row, last_row = len(self._files), -1
+
+        if rules is not None:
+            self._matched_rules.update(zip((file.path for file in files), rules))
+
+        for file in files:
+            path = file.path
+            if selected:
+                self._selected_files[path] = file
+            else:
+                self._selected_files.pop(path, None)
+                self._matched_rules.pop(path, None)
+
+            row = self._rows_by_path.get(path)
+            if row is not None:
+                first_row = min(first_row, row)
+                last_row = max(last_row, row)
+
+        if last_row >= 0:
+            self.dataChanged.emit(
+                self.index(first_row, SELECTED_COLUMN), self.index(last_row, SELECTED_COLUMN), [Qt.CheckStateRole]
+            )
 
-    def _get_widgets_from_file(self, file: File) -> list[QTableWidgetItem]:
-        widgets: list[QTableWidgetItem] = list()
+    def get_selected_files(self) -> list[File]:
+        return list(self._selected_files.values())
 
-        name_widget = QTableWidgetItem(f"{file.name}.{file.type}")
-        name_widget.setData(Qt.UserRole, file)  # Store the file object reference
-        widgets.append(name_widget)
 
-        location_widget = QTableWidgetItem(_get_file_location(file))
-        widgets.append(location_widget)
+class FileTable(QTableView):
+    def __init__(self, files: dict, *args, **kwargs):
+        super(FileTable, self).__init__(*args, **kwargs)
 
-        size_widget = SortUserRoleItem()
-        size_widget.setData(Qt.DisplayRole, format_file_size(file.size))
-        size_widget.setData(Qt.UserRole, file.size)  # Set the size in bytes as user data
-        size_widget.setTextAlignment(Qt.AlignCenter)
-        widgets.append(size_widget)
+        self._model = FileTableModel(self)
+        self.setModel(self._model)
 
-        last_accessed_widget = QTableWidgetItem(file.last_accessed_formatted)
-        last_accessed_widget.setTextAlignment(Qt.AlignCenter)
-        widgets.append(last_accessed_widget)
+        # Every loaded file is indexed, the model only holds the ones matching the filters
+        self._name_index = TrigramIndex()
+        self._extension_index = ExtensionIndex()
+        self._name_search: str = ""
+        self._extension: Optional[str] = None
+        self._category: Optional[str] = None
 
-        date_added_widget = QTableWidgetItem(file.date_added_formatted)
-        date_added_widget.setTextAlignment(Qt.AlignCenter)
-        widgets.append(date_added_widget)
+        self._initialize_table_properties()
+        self.update_table_contents(list(files.values()))
 
-        # Make every widget read-only except for the checkbox
-        for widget in widgets:
-            widget.setFlags(widget.flags() & ~Qt.ItemIsEditable)
+    def _initialize_table_properties(self):
+        # Set column widths
+        self.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        for column in range(1, len(HEADER_LABELS)):
+            self.horizontalHeader().setSectionResizeMode(column, QHeaderView.ResizeToContents)
 
-        checkbox_widget = self._create_checkbox()
-        if file.path in self._selected_files.keys():
-            checkbox_widget.setCheckState(Qt.Checked)
-        checkbox_widget.setTextAlignment(Qt.AlignCenter)
-        widgets.append(checkbox_widget)
+        # Set up sorting. The model sorts its own list, which is much faster than letting Qt
+        # compare rows one pair at a time
+        self.horizontalHeader().setSectionsClickable(True)
+        self.horizontalHeader().setSortIndicatorShown(True)
+        self.horizontalHeader().sortIndicatorChanged.connect(self._model.sort)
 
-        return widgets
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
 
-    def get_displayed_files(self) -> list[File]:
-        return list(self.displayed_files.values())
+    @property
+    def extension_index(self) -> ExtensionIndex:
+        return self._extension_index
 
-    def _create_checkbox(self) -> QTableWidgetItem:
-        checkbox = QTableWidgetItem()
-        checkbox.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-        checkbox.setCheckState(Qt.Unchecked)
+    @instrumentation.traced("table.update_table_contents")
+    def update_table_contents(self, files_to_display: list[File]):
+        # Files that are already indexed (e.g. streamed in during the scan) are not indexed again
+        new_paths = {file.path for file in files_to_display}
+        stale_paths = [file.path for file in self._name_index.search("") if file.path not in new_paths]
+        for index in (self._name_index, self._extension_index):
+            index.remove(stale_paths)
+            index.update(files_to_display)
+
+        if self.is_filtering():
+            self._model.set_files(self._filtered_files())
+        else:
+            self._model.set_files(files_to_display)
+
+    @instrumentation.traced("table.add_files")
+    def add_files(self, files_to_add: list[File]) -> None:
+        self._name_index.update(files_to_add)
+        self._extension_index.update(files_to_add)
+        self._model.add_files(self._matching_filters(files_to_add))
+
+    def update_files(self, files_to_update: list[File]) -> None:
+        self._name_index.update(files_to_update)
+        self._extension_index.update(files_to_update)
+        self._model.update_files(self._matching_filters(files_to_update))
+
+    def remove_files(self, paths_to_remove: list[str]) -> None:
+        self._name_index.remove(paths_to_remove)
+        self._extension_index.remove(paths_to_remove)
+        self._model.remove_files(paths_to_remove)
+
+    def is_filtering(self) -> bool:
+        return self._extension is not None or self._category is not None or bool(self._name_search)
+
+    def _filtered_files(self) -> list[File]:
+        """
+        Returns the files matching every filter, starting from whichever index answers the type filter
+        """
+        if self._extension is not None:
+            files = self._extension_index.files_with_extension(self._extension)
+        elif self._category is not None:
+            files = self._extension_index.files_in_category(self._category)
+        else:
+            return self._name_index.search(self._name_search)
+
+        if not self._name_search:
+            return files
+
+        search_string = self._name_search.lower()
+        return [file for file in files if search_string in file.name.lower()]
+
+    def _matching_filters(self, files: list[File]) -> list[File]:
+        if not self.is_filtering():
+            return files
+
+        search_string = self._name_search.lower()
+        return [
+            file for file in files
+            if (self._extension is None or file.type == self._extension)
+            and (self._category is None or get_category(file.type) == self._category)
+            and search_string in file.name.lower()
+        ]
+
+    @instrumentation.traced("table.filter_by_extension")
+    def filter_by_extension(self, extension: Optional[str]) -> None:
+        """
+        Only shows files with the given extension, or every file if extension is None
+        """
+        self._extension, self._category = extension, None
+        self._model.set_files(self._filtered_files())
+
+    @instrumentation.traced("table.filter_by_category")
+    def filter_by_category(self, category: Optional[str]) -> None:
+        """
+        Only shows files whose extension belongs to the given category of functions.directory_dict,
+        or every file if category is None
+        """
+        self._extension, self._category = None, category
+        self._model.set_files(self._filtered_files())
+
+    @instrumentation.traced("table.filter_by_name")
+    def filter_by_name(self, search_string: str) -> None:
+        """
+        Only shows files whose name contains search_string (case-insensitive), or every file if it is empty
+        Every loaded file is searched, whatever the table showed before
+        """
+        if search_string == self._name_search:
+            return
 
-        return checkbox
+        self._name_search = search_string
+        self._model.set_files(self._filtered_files())
 
-    def _handle_user_selection(self, item):
-        if item.column() != 5:
-            return
+    @property
+    def displayed_files(self) -> dict[str, File]:
+        return {file.path: file for file in self.get_displayed_files()}
 
-        file = self.item(item.row(), 0).data(Qt.UserRole)
-        if file and item.checkState() == Qt.Checked:
-            self._selected_files[file.path] = file
-        else:
-            self._selected_files.pop(file.path, None)
+    def get_displayed_files(self) -> list[File]:
+        return self._model.get_files()
 
-    def select_files(self, files_to_select: list[File]) -> None:
-        for file in files_to_select:
-            self._selected_files[file.path] = file
+    def select_files(self, files_to_select: list[File], rules: Optional[list[str]] = None) -> None:
+        self._model.set_selection(files_to_select, True, rules)
 
-        for row in range(self.rowCount()):
-            file = self.item(row, 0).data(Qt.UserRole)
-            if file in files_to_select:
-                self.item(row, 5).setCheckState(Qt.Checked)
-                self._selected_files[file.path] = file
+    def deselect_files(self, files_to_deselect: list[File]) -> None:
+        self._model.set_selection(files_to_deselect, False)
 
     def get_selected_files(self) -> list[File]:
-        return list(self._selected_files.values())
+        return self._model.get_selected_files()
 
     def select_all(self):
-        for row in range(self.rowCount()):
-            self.item(row, 5).setCheckState(Qt.Checked)
-            file = self.item(row, 0).data(Qt.UserRole)
-            self._selected_files[file.path] = file
+        self._model.set_selection(self.get_displayed_files(), True)
 
     def deselect_all(self):
-        for row in range(self.rowCount()):
-            self.item(row, 5).setCheckState(Qt.Unchecked)
-            file = self.item(row, 0).data(Qt.UserRole)
-            self._selected_files.pop(file.path, None)
-
-
-class SortUserRoleItem(QTableWidgetItem):
-    def __lt__(self, other: QTableWidgetItem) -> bool:
-        return self.data(Qt.UserRole) < other.data(Qt.UserRole)
+        self._model.set_selection(self.get_displayed_files(), False)
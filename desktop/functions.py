@@ -7,14 +7,24 @@ through these functions.
 Authors: Evan Donohoe, Adam Lahouar, Nolan Donovan
 """
 
-import operator
 import os
-import shutil
-import zipfile
-from datetime import date, datetime, timedelta
-
+import sqlite3
+from datetime import date, timedelta
+from typing import Callable, Iterable, Optional, Union
+
+from archiver import DEFAULT_ARCHIVE_WORKERS, archive_files
+import instrumentation
+from classifier import INSTALLER_KINDS, KINDS, ClassificationCache, classify_files, content_category, \
+    get_kind_category
+from copier import CopyResult, copy_files
+from duplicates import get_duplicate_files
 from file import Action
 from file import File
+from filestore import FileStore, SORTABLE_ATTRIBUTES
+from organizer import DEFAULT_ORGANIZE_WORKERS, Move, MoveResult, execute_moves, plan_moves
+from removal import RemovalResult, remove_files
+from rules import Rule, RuleMatch, evaluate_rules, make_rule
+from scanner import DEFAULT_MAX_DEPTH, DEFAULT_MAX_WORKERS, DOWNLOADS_FOLDER, ScanRoot, scan_directory, scan_roots
 
 directory_dict = {
     "Images": ["png", "jpg", "jpeg", "gif", "bmp", "tiff", "svg", "icns", "heic"],
@@ -29,36 +39,101 @@ directory_dict = {
     "Fonts": ["ttf", "otf", "woff2", "ttc", "dfont"],
 }
 
+# Folder each extension is organized into. Categories are read in reverse so that the first one
+# listing an extension wins, as it did when directory_dict was searched in order
+EXTENSION_CATEGORIES: dict[str, str] = {
+    extension: category for category, types in reversed(directory_dict.items()) for extension in types
+}
+
+# Folder for extensions that are not in directory_dict
+OTHER_CATEGORY = "Other"
+
+# Extensions whose contents are already compressed, so backups store them without deflating
+STORED_EXTENSIONS = frozenset(
+    extension for category in ("Images", "Video", "Archives") for extension in directory_dict[category]
+)
+
+INSTALLER_SUBSTRINGS = ['setup', 'install', 'windows', 'win']
+INSTALLER_TYPES = ['exe', 'msi']
+# Files whose contents are checked for an installer: executables, and files without an extension
+SNIFFED_INSTALLER_TYPES = ['exe', 'msi', 'dmg', 'pkg', 'mpkg', 'bin', '']
+
+# Opened on first use, None if the cache directory cannot be used
+_classification_cache: Optional[ClassificationCache] = None
+
 """
     Gets all files in a particular path, returns a list of paths
 """
 
 
-def get_all_files_in_path(path: str) -> dict[str, File]:
-    all_files: dict[str, File] = dict()
-    downloads_folder = os.path.join(os.path.expanduser("~"), "Downloads")
-    path_to_traverse = downloads_folder if path == "" else path
+def get_all_files_in_path(path: str, max_depth: int = DEFAULT_MAX_DEPTH,
+                          max_workers: int = DEFAULT_MAX_WORKERS) -> dict[str, File]:
+    path_to_traverse = DOWNLOADS_FOLDER if path == "" else path
 
-    # Get the depth of the downloads folder
-    # Example: C:\\Users\\Administrator\\Downloads
-    # After split: ['C', 'Users', 'Administrator', 'Downloads']
-    # Length: 4
-    downloads_folder_depth = len(downloads_folder.split(os.sep))
+    # We only care about files that are at most max_depth subfolders deep (1 by default)
+    return scan_directory(path_to_traverse, max_depth, max_workers)
 
-    for root, dirs, files in os.walk(path_to_traverse):
-        # Subtract the depth of the downloads folder from the depth of the path to get the relative depth
-        depth = len(root.split(os.sep)) - downloads_folder_depth
 
-        # We only care about files that are at most 1 subfolder deep (from the Downloads folder)
-        if depth > 1:
-            continue
+"""
+    Gets all files in several folders at once, each with its own depth and exclude patterns
+    The folders are scanned concurrently and merged into one dict, each file knowing its root
+"""
+
+
+def get_all_files_in_roots(roots: Iterable[ScanRoot], max_workers: int = DEFAULT_MAX_WORKERS) -> dict[str, File]:
+    return scan_roots(roots, max_workers)
+
+
+"""
+    Gets the folder a file with the given extension is organized into
+"""
+
+
+def get_category(extension: str) -> str:
+    return EXTENSION_CATEGORIES.get(extension.lower(), OTHER_CATEGORY)
+
+
+"""
+    Gets the folder a file is organized into, given the kind of its contents (see classifier.py)
+    The extension decides unless it does not fit the contents, or is unknown and the contents are not
+"""
 
-        for file in files:
-            # Join the current directory path with the file name to get the full file path
-            file_path = os.path.join(root, file)
-            all_files[file_path] = File(file_path)
 
-    return all_files
+def get_file_category(file: File, kind: Optional[str]) -> str:
+    category = content_category(kind, file.type)
+    if category is not None:
+        return category
+
+    category = get_category(file.type)
+    if category == OTHER_CATEGORY and kind in KINDS:
+        return get_kind_category(kind)
+    return category
+
+
+"""
+    Returns the cache of classified files kept in the user cache directory, or None if it cannot be opened
+"""
+
+
+def get_classification_cache() -> Optional[ClassificationCache]:
+    global _classification_cache
+    if _classification_cache is None:
+        try:
+            _classification_cache = ClassificationCache()
+        except (OSError, sqlite3.Error):
+            return None
+    return _classification_cache
+
+
+"""
+    Gets the kind of contents of every file by path, reading only the files that are new or changed
+    since they were last classified
+"""
+
+
+def classify(files: Iterable[File], on_progress: Optional[Callable[[int, int], None]] = None,
+             is_cancelled: Optional[Callable[[], bool]] = None) -> dict[str, Optional[str]]:
+    return classify_files(files, get_classification_cache(), on_progress=on_progress, is_cancelled=is_cancelled)
 
 
 """
@@ -66,12 +141,17 @@ def get_all_files_in_path(path: str) -> dict[str, File]:
 """
 
 
-def archive_all(list_of_files: list[File], archive_name=f"downloads_archive_{date.today()}.zip") -> None:
-    with zipfile.ZipFile(archive_name, "w", compression=zipfile.ZIP_DEFLATED) as archive:
-        for file in list_of_files:
-            archive.write(file.path, os.path.relpath(file.path, os.path.commonpath([f.path for f in list_of_files])))
+def archive_all(list_of_files: list[File], archive_name=f"downloads_archive_{date.today()}.zip",
+                max_workers: int = DEFAULT_ARCHIVE_WORKERS,
+                on_progress: Optional[Callable[[int, int], None]] = None,
+                is_cancelled: Optional[Callable[[], bool]] = None, resume: bool = True) -> list[str]:
+    # Already compressed types are stored as they are, deflating them only costs time
+    skipped = archive_files(list_of_files, archive_name, STORED_EXTENSIONS, max_workers, on_progress, is_cancelled,
+                            resume)
 
-    print(f"Archive '{archive_name}' created successfully.")
+    if not (is_cancelled and is_cancelled()):
+        print(f"Archive '{archive_name}' created successfully.")
+    return skipped
 
 
 """
@@ -82,64 +162,77 @@ def archive_all(list_of_files: list[File], archive_name=f"downloads_archive_{dat
 
 
 def remove_installers(list_of_files: list[File]) -> list[File]:
-    substrings = ['setup', 'install', 'windows', 'win']
-    installer_types = ['exe', 'msi']
     for file in list_of_files:
-        contains_substring = any(substring in file.name.lower() for substring in substrings)
-        if file.type in installer_types and contains_substring:
+        contains_substring = any(substring in file.name.lower() for substring in INSTALLER_SUBSTRINGS)
+        if file.type in INSTALLER_TYPES and contains_substring:
             file.action = Action.DELETE
 
     return list_of_files
 
 
-def identify_installers(list_of_files: list[File]) -> list[File]:
-    substrings = ['setup', 'install', 'windows', 'win']
-    installer_types = ['exe', 'msi']
-    installers = []
-    for file in list_of_files:
-        contains_substring = any(substring in file.name.lower() for substring in substrings)
-        if file.type in installer_types and contains_substring:
-            installers.append(file)
+"""
+    The identify functions below accept either a list of files or a FileStore
+    Passing a FileStore that is kept between calls avoids rebuilding its arrays on every query
+"""
 
-    return installers
 
+def _as_store(files: Union[Iterable[File], FileStore]) -> FileStore:
+    return files if isinstance(files, FileStore) else FileStore(files)
 
-def identify_old_files(list_of_files: list[File], threshold: timedelta) -> list[File]:
-    """
-    Returns a list of files that have not been created or accessed within the given threshold
-    """
-    old_files: list[File] = list()
 
-    current_datetime = datetime.now()
+"""
+    Returns the rules an installer matches: an installer extension and name, or installer contents
+    Only executables and files without an extension are read, as other files are not installers
+"""
+
+
+def get_installer_rules() -> list[Rule]:
+    return [
+        make_rule("Installers", extensions=INSTALLER_TYPES, name_contains=INSTALLER_SUBSTRINGS),
+        make_rule("Installers", extensions=SNIFFED_INSTALLER_TYPES, kinds=INSTALLER_KINDS),
+        # Programs that are not recognizably installers still count if their name says so
+        make_rule("Installers", extensions=SNIFFED_INSTALLER_TYPES, name_contains=INSTALLER_SUBSTRINGS,
+                  kinds=["exe"]),
+    ]
 
-    for file in list_of_files:
-        date_added_delta = current_datetime - datetime.fromtimestamp(file.date_added)
-        last_accessed_delta = current_datetime - datetime.fromtimestamp(file.last_accessed)
 
-        if date_added_delta > threshold and last_accessed_delta > threshold:
-            old_files.append(file)
+@instrumentation.traced("identify.installers")
+def identify_installers(list_of_files: Union[list[File], FileStore],
+                        on_progress: Optional[Callable[[int, int], None]] = None,
+                        is_cancelled: Optional[Callable[[], bool]] = None) -> list[File]:
+    return [match.file for match in evaluate_rules(get_installer_rules(), _as_store(list_of_files),
+                                                   classify=classify, on_progress=on_progress,
+                                                   is_cancelled=is_cancelled)]
 
-    return old_files
+
+@instrumentation.traced("identify.old_files")
+def identify_old_files(list_of_files: Union[list[File], FileStore], threshold: timedelta) -> list[File]:
+    """
+    Returns a list of files that have not been created or accessed within the given threshold
+    """
+    return _as_store(list_of_files).identify_old_files(threshold)
 
 
 """
     Removes any files from given list
+    Returns a result for each file, saying whether it was removed or why not
 """
 
 
-def delete_files(files: list[File]):
-    for file in files:
-        file.delete()
+def delete_files(files: list[File], on_progress: Optional[Callable[[int, int], None]] = None,
+                 is_cancelled: Optional[Callable[[], bool]] = None) -> list[RemovalResult]:
+    return remove_files(files, Action.DELETE, on_progress=on_progress, is_cancelled=is_cancelled)
 
 
 """
     Recycles any files from given list
+    Returns a result for each file, saying whether it was recycled or why not
 """
 
 
-def recycle_files(files: list[File]):
-    for file in files:
-        file.recycle()
+def recycle_files(files: list[File], on_progress: Optional[Callable[[int, int], None]] = None,
+                  is_cancelled: Optional[Callable[[], bool]] = None) -> list[RemovalResult]:
+    return remove_files(files, Action.RECYCLE, on_progress=on_progress, is_cancelled=is_cancelled)
 
 
 """
@@ -227,56 +320,82 @@ def get_selected(files_dict: dict[str, File]) -> dict:
 
 
 """
-Prompts the user to select a directory and copies the given files to that directory.
+    Copies the given files into destination_directory in the background-friendly way described in copier.py
+    Returns a result for each file, saying whether it was copied, skipped as identical or why it failed
+"""
+
 
-:param files: Dict of file paths to copy
-:param destination_directory: 
+def copy_files_to_directory(destination_directory: str, files: Iterable[File],
+                            on_progress: Optional[Callable[[int, int], None]] = None,
+                            is_cancelled: Optional[Callable[[], bool]] = None) -> list[CopyResult]:
+    return copy_files(files, destination_directory, on_progress=on_progress, is_cancelled=is_cancelled)
+
+
+@instrumentation.traced("identify.large_files")
+def identify_large_files(file_list: Union[list[File], FileStore], size_threshold: int) -> list[File]:
+    return _as_store(file_list).identify_large_files(size_threshold)
+
+
+"""
+    Returns the rules behind Identify All: installers, duplicates by content, and files older or larger
+    than the given thresholds, in that order
 """
 
 
-def copy_files_to_directory(destination_directory: str, files: dict):
-    if not destination_directory:
-        print("No directory selected. Exiting.")
-        return
+def get_default_rules(date_threshold: timedelta, size_threshold: int) -> list[Rule]:
+    return get_installer_rules() + [
+        make_rule("Duplicates", duplicate=True),
+        make_rule("Old files", older_than=date_threshold),
+        make_rule("Large files", larger_than=size_threshold),
+    ]
 
-    for file_path, file in files.items():
-        try:
-            shutil.copy(file_path, destination_directory)
-            print(f"Successfully copied {file_path} to {destination_directory}")
-        except Exception as e:
-            print(f"Error copying {file_path}. Error: {e}")
 
+"""
+    Identifies everything the default rules and the given user rules match in a single evaluation
+    Returns a match for every identified file, naming the first rule it matched
+"""
 
-def identify_large_files(file_list: list[File], size_threshold: int) -> list[File]:
-    large_files: list[File] = list()
-    for file in file_list:
-        if file.size > size_threshold:
-            large_files.append(file)
 
-    return large_files
+def identify_all(list_of_files: Union[list[File], FileStore], date_threshold: timedelta, size_threshold: int,
+                 user_rules: Iterable[Rule] = (), on_progress: Optional[Callable[[int, int], None]] = None,
+                 is_cancelled: Optional[Callable[[], bool]] = None) -> list[RuleMatch]:
+    rules = get_default_rules(date_threshold, size_threshold) + list(user_rules)
+    return evaluate_rules(rules, _as_store(list_of_files), classify=classify, on_progress=on_progress,
+                          is_cancelled=is_cancelled)
 
 
-def organize_into_folders(files: list[File]) -> None:
-    for file in files:
-        downloads_folder = os.path.dirname(file.path)
-        organized = False
+"""
+    Plans the moves of the files directly inside root into a folder per category, see organizer.py
+    root may also be a list of folders, each of which is organized on its own
+    Only the files to be moved are classified, so their contents can overrule a wrong or missing extension
+"""
 
-        # Make sure current file isn't nested in a directory in the Downloads folder.
-        if downloads_folder.endswith("Downloads"):
-            for category, types in directory_dict.items():
-                if file.type.lower() in types:
-                    if not os.path.exists(f"{downloads_folder}\\{category}"):
-                        os.makedirs(f"{downloads_folder}\\{category}")
-                    dst = downloads_folder + f'\\{category}\\{file.name}.{file.type}'
-                    shutil.move(file.path, dst)
-                    organized = True
-                    break
 
-            if not organized:
-                if not os.path.exists(f"{downloads_folder}\\Other"):
-                    os.makedirs(f"{downloads_folder}\\Other")
-                dst = downloads_folder + f'\\Other\\{file.name}.{file.type}'
-                shutil.move(file.path, dst)
+def plan_organize(files: Iterable[File], root: Union[str, Iterable[str]] = DOWNLOADS_FOLDER) -> list[Move]:
+    roots = [os.path.abspath(folder) for folder in ([root] if isinstance(root, str) else root)]
+    files = [file for file in files if file.directory in roots]
+    kinds = classify(files)
+
+    def get_kind_aware_category(file: File) -> str:
+        return get_file_category(file, kinds.get(file.path))
+
+    return [move for folder in roots for move in plan_moves(files, folder, get_kind_aware_category)]
+
+
+"""
+    Moves the files directly inside root into a folder per category, see organizer.py
+    root may also be a list of folders, each of which is organized on its own
+    Returns a result for each planned move, saying whether the file was moved or why not
+"""
+
+
+def organize_into_folders(files: Iterable[File], root: Union[str, Iterable[str]] = DOWNLOADS_FOLDER,
+                          max_workers: int = DEFAULT_ORGANIZE_WORKERS,
+                          on_progress: Optional[Callable[[int, int], None]] = None,
+                          is_cancelled: Optional[Callable[[], bool]] = None) -> list[MoveResult]:
+    # Planned for every root first, so the moves run as one batch with one progress total
+    moves = plan_organize(files, root)
+    return execute_moves(moves, max_workers, on_progress, is_cancelled)
 
 
 """
@@ -285,28 +404,44 @@ def organize_into_folders(files: list[File]) -> None:
 
 
 def sortByAttribute(list_of_files, attribute, descending=False):
-    attributes = ["name", "size", "type", "last_accessed"]
+    if attribute in SORTABLE_ATTRIBUTES:
+        return _as_store(list_of_files).sort_by(attribute, descending)
 
-    if attribute in attributes:
-        # Define a mapping of attribute names to corresponding operators
-        attribute_mapping = {
-            "name": operator.attrgetter("name"),
-            "size": operator.attrgetter("size"),
-            "type": operator.attrgetter("type"),
-            "last_accessed": operator.attrgetter("last_accessed")
-        }
+    return list_of_files
 
-        # Sort the list of files based on the selected attribute
-        if descending:
-            list_of_files = sorted(list_of_files, key=attribute_mapping[attribute], reverse=True)
-        else:
-            list_of_files = sorted(list_of_files, key=attribute_mapping[attribute])
 
-        return list_of_files
+"""
+    Returns the files whose contents duplicate another file, keeping one original per group
+    Unlike get_duplicates, files are compared by content rather than by name
+"""
 
-    return list_of_files
+
+def identify_duplicates(files: Iterable[File], on_progress: Optional[Callable[[int, int], None]] = None,
+                        is_cancelled: Optional[Callable[[], bool]] = None) -> list[File]:
+    return get_duplicate_files(files, on_progress=on_progress, is_cancelled=is_cancelled)
+
+
+"""
+    Returns the images that look like another image, keeping the largest file of each group as the original
+    Unlike identify_duplicates, resized and re-encoded copies are found too, see similarimages.py
+"""
+
+
+def identify_similar_images(files: Iterable[File], on_progress: Optional[Callable[[int, int], None]] = None,
+                            is_cancelled: Optional[Callable[[], bool]] = None) -> list[File]:
+    # Imported here as decoding images needs PyQt5, which the command line tool never loads
+    from similarimages import ImageHashCache, get_similar_images
+
+    try:
+        cache = ImageHashCache()
+    except (OSError, sqlite3.Error):
+        cache = None
+
+    images = [file for file in files if get_category(file.type) == "Images"]
+    return get_similar_images(images, cache=cache, on_progress=on_progress, is_cancelled=is_cancelled)
 
 
+@instrumentation.traced("identify.get_duplicates")
 def get_duplicates(files) -> list[File]:
     duplicates = []
     seen = {}
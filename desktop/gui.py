@@ -7,16 +7,36 @@ which connect to the FileTable object and the functions file.
 Authors: Evan Donohoe, Nolan Donovan, Adam Lahouar
 """
 
-from datetime import date, timedelta
+import os
+import sqlite3
+import time
+import traceback
+from collections import Counter
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Any, Callable, NamedTuple, Optional
 
 from PyQt5.QtCore import *
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QWidget, QDesktopWidget, QMenuBar, QPushButton, QLineEdit, \
-    QHBoxLayout, QLabel, QComboBox, QMessageBox, QTableWidgetItem, QFileDialog, QActionGroup, QMenu, QAction
+    QHBoxLayout, QLabel, QComboBox, QMessageBox, QFileDialog, QActionGroup, QMenu, QAction, QApplication, \
+    QProgressBar, QProgressDialog, QInputDialog
 
 import functions
+import instrumentation
+from archiver import discard_unfinished_archive, unfinished_archives, verify_archive
+from backup import BackupResult, BackupStore
+from copier import CopyResult
 from file import File
+from filestore import FileStore
 from filetable import FileTable
+from organizer import MoveResult
+from removal import CANCELLED, RemovalResult
+from roots import load_roots, make_root, save_roots
+from rules import Rule, RuleMatch, load_rules
+from scanindex import ScanIndex
+from scanner import DEFAULT_MAX_DEPTH, ScanRoot, scan_directory, scan_roots
+from watcher import DownloadsWatcher
 
 DATE_THRESHOLDS: dict[str, timedelta] = {
     "1 Month": timedelta(days=30),
@@ -33,6 +53,26 @@ SIZE_THRESHOLDS: dict[str, int] = {
     "1 GB": 1024 ** 3
 }
 
+# Directory listing is mostly waiting on the disk (or the server, for network mounts),
+# so the scan uses more threads than there are cores
+SCAN_WORKERS = 8
+
+# Scanned files are handed to the table in batches of up to SCAN_BATCH_SIZE files,
+# at least every SCAN_BATCH_INTERVAL seconds
+SCAN_BATCH_SIZE = 5000
+SCAN_BATCH_INTERVAL = 0.1
+
+# The file name search runs once typing has paused for this long
+SEARCH_DELAY_MS = 150
+
+# File names listed in the delete/recycle confirmation, the rest are only counted
+WARNING_POPUP_MAX_FILES = 20
+
+# Data of the "Show:" drop-down entries, the name of the category or extension follows the prefix
+ALL_FILTER = ""
+CATEGORY_FILTER = "category:"
+EXTENSION_FILTER = "extension:"
+
 
 class MainWindow(QMainWindow):
 
@@ -52,10 +92,38 @@ class MainWindow(QMainWindow):
         # initialize menu bar
         self._init_menu_bar()
 
-        self.files = functions.get_all_files_in_path("")  # Empty string as argument means target downloads folder.
+        # Folders the window manages. Only a folder given when opening the window is managed
+        # for this session alone, otherwise they come from (and changes go to) the settings
+        self.roots: list[ScanRoot] = [make_root(path)] if path else load_roots()
+        self._save_roots = not path
+        self._rescan_pending = False
+
+        # The window opens with an empty table, which the background scan fills in batches
+        self.scan_index = self._open_scan_index()
+        self.scan_thread: Optional[ScanThread] = None
+        self.archive_thread: Optional[ArchiveThread] = None
+        self.backup_thread: Optional[BackupThread] = None
+        self.restore_thread: Optional[RestoreThread] = None
+        self.removal_thread: Optional[RemovalThread] = None
+        self.organize_thread: Optional[OrganizeThread] = None
+        self.copy_thread: Optional[CopyThread] = None
+        self.similar_images_thread: Optional[SimilarImagesThread] = None
+        self.duplicates_thread: Optional[DuplicatesThread] = None
+        self.identify_all_thread: Optional[IdentifyAllThread] = None
+        self.installers_thread: Optional[InstallersThread] = None
+        self._streaming_scan = False
+        self._scanned_count = 0
+        self.files: dict[str, File] = dict()
+
+        # Applies file system changes to the table between scans
+        self.watcher = DownloadsWatcher(self.roots, parent=self)
+        self.watcher.files_changed.connect(self._apply_file_changes)
 
         self.currentFiles = self.files
 
+        # Columnar copy of self.files used by the identify queries, rebuilt whenever self.files changes
+        self._file_store: Optional[FileStore] = None
+
         # initialize file table
         self.table = FileTable(self.files)
 
@@ -75,6 +143,10 @@ class MainWindow(QMainWindow):
         widget.setLayout(self.central_layout)
         self.setCentralWidget(widget)
 
+        self._init_scan_status()
+
+        self._start_scan()
+
     def _init_window(self):
         # set window title
         self.setWindowTitle("OrganizeMyDownloads")
@@ -96,6 +168,7 @@ class MainWindow(QMainWindow):
         identify_menu = self.menu_bar.addMenu("Identify")
         identify_menu.addAction("Identify All").triggered.connect(self._identify_all)
         identify_menu.addAction("Identify Duplicate Files").triggered.connect(self._identify_duplicates)
+        identify_menu.addAction("Identify Similar Images").triggered.connect(self._identify_similar_images)
         identify_menu.addAction("Identify Installers").triggered.connect(self._identify_installers)
         identify_menu.addAction("Identify Old Files").triggered.connect(self._identify_old_files)
 
@@ -133,8 +206,10 @@ class MainWindow(QMainWindow):
 
         # add "Backup" menu with actions
         backup_menu = self.menu_bar.addMenu("Backup")
-        backup_menu.addAction("Backup Downloads Folder").triggered.connect(self._archive_all)
-        backup_menu.addAction("Restore Backup")
+        backup_menu.addAction("Backup Downloads Folder").triggered.connect(self._backup)
+        backup_menu.addAction("Restore Backup").triggered.connect(self._restore_backup)
+        backup_menu.addSeparator()
+        backup_menu.addAction("Export Downloads Folder as Zip").triggered.connect(self._archive_all)
 
         # add "Select" menu with actions
         select_menu = self.menu_bar.addMenu("Select")
@@ -145,6 +220,25 @@ class MainWindow(QMainWindow):
         organize_menu = self.menu_bar.addMenu("Organize")
         organize_menu.addAction("Organize Into Folders Based on File Type").triggered.connect(self._organize)
 
+        # add "View" menu with actions
+        view_menu = self.menu_bar.addMenu("View")
+        self.watch_action = view_menu.addAction("Watch For Changes")
+        self.watch_action.setCheckable(True)
+        self.watch_action.setChecked(True)
+        self.watch_action.toggled.connect(self._handle_watch_toggled)
+
+        # Filled in with the managed folders whenever it opens
+        self.folders_menu = view_menu.addMenu("Folders")
+        self.folders_menu.aboutToShow.connect(self._populate_folders_menu)
+
+        # add "Debug" menu with actions
+        debug_menu = self.menu_bar.addMenu("Debug")
+        self.trace_action = debug_menu.addAction("Record Performance Trace")
+        self.trace_action.setCheckable(True)
+        # Already recording if the trace environment variable is set
+        self.trace_action.setChecked(instrumentation.is_enabled())
+        self.trace_action.toggled.connect(self._handle_trace_toggled)
+
         self.central_layout.addWidget(self.menu_bar)
 
     def _handle_date_threshold_change(self):
@@ -157,7 +251,7 @@ class MainWindow(QMainWindow):
         warning_str = '''
         Please read before proceeding!
         
-        The following function will move all of the files inside your downloads folder into different subdirectories within the downloads folder. We HIGHLY recommend you backup your downloads folder prior to this procedure. You can do this by going to Backup > Backup Downloads Folder.
+        The following function will move all of the files directly inside each of the managed folders into different subdirectories within that folder. We HIGHLY recommend you backup these folders prior to this procedure. You can do this by going to Backup > Backup Downloads Folder.
         
         Are you sure you wish to proceed?
         '''
@@ -167,31 +261,117 @@ class MainWindow(QMainWindow):
         self.msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
         ret = self.msg.exec_()
 
-        if ret == QMessageBox.Yes:
-            functions.organize_into_folders(list(self.files.values()))
+        if ret != QMessageBox.Yes or (self.organize_thread and self.organize_thread.isRunning()):
+            return
+
+        self.organize_thread = OrganizeThread(self.files.values(), [root.path for root in self.roots])
+        self._start_progress_job(self.organize_thread, "Organizing the Downloads folder...", "Organize Status",
+                                 self._organize_finished)
+
+    def _organize_finished(self, results: list[MoveResult], cancelled: bool) -> "JobMessage":
+        # Moved files keep their metadata, only their paths change, so the table is updated without a rescan
+        moved = [result.move for result in results if result.moved]
+        failed = [result for result in results if not result.moved and not (cancelled and result.error == CANCELLED)]
+        moved_files = [
+            File.from_metadata(move.destination, move.file.size, move.file.last_accessed, move.file.date_added,
+                               move.file.root)
+            for move in moved
+        ]
+        for move in moved:
+            self.files.pop(move.file.path, None)
+        for file in moved_files:
+            self.files[file.path] = file
+        self._file_store = None
+        self.table.remove_files([move.file.path for move in moved])
+        self.table.update_files(moved_files)
+
+        text = f"{len(moved)} files organized into folders."
+        if cancelled:
+            text = f"Cancelled. {text}"
+        if failed:
+            text += f"\n\n{len(failed)} files could not be moved."
+        return JobMessage(text, "\n".join(f"{result.move.file.path}: {result.error}" for result in failed),
+                          bool(failed))
 
     def _identify_all(self):
-        self._identify_installers()
-        self._identify_duplicates()
-        self._identify_old_files()
-        self._identify_large_files()
+        # Duplicates are verified by hashing their contents and kinds by reading files, which can take a while
+        # on large folders, so the rules are evaluated in the background
+        if self.identify_all_thread and self.identify_all_thread.isRunning():
+            return
+
+        # The built-in and the user's rules are evaluated together and selected in one update
+        self.identify_all_thread = IdentifyAllThread(self._get_file_store(), self.selected_date_threshold,
+                                                     self.selected_size_threshold, load_rules())
+        self._start_progress_job(self.identify_all_thread, "Applying the cleanup rules...", "Identify Status",
+                                 self._identify_all_finished)
+
+    def _identify_all_finished(self, matches: list[RuleMatch], cancelled: bool) -> None:
+        if cancelled:
+            return
+
+        self.table.select_files([match.file for match in matches], [match.rule for match in matches])
+
+        counts = Counter(match.rule for match in matches)
+        summary = ", ".join(f"{rule}: {count}" for rule, count in counts.most_common())
+        self.scan_label.setText(f"Identified {len(matches)} files" + (f" ({summary})" if summary else ""))
 
     def _identify_installers(self):
-        installers = functions.identify_installers(list(self.files.values()))
-        self.table.select_files(installers)
+        # Candidates are recognized by reading the start of their contents, which can take a while on large folders
+        if self.installers_thread and self.installers_thread.isRunning():
+            return
+
+        self.installers_thread = InstallersThread(self._get_file_store())
+        self._start_progress_job(self.installers_thread, "Looking for installers...", "Identify Status",
+                                 self._installers_finished)
+
+    def _installers_finished(self, installers: list[File], cancelled: bool) -> None:
+        if not cancelled:
+            self.table.select_files(installers)
 
     def _identify_duplicates(self):
-        duplicate_files = functions.get_duplicates(self.files.values())
+        # Duplicates are verified by hashing their contents, which can take a while on large folders
+        if self.duplicates_thread and self.duplicates_thread.isRunning():
+            return
+
+        self.duplicates_thread = DuplicatesThread(self.files.values())
+        self._start_progress_job(self.duplicates_thread, "Comparing file contents...", "Identify Status",
+                                 self._duplicates_finished)
+
+    def _duplicates_finished(self, duplicate_files: list[File], cancelled: bool) -> None:
+        if cancelled:
+            return
+
         self.table.select_files(duplicate_files)
 
+    def _identify_similar_images(self):
+        # Every image is decoded the first time, so this runs in the background like the file operations
+        if self.similar_images_thread and self.similar_images_thread.isRunning():
+            return
+
+        self.similar_images_thread = SimilarImagesThread(self.files.values())
+        self._start_progress_job(self.similar_images_thread, "Comparing images...", "Identify Status",
+                                 self._similar_images_finished)
+
+    def _similar_images_finished(self, similar_images: list[File], cancelled: bool) -> None:
+        if cancelled:
+            return
+
+        self.table.select_files(similar_images)
+        self.scan_label.setText(f"Identified {len(similar_images)} similar images")
+
     def _identify_old_files(self):
-        old_files = functions.identify_old_files(list(self.files.values()), self.selected_date_threshold)
+        old_files = functions.identify_old_files(self._get_file_store(), self.selected_date_threshold)
         self.table.select_files(old_files)
 
     def _identify_large_files(self):
-        large_files = functions.identify_large_files(list(self.files.values()), self.selected_size_threshold)
+        large_files = functions.identify_large_files(self._get_file_store(), self.selected_size_threshold)
         self.table.select_files(large_files)
 
+    def _get_file_store(self) -> FileStore:
+        if self._file_store is None:
+            self._file_store = FileStore(self.files.values())
+        return self._file_store
+
     def _init_copy_button(self):
         # Create search button
         self.copy_button = QPushButton("   Copy selected files to folder   ", self)
@@ -202,6 +382,15 @@ class MainWindow(QMainWindow):
     def _init_search_bar(self):
         # initialize menu bar
         self.search_bar = QLineEdit(self)
+        self.search_bar.setPlaceholderText("Search file names")
+
+        # Search as the user types, but not on every single keystroke of a burst
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self._filename_search)
+        self.search_bar.textChanged.connect(lambda: self.search_timer.start())
+        self.search_bar.returnPressed.connect(self._filename_search)
 
         self.search_button = QPushButton("Search", self)
         self.search_button.clicked.connect(self._filename_search)
@@ -213,7 +402,7 @@ class MainWindow(QMainWindow):
         self.comboBox = QComboBox()
 
         # Connect the combo box signal to the search function
-        self.comboBox.currentTextChanged.connect(self._extension_search)
+        self.comboBox.currentIndexChanged.connect(self._extension_search)
 
         self.search_layout.addWidget(self.comboBox)
         self.search_layout.addWidget(self.search_bar)
@@ -223,9 +412,210 @@ class MainWindow(QMainWindow):
 
         self.central_layout.addLayout(self.search_layout)
 
-    def _refresh_table(self):
-        self.files = functions.get_all_files_in_path("")
+    def _open_scan_index(self) -> Optional[ScanIndex]:
+        try:
+            return ScanIndex()
+        except (OSError, sqlite3.Error):
+            # Without a writable cache directory every scan is a full scan
+            return None
+
+    def _init_scan_status(self):
+        self.scan_progress = QProgressBar(self)
+        self.scan_progress.setRange(0, 0)  # No known total, so show a busy indicator
+        self.scan_progress.setMaximumWidth(150)
+
+        self.scan_label = QLabel(self)
+
+        self.scan_cancel_button = QPushButton("Cancel", self)
+        self.scan_cancel_button.clicked.connect(self._cancel_scan)
+
+        self.statusBar().addWidget(self.scan_label)
+        self.statusBar().addPermanentWidget(self.scan_progress)
+        self.statusBar().addPermanentWidget(self.scan_cancel_button)
+
+    def _start_scan(self):
+        if self.scan_thread and self.scan_thread.isRunning():
+            return
+
+        # Stream rows into the table while it is empty. A refresh keeps showing the current files and
+        # swaps them out once the scan is done, which is quick when the index is up to date.
+        self._streaming_scan = not self.files
+        self._scanned_count = 0
+
+        # The scan result replaces whatever the watcher knew, it restarts once the scan is done
+        self.watcher.stop()
+
+        # An empty table first shows what the index saved last time, the scan then brings it up to date
+        self.scan_thread = ScanThread(self.scan_index, self.roots, load_snapshot=self._streaming_scan)
+        self.scan_thread.snapshot_loaded.connect(self._on_snapshot_loaded)
+        self.scan_thread.files_found.connect(self._on_files_found)
+        self.scan_thread.scan_finished.connect(self._on_scan_finished)
+
+        self.scan_label.setText("Scanning...")
+        self.scan_progress.show()
+        self.scan_cancel_button.show()
+        self.refresh_button.setEnabled(False)
+
+        self.scan_thread.start()
+
+    def _cancel_scan(self):
+        if self.scan_thread:
+            self.scan_thread.cancel()
+
+    def _on_snapshot_loaded(self, files: dict[str, File]):
+        if not files or not self._streaming_scan:
+            return
+
+        # The scan now refreshes the snapshot, which is swapped out once the scan is done
+        self._streaming_scan = False
+        self.files = files
+        self.currentFiles = self.files
+        self._file_store = None
         self.table.update_table_contents(list(self.files.values()))
+        self._update_extensions()
+
+    def _on_files_found(self, files: list[File]):
+        self._scanned_count += len(files)
+        self.scan_label.setText(f"Scanning... {self._scanned_count} files found")
+
+        if not self._streaming_scan:
+            return
+
+        for file in files:
+            self.files[file.path] = file
+        self._file_store = None
+        self.table.add_files(files)
+        self._refresh_extensions({file.type for file in files})
+
+    def _on_scan_finished(self, files: dict[str, File], cancelled: bool):
+        if self._rescan_pending:
+            # The folders changed while scanning, the scan of the new ones replaces this one
+            self._rescan_pending = False
+            self.scan_thread = None
+            self._start_scan()
+            return
+
+        if self._streaming_scan or not cancelled:
+            self.files = files
+            self.currentFiles = self.files
+            self._file_store = None
+
+            # Streamed rows are already in the table
+            if not self._streaming_scan:
+                self.table.update_table_contents(list(self.files.values()))
+                self._update_extensions()
+
+        if self.watch_action.isChecked():
+            self.watcher.start(self.files)
+
+        status = "Scan cancelled, showing" if cancelled else "Showing"
+        self.scan_label.setText(f"{status} {len(self.files)} files")
+        self.scan_progress.hide()
+        self.scan_cancel_button.hide()
+        self.refresh_button.setEnabled(True)
+
+    def _refresh_table(self):
+        self._start_scan()
+
+    def _handle_watch_toggled(self, checked: bool):
+        if not checked:
+            self.watcher.stop()
+        elif not (self.scan_thread and self.scan_thread.isRunning()):
+            self.watcher.start(self.files)
+
+    def _populate_folders_menu(self):
+        self.folders_menu.clear()
+        self.folders_menu.addAction("Add Folder...").triggered.connect(self._add_root)
+        self.folders_menu.addSeparator()
+
+        for root in self.roots:
+            label = f"Stop Managing {root.path} (depth {root.max_depth})"
+            action = self.folders_menu.addAction(label)
+            # At least one folder is always managed
+            action.setEnabled(len(self.roots) > 1)
+            action.triggered.connect(lambda _, removed=root: self._remove_root(removed))
+
+    def _add_root(self):
+        directory = QFileDialog.getExistingDirectory(self, "Add Folder", os.path.expanduser("~"))
+        if not directory:
+            return
+
+        depth, accepted = QInputDialog.getInt(self, "Add Folder", "Subfolder levels to scan:", DEFAULT_MAX_DEPTH, 0, 32)
+        if not accepted:
+            return
+
+        root = make_root(directory, depth)
+        self._set_roots([r for r in self.roots if r.path != root.path] + [root])
+
+    def _remove_root(self, root: ScanRoot):
+        if len(self.roots) > 1:
+            self._set_roots([r for r in self.roots if r != root])
+
+    def _set_roots(self, roots: list[ScanRoot]):
+        self.roots = roots
+        self.watcher.roots = roots
+        if self._save_roots:
+            try:
+                save_roots(roots)
+            except OSError:
+                # Still used for this session
+                pass
+
+        if self.scan_thread and self.scan_thread.isRunning():
+            self._rescan_pending = True
+            self.scan_thread.cancel()
+        else:
+            self._start_scan()
+
+    def _handle_trace_toggled(self, checked: bool):
+        if checked:
+            instrumentation.reset()
+            instrumentation.enable()
+            return
+
+        instrumentation.disable()
+        path, _ = QFileDialog.getSaveFileName(self, "Save Performance Trace",
+                                              f"trace-{datetime.now():%Y%m%d-%H%M%S}.json", "Chrome Trace (*.json)")
+        if not path:
+            return
+
+        self.popup = QMessageBox()
+        self.popup.setWindowTitle("Performance Trace")
+        try:
+            instrumentation.write_chrome_trace(path)
+        except OSError as error:
+            self.popup.setText(f"The trace could not be saved: {error}")
+        else:
+            self.popup.setText(f"Trace saved to {path}. Open it in chrome://tracing or ui.perfetto.dev.")
+            self.popup.setDetailedText(instrumentation.format_summary())
+        self.popup.show()
+
+    def _apply_file_changes(self, updated: list[File], removed: list[str]):
+        changed_extensions = {file.type for file in updated}
+        for path in removed:
+            file = self.files.pop(path, None)
+            if file is not None:
+                changed_extensions.add(file.type)
+        for file in updated:
+            self.files[file.path] = file
+
+        self._file_store = None
+        self.table.remove_files(removed)
+        self.table.update_files(updated)
+        self._refresh_extensions(changed_extensions)
+        self.scan_label.setText(f"Showing {len(self.files)} files")
+
+    def closeEvent(self, event):
+        if self.scan_thread and self.scan_thread.isRunning():
+            self.scan_thread.cancel()
+            self.scan_thread.wait()
+        for thread in (self.archive_thread, self.backup_thread, self.restore_thread, self.removal_thread,
+                       self.organize_thread, self.copy_thread, self.similar_images_thread, self.duplicates_thread,
+                       self.identify_all_thread, self.installers_thread):
+            if thread and thread.isRunning():
+                thread.cancel()
+                thread.wait()
+        super(MainWindow, self).closeEvent(event)
 
     def _init_refresh_button(self):
         self.refresh_button = QPushButton(QIcon.fromTheme("view-refresh"), "Refresh")
@@ -241,12 +631,42 @@ class MainWindow(QMainWindow):
     def _delete_selected(self):
         files_to_delete = self.table.get_selected_files()
         if self._show_warning_popup(files_to_delete, True):
-            functions.delete_files(files_to_delete)
+            self._start_removal(files_to_delete, True)
 
     def _recycle_selected(self):
         files_to_recycle = self.table.get_selected_files()
         if self._show_warning_popup(files_to_recycle, False):
-            functions.recycle_files(files_to_recycle)
+            self._start_removal(files_to_recycle, False)
+
+    def _start_removal(self, files: list[File], delete: bool):
+        if self.removal_thread and self.removal_thread.isRunning():
+            return
+
+        self.removal_thread = RemovalThread(files, delete)
+        keyword = "Deleting" if delete else "Recycling"
+        self._start_progress_job(self.removal_thread, f"{keyword} {len(files)} files...", "Removal Status",
+                                 self._removal_finished)
+
+    def _removal_finished(self, results: list[RemovalResult], cancelled: bool) -> "JobMessage":
+        removed = [result.file for result in results if result.removed]
+        failed = [result for result in results if not result.removed and not (cancelled and result.error == CANCELLED)]
+
+        # Only the removed files leave the table, in one update
+        for file in removed:
+            self.files.pop(file.path, None)
+        self._file_store = None
+        self.table.remove_files([file.path for file in removed])
+        self._refresh_extensions({file.type for file in removed})
+        self.scan_label.setText(f"Showing {len(self.files)} files")
+
+        keyword = "deleted" if self.removal_thread.delete else "recycled"
+        text = f"{len(removed)} files {keyword} " \
+               f"({functions.format_file_size(sum(file.size for file in removed))} freed)."
+        if cancelled:
+            text = f"Cancelled. {text}"
+        if failed:
+            text += f"\n\n{len(failed)} files could not be {keyword}."
+        return JobMessage(text, "\n".join(f"{result.file.path}: {result.error}" for result in failed), bool(failed))
 
     def _show_warning_popup(self, file_list: list[File], delete: bool):
         warning_popup = QMessageBox()
@@ -259,98 +679,603 @@ class MainWindow(QMainWindow):
 
         keyword = "delete" if delete else "recycle"
         warning_text = f"Are you sure you want to {keyword} the selected files?"
-        for file in file_list:
+        for file in file_list[:WARNING_POPUP_MAX_FILES]:
             warning_text += f"\n- {file.name}.{file.type}"
+        if len(file_list) > WARNING_POPUP_MAX_FILES:
+            warning_text += f"\n... and {len(file_list) - WARNING_POPUP_MAX_FILES} more"
 
         warning_popup.setText(warning_text)
         warning_popup.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
         return warning_popup.exec_() == QMessageBox.Yes
 
-    def _archive_all(self):
-        self.popup = QMessageBox()
-        self.popup.setWindowTitle("Archive Status")
-        self.popup.setText("Archive Started")
-        self.popup.show()
-
-        self.thread = ArchiveThread(self.files.values())
-        self.thread.finished.connect(self._archive_finished)
-        self.thread.start()
-
-    def _archive_finished(self):
+    def _create_progress_dialog(self, label: str, on_cancel, title: str = "Backup Status") -> QProgressDialog:
+        # Progress is reported in thousandths, see ProgressThread.progress
+        progress_dialog = QProgressDialog(label, "Cancel", 0, 1000, self)
+        progress_dialog.setWindowTitle(title)
+        progress_dialog.setMinimumDuration(0)
+        progress_dialog.canceled.connect(on_cancel)
+        return progress_dialog
+
+    def _start_progress_job(self, thread: "ProgressThread", label: str, title: str,
+                            on_finished: Callable[[Any, bool], Optional["JobMessage"]],
+                            on_failed: Optional[Callable[[Exception], "JobMessage"]] = None):
+        """
+        Runs the job with a progress dialog of its own, so jobs running side by side never close each other's
+        Once the job is done, on_finished applies its result (and whether it was cancelled) and returns the
+        message to show, if any. A job that raised shows on_failed's message instead, by default the label and
+        the error
+        """
+        thread.progress_dialog = self._create_progress_dialog(label, thread.cancel, title)
+        thread.progress.connect(thread.progress_dialog.setValue)
+        thread.job_finished.connect(partial(self._finish_progress_job, thread, label, title, on_finished, on_failed))
+
+        thread.start()
+        thread.progress_dialog.show()
+
+    def _finish_progress_job(self, thread: "ProgressThread", label: str, title: str,
+                             on_finished: Callable[[Any, bool], Optional["JobMessage"]],
+                             on_failed: Optional[Callable[[Exception], "JobMessage"]],
+                             result: Any, cancelled: bool, error: Optional[Exception]):
+        self._close_progress_dialog(thread)
+
+        if error is None:
+            message = on_finished(result, cancelled)
+        elif on_failed is not None:
+            message = on_failed(error)
+        else:
+            message = JobMessage(f"{label.rstrip('.')} failed: {error}", _format_error(error), True)
+
+        if message is not None:
+            self.popup = QMessageBox()
+            self.popup.setWindowTitle(title)
+            self.popup.setIcon(QMessageBox.Warning if message.warning else QMessageBox.Information)
+            self.popup.setText(message.text)
+            if message.details:
+                self.popup.setDetailedText(message.details)
+            self.popup.show()
+
+    def _close_progress_dialog(self, thread: "ProgressThread"):
+        progress_dialog, thread.progress_dialog = thread.progress_dialog, None
+        if progress_dialog is None:
+            return
+        # Keep the dialog from reappearing when it reaches its maximum
+        try:
+            progress_dialog.canceled.disconnect()
+        except TypeError:
+            # Nothing was connected any more
+            pass
+        progress_dialog.reset()
+        progress_dialog.close()
+
+    def _is_backup_running(self) -> bool:
+        return any(thread and thread.isRunning() for thread in (self.archive_thread, self.backup_thread,
+                                                                 self.restore_thread))
+
+    def _show_backup_popup(self, text: str):
         self.popup = QMessageBox()
-        self.popup.setWindowTitle("Archive Status")
-        self.popup.setText(f"Archive Finished! Saved as downloads_archive_{date.today()}.zip")
+        self.popup.setWindowTitle("Backup Status")
+        self.popup.setText(text)
         self.popup.show()
 
-    def _create_checkbox(self):
-        # create a checkbox to be used in the table
-        # TODO: figure out how to center the checkbox in the table cell
-        checkbox = QTableWidgetItem()
-        checkbox.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-        checkbox.setCheckState(Qt.Unchecked)
-        checkbox.setTextAlignment(Qt.AlignCenter)
+    def _open_backup_store(self) -> Optional[BackupStore]:
+        try:
+            return BackupStore()
+        except OSError as error:
+            self._show_backup_popup(f"The backup store could not be opened: {error}")
+            return None
+
+    def _backup(self):
+        if self._is_backup_running():
+            return
+        backup_store = self._open_backup_store()
+        if backup_store is None:
+            return
+
+        self.backup_thread = BackupThread(backup_store, self.files.values(), [root.path for root in self.roots])
+        self._start_progress_job(self.backup_thread, "Backing up the Downloads folder...", "Backup Status",
+                                 self._backup_finished)
+
+    def _backup_finished(self, outcome: tuple[list[BackupResult], Optional[OSError]],
+                         cancelled: bool) -> "JobMessage":
+        results, error = outcome
+        snapshots = [result.snapshot for result in results if result.snapshot is not None]
+        skipped = sum(len(result.skipped) for result in results)
+        if error is not None and not snapshots:
+            return JobMessage(f"Backup failed: {error}", warning=True)
+        if cancelled or not snapshots:
+            return JobMessage("Backup cancelled.")
+
+        text = f"Backup Finished! {sum(snapshot.file_count for snapshot in snapshots)} files " \
+               f"({functions.format_file_size(sum(snapshot.total_size for snapshot in snapshots))}), " \
+               f"{functions.format_file_size(sum(result.new_bytes for result in results))} of it new."
+        if len(snapshots) > 1:
+            text += f" One snapshot was taken of each of the {len(snapshots)} folders."
+        if error is not None:
+            text += f"\n\nThe backup stopped early: {error}"
+        if skipped:
+            text += f"\n\n{skipped} files could not be read and were left out."
+        return JobMessage(text, warning=error is not None)
+
+    def _restore_backup(self):
+        if self._is_backup_running():
+            return
+        backup_store = self._open_backup_store()
+        if backup_store is None:
+            return
+
+        snapshots = backup_store.list_snapshots()
+        if not snapshots:
+            self._show_backup_popup("There are no backups to restore yet. Use Backup > Backup Downloads Folder first.")
+            return
+
+        labels = [
+            f"{datetime.fromtimestamp(snapshot.created):%Y/%m/%d %H:%M}  {snapshot.root}  "
+            f"({snapshot.file_count} files, {functions.format_file_size(snapshot.total_size)})"
+            for snapshot in snapshots
+        ]
+        label, accepted = QInputDialog.getItem(self, "Restore Backup", "Backup to restore:", labels, 0, False)
+        if not accepted:
+            return
+        snapshot = snapshots[labels.index(label)]
+
+        destination = QFileDialog.getExistingDirectory(self, "Restore Into", snapshot.root)
+        if not destination:
+            return
+
+        ret = QMessageBox.question(self, "Restore Backup",
+                                   f"Files in {destination} with the same names as backed up files will be replaced."
+                                   f"\n\nAre you sure you wish to proceed?")
+        if ret != QMessageBox.Yes:
+            return
+
+        self.restore_thread = RestoreThread(backup_store, snapshot.id, destination)
+        self._start_progress_job(self.restore_thread, f"Restoring into {destination}...", "Backup Status",
+                                 self._restore_finished)
+
+    def _restore_finished(self, failed: list[str], cancelled: bool) -> "JobMessage":
+        if cancelled:
+            return JobMessage("Restore cancelled. Files restored so far were kept.")
+        if failed:
+            return JobMessage(f"Restore Finished, but {len(failed)} files could not be restored.", "\n".join(failed),
+                              True)
+        return JobMessage("Restore Finished!")
 
-        return checkbox
-
-    def _item_changed(self, item):
-        # Check if the changed item is in the checkbox column
-        if item.column() == 5:
-            file_item = self.table.item(item.row(), 0)
-            file_object = file_item.data(Qt.UserRole)
-
-            # Update the file object based on the checkbox state
-            file_object.checked = (item.checkState() == Qt.Checked)
+    def _archive_all(self):
+        if self._is_backup_running():
+            return
+
+        archive_name = f"downloads_archive_{date.today()}.zip"
+        resume = False
+
+        # An archive that was cancelled or interrupted can be continued from its last checkpoint
+        unfinished = unfinished_archives(os.getcwd())
+        if unfinished:
+            ret = QMessageBox.question(
+                self, "Export Downloads Folder as Zip",
+                f"{os.path.basename(unfinished[-1])} was not finished. Do you want to continue it?\n\n"
+                f"Choosing No deletes the unfinished archive and starts a new one.",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel
+            )
+            if ret == QMessageBox.Cancel:
+                return
+            if ret == QMessageBox.Yes:
+                archive_name, resume = os.path.basename(unfinished[-1]), True
+            else:
+                for unfinished_name in unfinished:
+                    discard_unfinished_archive(unfinished_name)
+
+        self.archive_thread = ArchiveThread(self.files.values(), archive_name, resume)
+        self._start_progress_job(self.archive_thread, "Archiving the Downloads folder...", "Backup Status",
+                                 self._archive_finished, self._archive_failed)
+
+    def _archive_finished(self, outcome: tuple[list[str], list[str]], cancelled: bool) -> "JobMessage":
+        skipped, damaged = outcome
+        if cancelled:
+            return JobMessage("Archive paused. Export the Downloads folder again to continue where it stopped.")
+
+        text = f"Archive Finished! Saved as {self.archive_thread.archive_name}"
+        if skipped:
+            text += f"\n\n{len(skipped)} files could not be read and were left out."
+        if damaged:
+            text += f"\n\nVerification failed for {len(damaged)} files in the archive, please export it again."
+        return JobMessage(text, "\n".join(skipped + damaged), bool(skipped or damaged))
+
+    def _archive_failed(self, error: Exception) -> "JobMessage":
+        # e.g. the disk is full. Whatever was checkpointed is kept and can be continued
+        text = f"Archive failed: {error}"
+        if os.path.abspath(self.archive_thread.archive_name) in unfinished_archives(os.getcwd()):
+            text += "\n\nExport the Downloads folder again to continue from the last checkpoint or to start over."
+        return JobMessage(text, _format_error(error), True)
 
     def _update_extensions(self) -> None:
-        extensions: list[str] = list()
-
-        for file in self.files.values():
-            if file.type not in extensions:
-                extensions.append(file.type)
+        """
+        Rebuilds the "Show:" drop-down from the table's extension index, keeping the current choice if it still exists
+        """
+        extension_index = self.table.extension_index
+        current_filter = self.comboBox.currentData()
 
+        self.comboBox.blockSignals(True)
         self.comboBox.clear()
-        self.comboBox.addItem("All")
-        self.comboBox.addItems(extensions)
-
-    def _extension_search(self, search_string: str):
-        if search_string == 'All':
-            self.table.update_table_contents(list(self.files.values()))
+        self.comboBox.addItem("All", ALL_FILTER)
+
+        for category in extension_index.categories():
+            self.comboBox.addItem(self._category_label(category), f"{CATEGORY_FILTER}{category}")
+        self.comboBox.insertSeparator(self.comboBox.count())
+
+        for extension in extension_index.extensions():
+            self.comboBox.addItem(self._extension_label(extension), f"{EXTENSION_FILTER}{extension}")
+
+        self.comboBox.setCurrentIndex(max(0, self.comboBox.findData(current_filter)))
+        self.comboBox.blockSignals(False)
+
+        if self.comboBox.currentData() != current_filter:
+            self._extension_search(self.comboBox.currentIndex())
+
+    def _refresh_extensions(self, extensions: set[str]) -> None:
+        """
+        Updates the counts and sizes of the given extensions and their categories in the drop-down
+        Entries are only added or removed by rebuilding it, which costs O(extensions) rather than O(files)
+        """
+        extension_index = self.table.extension_index
+        labels: dict[str, Optional[str]] = dict()
+        for extension in extensions:
+            category = functions.get_category(extension)
+            labels[f"{EXTENSION_FILTER}{extension}"] = \
+                self._extension_label(extension) if extension_index.count(extension) else None
+            labels[f"{CATEGORY_FILTER}{category}"] = \
+                self._category_label(category) if extension_index.category_count(category) else None
+
+        rows = {filter_key: self.comboBox.findData(filter_key) for filter_key in labels}
+        if any((label is None) != (rows[filter_key] == -1) for filter_key, label in labels.items()):
+            self._update_extensions()
+            return
+
+        for filter_key, label in labels.items():
+            if label is not None:
+                self.comboBox.setItemText(rows[filter_key], label)
+
+    def _extension_label(self, extension: str) -> str:
+        extension_index = self.table.extension_index
+        return f"{extension or '(no extension)'} ({extension_index.count(extension)} files, " \
+               f"{functions.format_file_size(extension_index.total_size(extension))})"
+
+    def _category_label(self, category: str) -> str:
+        extension_index = self.table.extension_index
+        return f"{category} ({extension_index.category_count(category)} files, " \
+               f"{functions.format_file_size(extension_index.category_total_size(category))})"
+
+    def _extension_search(self, combo_index: int):
+        # Filtering only changes which rows the table shows, the files themselves stay loaded
+        filter_key = self.comboBox.itemData(combo_index) or ALL_FILTER
+        if filter_key.startswith(CATEGORY_FILTER):
+            self.table.filter_by_category(filter_key[len(CATEGORY_FILTER):])
+        elif filter_key.startswith(EXTENSION_FILTER):
+            self.table.filter_by_extension(filter_key[len(EXTENSION_FILTER):])
         else:
-            files_to_display = functions.search_by_extension(self.files, search_string)
-            self.table.update_table_contents(list(files_to_display.values()))
+            self.table.filter_by_extension(None)
 
     def _filename_search(self):
-        search_string = self.search_bar.text()
-        if search_string:
-            files_to_display = self._search_by_filename(self.table.get_displayed_files(), search_string)
-            self.table.update_table_contents(files_to_display)
-        else:
-            self.table.update_table_contents(list(self.files.values()))
+        self.search_timer.stop()
+        self.table.filter_by_name(self.search_bar.text())
 
-    def _search_by_filename(self, files: list[File], search_string: str) -> list[File]:
-        matches: list[File] = list()
-        for file in files:
-            if search_string.lower() in file.name.lower():
-                matches.append(file)
+    def _copy_to_folder(self):
+        if self.copy_thread and self.copy_thread.isRunning():
+            return
 
-        return matches
+        files_to_copy = self.table.get_selected_files()
+        if not files_to_copy:
+            self.popup = QMessageBox()
+            self.popup.setWindowTitle("Copy Status")
+            self.popup.setText("No files selected.")
+            self.popup.show()
+            return
 
-    # To decide: cut vs. copy
-    def _copy_to_folder(self):
         # Prompt the user to select a directory
-        dst_dir = QFileDialog.getExistingDirectory(None, "Select Destination Directory")
-        selectedDict = functions.get_selected(self.currentFiles)
-        functions.copy_files_to_directory(dst_dir, selectedDict)
+        destination = QFileDialog.getExistingDirectory(self, "Select Destination Directory")
+        if not destination:
+            return
+
+        self.copy_thread = CopyThread(files_to_copy, destination)
+        self._start_progress_job(self.copy_thread, f"Copying {len(files_to_copy)} files to {destination}...",
+                                 "Copy Status", self._copy_finished)
+
+    def _copy_finished(self, results: list[CopyResult], cancelled: bool) -> "JobMessage":
+        copied = [result for result in results if result.copied]
+        skipped = [result for result in results if result.skipped]
+        failed = [result for result in results if result.error and not (cancelled and result.error == CANCELLED)]
+
+        text = f"{len(copied)} files copied ({functions.format_file_size(sum(r.file.size for r in copied))})."
+        if cancelled:
+            text = f"Cancelled. {text}"
+        if skipped:
+            text += f"\n{len(skipped)} files were already there and were skipped."
+        if failed:
+            text += f"\n\n{len(failed)} files could not be copied."
+        return JobMessage(text, "\n".join(f"{result.file.path}: {result.error}" for result in failed), bool(failed))
+
+
+def _format_error(error: Exception) -> str:
+    return "".join(traceback.format_exception(error))
+
+
+class ScanThread(QThread):
+    """
+    Scans the given roots concurrently in the background, through the scan index when there is one
+    If load_snapshot is set, the files the index saved last time are emitted through snapshot_loaded first
+    Files are emitted in batches through files_found while the scan runs, and the complete
+    dict of files through scan_finished along with whether the scan was cancelled
+    """
+
+    snapshot_loaded = pyqtSignal(dict)
+    files_found = pyqtSignal(list)
+    scan_finished = pyqtSignal(dict, bool)
+
+    def __init__(self, scan_index: Optional[ScanIndex], roots: list[ScanRoot], load_snapshot: bool = False):
+        super().__init__()
+        self.scan_index = scan_index
+        self.roots = list(roots)
+        self.load_snapshot = load_snapshot
+        self._cancelled = False
+        self._batch: list[File] = list()
+        self._last_emit = 0.0
 
+    def cancel(self):
+        self._cancelled = True
 
-class ArchiveThread(QThread):
-    finished = pyqtSignal()
+    def is_cancelled(self) -> bool:
+        return self._cancelled
 
-    def __init__(self, arg):
+    def run(self):
+        if self.scan_index and self.load_snapshot:
+            self.snapshot_loaded.emit(self._load_snapshot())
+        files = scan_roots(self.roots, SCAN_WORKERS, self._on_batch, self.is_cancelled, self._scan_root)
+        self._emit_batch()
+        self.scan_finished.emit(files, self._cancelled)
+
+    def _load_snapshot(self) -> dict[str, File]:
+        # A file indexed for several roots belongs to the root listed first, as in scan_roots
+        files: dict[str, File] = dict()
+        try:
+            for root in self.roots:
+                for path, file in self.scan_index.load(root.path, root.max_depth, root.exclude).items():
+                    files.setdefault(path, file)
+        except sqlite3.Error:
+            return dict()
+        return files
+
+    def _scan_root(self, root: ScanRoot, on_batch, is_cancelled) -> dict[str, File]:
+        # Runs on a thread of its own for every root
+        if self.scan_index:
+            found: dict[str, File] = dict()
+
+            def on_index_batch(files: list[File]):
+                for file in files:
+                    found[file.path] = file
+                on_batch(files)
+
+            try:
+                return self.scan_index.refresh(root.path, root.max_depth, SCAN_WORKERS, on_index_batch, is_cancelled,
+                                               root.exclude)
+            except sqlite3.Error:
+                # Whatever was found before the index failed is kept, otherwise fall back to a plain scan
+                if found:
+                    return found
+
+        return scan_directory(root.path, root.max_depth, SCAN_WORKERS, on_batch, is_cancelled, root.exclude)
+
+    def _on_batch(self, files: list[File]):
+        # scan_roots never calls this from two roots at once
+        self._batch.extend(files)
+
+        # Coalesce small directories so the table is not updated once per folder
+        if len(self._batch) >= SCAN_BATCH_SIZE or time.monotonic() - self._last_emit >= SCAN_BATCH_INTERVAL:
+            self._emit_batch()
+
+    def _emit_batch(self):
+        if self._batch:
+            self.files_found.emit(self._batch)
+            self._batch = list()
+        self._last_emit = time.monotonic()
+
+
+class JobMessage(NamedTuple):
+    """
+    What a background job reports once it is done, see MainWindow._start_progress_job
+    """
+    text: str
+    # Shown behind "Show Details...", e.g. the files that failed and why
+    details: str = ""
+    warning: bool = False
+
+
+class ProgressThread(QThread):
+    """
+    Base class of the cancellable background jobs that report how much of their work is done
+    Subclasses implement work(). Its result is emitted through job_finished along with whether the
+    job was cancelled and the exception it failed with, if any, so a failing job still finishes
+    """
+
+    # Progress is reported in thousandths of the bytes (or files) to process, only when it changes
+    progress = pyqtSignal(int)
+    # Result of work() (None if it failed), cancelled, exception or None
+    job_finished = pyqtSignal(object, bool, object)
+
+    def __init__(self):
         super().__init__()
-        self.arg = arg
+        self._cancelled = False
+        self._permille = -1
+        # Shown while the job runs, see MainWindow._start_progress_job
+        self.progress_dialog: Optional[QProgressDialog] = None
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled
 
     def run(self):
-        # Simulate a time-consuming operation
-        functions.archive_all(self.arg)
-        self.finished.emit()
+        result, error = None, None
+        try:
+            result = self.work()
+        except Exception as exception:
+            # Anything escaping the job is reported, otherwise its progress dialog would never close
+            error = exception
+        self.job_finished.emit(result, self._cancelled, error)
+
+    def work(self) -> Any:
+        raise NotImplementedError
+
+    def _on_progress(self, done: int, total: int):
+        permille = 1000 * done // total if total else 1000
+        if permille != self._permille:
+            self._permille = permille
+            self.progress.emit(permille)
+
+
+class ArchiveThread(ProgressThread):
+    def __init__(self, files, archive_name: str, resume: bool):
+        super().__init__()
+        self.files = list(files)
+        self.archive_name = archive_name
+        self.resume = resume
+
+    def work(self) -> tuple[list[str], list[str]]:
+        # The files that could not be read, and the damaged members found by the verification pass
+        skipped = functions.archive_all(self.files, self.archive_name, on_progress=self._on_archive_progress,
+                                        is_cancelled=self.is_cancelled, resume=self.resume)
+        damaged: list[str] = list()
+        if not self._cancelled:
+            damaged = verify_archive(self.archive_name, on_progress=self._on_verify_progress,
+                                     is_cancelled=self.is_cancelled)
+        return skipped, damaged
+
+    # Writing the archive is the first half of the progress, reading it back to verify it is the second
+    def _on_archive_progress(self, archived_bytes: int, total_bytes: int):
+        self._on_progress(archived_bytes, 2 * total_bytes)
+
+    def _on_verify_progress(self, verified_bytes: int, total_bytes: int):
+        self._on_progress(total_bytes + verified_bytes, 2 * total_bytes)
+
+
+class BackupThread(ProgressThread):
+    def __init__(self, backup_store: BackupStore, files, roots: list[str]):
+        super().__init__()
+        self.backup_store = backup_store
+        self.files = list(files)
+        self.roots = roots
+
+    def work(self) -> tuple[list[BackupResult], Optional[OSError]]:
+        # A BackupResult for every root backed up, and the error that stopped the backup early if any
+        # One snapshot per root, since snapshots name their files relative to the root
+        files_by_root: dict[str, list[File]] = {root: list() for root in self.roots}
+        for file in self.files:
+            files_by_root.setdefault(file.root or self.roots[0], list()).append(file)
+
+        total_bytes = sum(file.size for file in self.files)
+        done_bytes = 0
+        results: list[BackupResult] = list()
+        for root, files in files_by_root.items():
+            if self._cancelled:
+                break
+            if not files:
+                continue
+
+            try:
+                results.append(self.backup_store.backup(
+                    files, root, functions.STORED_EXTENSIONS, is_cancelled=self.is_cancelled,
+                    on_progress=lambda done, _, offset=done_bytes: self._on_progress(offset + done, total_bytes)
+                ))
+            except OSError as error:
+                # e.g. the disk holding the store is full, the snapshots taken so far are kept
+                return results, error
+            done_bytes += sum(file.size for file in files)
+
+        return results, None
+
+
+class RestoreThread(ProgressThread):
+    def __init__(self, backup_store: BackupStore, snapshot_id: str, destination: str):
+        super().__init__()
+        self.backup_store = backup_store
+        self.snapshot_id = snapshot_id
+        self.destination = destination
+
+    def work(self) -> list[str]:
+        return self.backup_store.restore(self.snapshot_id, self.destination, on_progress=self._on_progress,
+                                         is_cancelled=self.is_cancelled)
+
+
+class RemovalThread(ProgressThread):
+    def __init__(self, files: list[File], delete: bool):
+        super().__init__()
+        self.files = files
+        self.delete = delete
+
+    def work(self) -> list[RemovalResult]:
+        remove = functions.delete_files if self.delete else functions.recycle_files
+        return remove(self.files, on_progress=self._on_progress, is_cancelled=self.is_cancelled)
+
+
+class OrganizeThread(ProgressThread):
+    def __init__(self, files, roots: list[str]):
+        super().__init__()
+        self.files = list(files)
+        self.roots = roots
+
+    def work(self) -> list[MoveResult]:
+        return functions.organize_into_folders(self.files, self.roots, on_progress=self._on_progress,
+                                               is_cancelled=self.is_cancelled)
+
+
+class IdentifyAllThread(ProgressThread):
+    def __init__(self, file_store: FileStore, date_threshold: timedelta, size_threshold: int, user_rules: list[Rule]):
+        super().__init__()
+        self.file_store = file_store
+        self.date_threshold = date_threshold
+        self.size_threshold = size_threshold
+        self.user_rules = user_rules
+
+    def work(self) -> list[RuleMatch]:
+        return functions.identify_all(self.file_store, self.date_threshold, self.size_threshold, self.user_rules,
+                                      on_progress=self._on_progress, is_cancelled=self.is_cancelled)
+
+
+class InstallersThread(ProgressThread):
+    def __init__(self, file_store: FileStore):
+        super().__init__()
+        self.file_store = file_store
+
+    def work(self) -> list[File]:
+        return functions.identify_installers(self.file_store, on_progress=self._on_progress,
+                                             is_cancelled=self.is_cancelled)
+
+
+class DuplicatesThread(ProgressThread):
+    def __init__(self, files):
+        super().__init__()
+        self.files = list(files)
+
+    def work(self) -> list[File]:
+        return functions.identify_duplicates(self.files, on_progress=self._on_progress,
+                                             is_cancelled=self.is_cancelled)
+
+
+class SimilarImagesThread(ProgressThread):
+    def __init__(self, files):
+        super().__init__()
+        self.files = list(files)
+
+    def work(self) -> list[File]:
+        return functions.identify_similar_images(self.files, on_progress=self._on_progress,
+                                                 is_cancelled=self.is_cancelled)
+
+
+class CopyThread(ProgressThread):
+    def __init__(self, files: list[File], destination: str):
+        super().__init__()
+        self.files = files
+        self.destination = destination
+
+    def work(self) -> list[CopyResult]:
+        return functions.copy_files_to_directory(self.destination, self.files, on_progress=self._on_progress,
+                                                 is_cancelled=self.is_cancelled)
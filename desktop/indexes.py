@@ -0,0 +1,227 @@
+"""
+Description:
+This file contains the in-memory indexes the file table uses to answer searches without
+looking at every file. TrigramIndex maps every three-character substring of the lowercase
+file names to the sorted ids of the files containing it, so a substring query only has to
+intersect a few posting lists and check the handful of names that survive. ExtensionIndex
+groups the files by extension, and through functions.directory_dict by category.
+
+The indexes are updated file by file as scans and the folder watcher report changes.
+In the TrigramIndex, removed files leave stale ids in the posting lists, which are skipped
+when verifying names and dropped when the index is compacted.
+
+Authors: Nolan Donovan, Evan Donohoe, Adam Lahouar
+"""
+
+from array import array
+from typing import Iterable, Optional
+
+import numpy as np
+
+from file import File
+from functions import OTHER_CATEGORY, directory_dict, get_category
+
+GRAM_LENGTH = 3
+
+# The posting lists are rebuilt once more than this fraction of the ids belong to removed files
+COMPACT_THRESHOLD = 0.5
+
+
+def _grams(name: str) -> set[str]:
+    return {name[i:i + GRAM_LENGTH] for i in range(len(name) - GRAM_LENGTH + 1)}
+
+
+class TrigramIndex:
+    """
+    Substring index over the lowercase names of files, keyed by path
+    Ids only ever grow, so every posting list stays sorted without sorting it
+    """
+
+    def __init__(self, files: Iterable[File] = ()):
+        self._files: list[Optional[File]] = list()
+        self._names: list[Optional[str]] = list()
+        self._ids: dict[str, int] = dict()
+        self._postings: dict[str, array] = dict()
+
+        self.update(files)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def clear(self) -> None:
+        self._files.clear()
+        self._names.clear()
+        self._ids.clear()
+        self._postings.clear()
+
+    def update(self, files: Iterable[File]) -> None:
+        """
+        Adds the given files, replacing any file already indexed under the same path
+        """
+        postings = self._postings
+        for file in files:
+            file_id = self._ids.get(file.path)
+            if file_id is not None:
+                # Same path means same name, so only the File object changes
+                self._files[file_id] = file
+                continue
+
+            file_id = len(self._files)
+            name = file.name.lower()
+            self._ids[file.path] = file_id
+            self._files.append(file)
+            self._names.append(name)
+
+            for gram in _grams(name):
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = postings[gram] = array("i")
+                posting.append(file_id)
+
+    def remove(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            file_id = self._ids.pop(path, None)
+            if file_id is not None:
+                self._files[file_id] = None
+                self._names[file_id] = None
+
+        if len(self._files) - len(self._ids) > COMPACT_THRESHOLD * len(self._files):
+            self._compact()
+
+    def search(self, query: str) -> list[File]:
+        """
+        Returns the files whose name contains query, ignoring case, in the order they were added
+        """
+        query = query.lower()
+        if not query:
+            return [file for file in self._files if file is not None]
+
+        if len(query) < GRAM_LENGTH:
+            # Too short to have a gram of its own, and usually matches most names anyway
+            return [file for file, name in zip(self._files, self._names) if name is not None and query in name]
+
+        if len(query) == GRAM_LENGTH:
+            return [self._files[file_id] for file_id in self._candidates(query) if self._names[file_id] is not None]
+
+        # Every gram being present does not mean they are adjacent, so the candidates' names are checked
+        names = self._names
+        return [self._files[file_id] for file_id in self._candidates(query) if query in (names[file_id] or "")]
+
+    def _candidates(self, query: str) -> list[int]:
+        """
+        Returns the sorted ids of names containing every gram of query
+        """
+        postings: list[array] = list()
+        for gram in _grams(query):
+            posting = self._postings.get(gram)
+            if posting is None:
+                return list()
+            postings.append(posting)
+
+        # Start from the rarest gram and narrow it down, each step costs O(candidates * log(posting))
+        postings.sort(key=len)
+        candidates = np.array(postings[0], dtype=np.int32)
+        for posting in postings[1:]:
+            if not len(candidates):
+                break
+            ids = np.frombuffer(posting, dtype=np.int32)
+            positions = np.searchsorted(ids, candidates)
+            positions[positions == len(ids)] = 0
+            candidates = candidates[ids[positions] == candidates]
+            del ids
+
+        return candidates.tolist()
+
+    def _compact(self) -> None:
+        files = [file for file in self._files if file is not None]
+        self.clear()
+        self.update(files)
+
+
+class ExtensionIndex:
+    """
+    Files grouped by extension, keyed by path, with the number and total size of the files of each extension
+    Categories are the folders of functions.directory_dict, so a category's files are those of its extensions
+    """
+
+    def __init__(self, files: Iterable[File] = ()):
+        self._files: dict[str, dict[str, File]] = dict()
+        self._sizes: dict[str, int] = dict()
+        self._extensions_by_path: dict[str, str] = dict()
+
+        self.update(files)
+
+    def __len__(self) -> int:
+        return len(self._extensions_by_path)
+
+    def clear(self) -> None:
+        self._files.clear()
+        self._sizes.clear()
+        self._extensions_by_path.clear()
+
+    def update(self, files: Iterable[File]) -> None:
+        """
+        Adds the given files, replacing any file already indexed under the same path
+        """
+        for file in files:
+            bucket = self._files.get(file.type)
+            if bucket is None:
+                bucket = self._files[file.type] = dict()
+                self._sizes[file.type] = 0
+
+            old_file = bucket.get(file.path)
+            if old_file is not None:
+                self._sizes[file.type] -= old_file.size
+
+            bucket[file.path] = file
+            self._sizes[file.type] += file.size
+            self._extensions_by_path[file.path] = file.type
+
+    def remove(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            extension = self._extensions_by_path.pop(path, None)
+            if extension is None:
+                continue
+
+            bucket = self._files[extension]
+            self._sizes[extension] -= bucket.pop(path).size
+            if not bucket:
+                del self._files[extension]
+                del self._sizes[extension]
+
+    def extensions(self) -> list[str]:
+        """
+        Returns the extensions of the indexed files, in the order they were first seen
+        """
+        return list(self._files)
+
+    def categories(self) -> list[str]:
+        """
+        Returns the categories of the indexed files, in the order of functions.directory_dict
+        """
+        present = {get_category(extension) for extension in self._files}
+        return [category for category in list(directory_dict) + [OTHER_CATEGORY] if category in present]
+
+    def category_extensions(self, category: str) -> list[str]:
+        return [extension for extension in self._files if get_category(extension) == category]
+
+    def count(self, extension: str) -> int:
+        return len(self._files.get(extension, ()))
+
+    def total_size(self, extension: str) -> int:
+        return self._sizes.get(extension, 0)
+
+    def category_count(self, category: str) -> int:
+        return sum(self.count(extension) for extension in self.category_extensions(category))
+
+    def category_total_size(self, category: str) -> int:
+        return sum(self.total_size(extension) for extension in self.category_extensions(category))
+
+    def files_with_extension(self, extension: str) -> list[File]:
+        return list(self._files.get(extension, dict()).values())
+
+    def files_in_category(self, category: str) -> list[File]:
+        files: list[File] = list()
+        for extension in self.category_extensions(category):
+            files.extend(self._files[extension].values())
+        return files
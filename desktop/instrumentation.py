@@ -0,0 +1,219 @@
+"""
+Description:
+This file contains a small instrumentation layer for finding where a slow session spends
+its time. Named spans time a stage (scanning, hashing, filling the table, archiving...)
+and counters add up the work it did (files stat'ed, bytes hashed, rows built, bytes
+compressed). Recorded spans can be written as a Chrome trace-event file, which
+chrome://tracing and https://ui.perfetto.dev open, or summarized per stage.
+
+Recording is off by default, in which case span returns a shared do-nothing context
+manager and count returns right away, so the instrumented code pays one check per call.
+Call sites count per batch (a directory, a chunk) rather than per file for the same reason.
+
+Recording is switched on by the Debug menu, or for a whole run by setting
+ORGANIZEMYDOWNLOADS_TRACE to the path of the trace file to write when the program exits
+(or to 1 to write it into the cache directory). A summary is then printed to stderr.
+
+Authors: Evan Donohoe, Nolan Donovan, Adam Lahouar
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Optional, TypeVar
+
+TRACE_ENV_VAR = "ORGANIZEMYDOWNLOADS_TRACE"
+
+T = TypeVar("T")
+
+_enabled = False
+_lock = threading.Lock()
+# Chrome trace events, complete spans ("X") and counter updates ("C")
+_events: list[dict] = list()
+_counters: dict[str, int] = dict()
+# Small thread numbers for the trace, in order of first use
+_thread_ids: dict[int, int] = dict()
+_start_ns = time.perf_counter_ns()
+
+
+class _NullSpan:
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start_ns")
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+        self.start_ns = 0
+
+    def __enter__(self) -> "_Span":
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        end_ns = time.perf_counter_ns()
+        event = {
+            "name": self.name, "ph": "X", "pid": os.getpid(), "tid": _thread_id(),
+            "ts": (self.start_ns - _start_ns) / 1000, "dur": (end_ns - self.start_ns) / 1000,
+        }
+        if self.args:
+            event["args"] = self.args
+        with _lock:
+            _events.append(event)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def reset() -> None:
+    """
+    Forgets everything recorded so far
+    """
+    global _start_ns
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _start_ns = time.perf_counter_ns()
+
+
+def span(name: str, **args: Any):
+    """
+    Returns a context manager that records the time spent inside it under the given name
+    Keyword arguments are shown with the span in the trace
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def traced(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """
+    Decorator recording every call of the function as a span
+    """
+    def decorator(function: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs) -> T:
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Span(name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, value: int = 1) -> None:
+    """
+    Adds value to the named counter
+    """
+    if not _enabled:
+        return
+    with _lock:
+        total = _counters[name] = _counters.get(name, 0) + value
+        _events.append({"name": name, "ph": "C", "pid": os.getpid(), "tid": _thread_id(),
+                        "ts": (time.perf_counter_ns() - _start_ns) / 1000, "args": {name: total}})
+
+
+def counters() -> dict[str, int]:
+    with _lock:
+        return dict(_counters)
+
+
+def summary() -> dict[str, dict[str, float]]:
+    """
+    Returns the calls, total, mean and longest time in milliseconds of every span name, slowest total first
+    """
+    stages: dict[str, list[float]] = dict()
+    with _lock:
+        for event in _events:
+            if event["ph"] == "X":
+                stages.setdefault(event["name"], list()).append(event["dur"] / 1000)
+
+    totals = {
+        name: {"calls": len(durations), "total_ms": sum(durations), "mean_ms": sum(durations) / len(durations),
+               "max_ms": max(durations)}
+        for name, durations in stages.items()
+    }
+    return dict(sorted(totals.items(), key=lambda item: item[1]["total_ms"], reverse=True))
+
+
+def format_summary() -> str:
+    lines = [f"{'stage':32} {'calls':>8} {'total ms':>11} {'mean ms':>10} {'max ms':>10}"]
+    for name, stage in summary().items():
+        lines.append(f"{name:32} {stage['calls']:8} {stage['total_ms']:11.1f} {stage['mean_ms']:10.2f} "
+                     f"{stage['max_ms']:10.1f}")
+    for name, total in sorted(counters().items()):
+        lines.append(f"{name:32} {total:>42,}")
+    return "\n".join(lines)
+
+
+def write_chrome_trace(path: str) -> None:
+    """
+    Writes everything recorded so far as a Chrome trace-event JSON file
+    """
+    with _lock:
+        events = list(_events)
+        thread_names = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": number,
+             "args": {"name": "main" if ident == threading.main_thread().ident else f"thread {number}"}}
+            for ident, number in _thread_ids.items()
+        ]
+
+    with open(path, "w", encoding="utf-8") as stream:
+        json.dump({"traceEvents": thread_names + events, "displayTimeUnit": "ms"}, stream)
+
+
+def _thread_id() -> int:
+    ident = threading.get_ident()
+    number = _thread_ids.get(ident)
+    if number is None:
+        number = _thread_ids.setdefault(ident, len(_thread_ids) + 1)
+    return number
+
+
+def _write_at_exit(path: str) -> None:
+    try:
+        write_chrome_trace(path)
+    except OSError as error:
+        print(f"The trace could not be written to {path}: {error}", file=sys.stderr)
+        return
+    print(f"Trace written to {path}\n{format_summary()}", file=sys.stderr)
+
+
+def _enable_from_environment() -> None:
+    trace_path: Optional[str] = os.environ.get(TRACE_ENV_VAR)
+    if not trace_path or trace_path == "0":
+        return
+
+    if trace_path == "1":
+        from paths import get_cache_dir
+
+        trace_path = os.path.join(get_cache_dir(), f"trace-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    enable()
+    atexit.register(_write_at_exit, os.path.abspath(trace_path))
+
+
+_enable_from_environment()
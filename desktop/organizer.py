@@ -0,0 +1,159 @@
+"""
+Description:
+This file contains the organizer behind "Organize Into Folders Based on File Type".
+Organizing happens in two steps. plan_moves works out where every file goes without
+touching the files: the category folder comes from the given function (the extension, or
+the contents when they contradict it, see functions.get_file_category), and a name that is
+already taken in the target folder (on disk or earlier in the plan) gets a " (n)" suffix.
+execute_moves then creates each category folder once and moves the files in parallel
+batches. A move within the same file system is a single rename; only a move to another
+device falls back to copying the file and removing the original.
+
+Authors: Nolan Donovan, Adam Lahouar, Evan Donohoe
+"""
+
+import errno
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, NamedTuple, Optional
+
+import instrumentation
+from file import File
+# Error reported for the moves that were not attempted because the job was cancelled
+from removal import CANCELLED
+
+DEFAULT_ORGANIZE_WORKERS = 8
+
+# Files moved by one worker between progress reports and cancellation checks
+MOVE_BATCH_SIZE = 512
+
+
+class Move(NamedTuple):
+    file: File
+    destination: str
+
+
+class MoveResult(NamedTuple):
+    move: Move
+    # None if the file was moved
+    error: Optional[str]
+
+    @property
+    def moved(self) -> bool:
+        return self.error is None
+
+
+@instrumentation.traced("organize.plan")
+def plan_moves(files: Iterable[File], root: str, get_category: Callable[[File], str]) -> list[Move]:
+    """
+    Plans a move into root/<category> for every file directly inside root, files in subfolders stay where they are
+    Each target folder is listed once, so the plan costs no file system call per file
+    """
+    root = os.path.abspath(root)
+    taken_names: dict[str, set[str]] = dict()
+    moves: list[Move] = list()
+
+    for file in files:
+        if file.directory != root:
+            continue
+
+        target_directory = os.path.join(root, get_category(file))
+        names = taken_names.get(target_directory)
+        if names is None:
+            names = taken_names[target_directory] = _existing_names(target_directory)
+
+        filename = free_name(os.path.basename(file.path), names)
+        names.add(os.path.normcase(filename))
+        moves.append(Move(file, os.path.join(target_directory, filename)))
+
+    return moves
+
+
+@instrumentation.traced("organize.execute")
+def execute_moves(moves: list[Move], max_workers: int = DEFAULT_ORGANIZE_WORKERS,
+                  on_progress: Optional[Callable[[int, int], None]] = None,
+                  is_cancelled: Optional[Callable[[], bool]] = None) -> list[MoveResult]:
+    """
+    Moves the files as planned, creating each target folder once
+    A file created at a planned destination after the plan was made is replaced
+    on_progress is called with the number of files handled so far and the total
+    Returns a result for every move, in plan order
+    """
+    directory_errors: dict[str, str] = dict()
+    for directory in {os.path.dirname(move.destination) for move in moves}:
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as error:
+            # e.g. a file already has the folder's name, every move into it fails with this error
+            directory_errors[directory] = f"Could not create {directory}: {error.strerror or error}"
+
+    batches = [moves[start:start + MOVE_BATCH_SIZE] for start in range(0, len(moves), MOVE_BATCH_SIZE)]
+    results: list[MoveResult] = list()
+
+    def move_batch(batch: list[Move]) -> list[MoveResult]:
+        if is_cancelled and is_cancelled():
+            return [MoveResult(move, CANCELLED) for move in batch]
+        return [
+            MoveResult(move, directory_errors.get(os.path.dirname(move.destination)) or _move(move))
+            for move in batch
+        ]
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="organizer") as executor:
+        for batch_results in executor.map(move_batch, batches):
+            results.extend(batch_results)
+            if on_progress:
+                on_progress(len(results), len(moves))
+
+    return results
+
+
+def _existing_names(directory: str) -> set[str]:
+    try:
+        return {os.path.normcase(name) for name in os.listdir(directory)}
+    except OSError:
+        # Not created yet (or not a folder, which execute_moves reports)
+        return set()
+
+
+def free_name(filename: str, names: set[str]) -> str:
+    """
+    Returns filename, or "name (n).ext" with the lowest n not in names if it is taken
+    """
+    if os.path.normcase(filename) not in names:
+        return filename
+
+    stem, extension = os.path.splitext(filename)
+    number = 1
+    while os.path.normcase(f"{stem} ({number}){extension}") in names:
+        number += 1
+    return f"{stem} ({number}){extension}"
+
+
+def _move(move: Move) -> Optional[str]:
+    """
+    Returns None if the file was moved, the error otherwise
+    """
+    source = move.file.path
+    try:
+        os.rename(source, move.destination)
+        return None
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            return error.strerror or str(error)
+
+    # The target folder is on another device (e.g. a mount point), so the file is copied then removed
+    try:
+        shutil.copy2(source, move.destination)
+    except OSError as error:
+        try:
+            os.remove(move.destination)
+        except OSError:
+            pass
+        return error.strerror or str(error)
+
+    try:
+        os.remove(source)
+    except OSError as error:
+        return f"Copied, but the original could not be removed: {error.strerror or error}"
+    return None
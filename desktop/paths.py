@@ -0,0 +1,64 @@
+"""
+Description:
+This file contains helpers for locating the per-user directories the application
+keeps its own data in, such as the scan index cache, the backup store and the settings.
+
+Authors: Nolan Donovan, Adam Lahouar, Evan Donohoe
+"""
+
+import os
+import sys
+
+APP_NAME = "OrganizeMyDownloads"
+
+
+def get_cache_dir() -> str:
+    """
+    Returns the per-user cache directory for the application, creating it if needed
+    Windows: %LOCALAPPDATA%, macOS: ~/Library/Caches, otherwise $XDG_CACHE_HOME or ~/.cache
+    """
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    elif sys.platform == "darwin":
+        base = os.path.join(os.path.expanduser("~"), "Library", "Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+
+    cache_dir = os.path.join(base, APP_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def get_data_dir() -> str:
+    """
+    Returns the per-user data directory for the application, creating it if needed
+    Unlike the cache directory, its contents (such as backups) cannot be rebuilt if lost
+    Windows: %APPDATA%, macOS: ~/Library/Application Support, otherwise $XDG_DATA_HOME or ~/.local/share
+    """
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Roaming")
+    elif sys.platform == "darwin":
+        base = os.path.join(os.path.expanduser("~"), "Library", "Application Support")
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+
+    data_dir = os.path.join(base, APP_NAME)
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+def get_config_dir() -> str:
+    """
+    Returns the per-user configuration directory for the application, creating it if needed
+    Windows: %APPDATA%, macOS: ~/Library/Application Support, otherwise $XDG_CONFIG_HOME or ~/.config
+    """
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Roaming")
+    elif sys.platform == "darwin":
+        base = os.path.join(os.path.expanduser("~"), "Library", "Application Support")
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+
+    config_dir = os.path.join(base, APP_NAME)
+    os.makedirs(config_dir, exist_ok=True)
+    return config_dir
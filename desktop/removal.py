@@ -0,0 +1,132 @@
+"""
+Description:
+This file contains the bulk removal engine behind "Delete Currently Selected Files" and
+"Recycle Currently Selected Files". Deletes are plain unlinks, which are run on a small
+thread pool since each one mostly waits on the file system. Moving files to the trash is
+much more expensive per call, so files are grouped by the volume they are on (every
+volume has its own trash) and sent to the trash in batches. If a batch fails, its files
+are retried one at a time so that every file gets its own result.
+
+Authors: Nolan Donovan, Evan Donohoe, Adam Lahouar
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, NamedTuple, Optional
+
+import instrumentation
+from file import Action, File
+
+DEFAULT_REMOVAL_WORKERS = 8
+
+# Files sent to the trash in one call
+TRASH_BATCH_SIZE = 256
+
+# Error reported for the files that were not attempted because the job was cancelled
+CANCELLED = "Cancelled"
+
+
+class RemovalResult(NamedTuple):
+    file: File
+    # None if the file was removed
+    error: Optional[str]
+
+    @property
+    def removed(self) -> bool:
+        return self.error is None
+
+
+@instrumentation.traced("remove")
+def remove_files(files: Iterable[File], action: Action, max_workers: int = DEFAULT_REMOVAL_WORKERS,
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 is_cancelled: Optional[Callable[[], bool]] = None) -> list[RemovalResult]:
+    """
+    Deletes (Action.DELETE) or recycles (Action.RECYCLE) the given files
+    on_progress is called with the number of files handled so far and the total
+    Returns a result for every file, in the order they were given
+    """
+    files = list(files)
+    results: dict[str, RemovalResult] = dict()
+
+    def report(batch_results: list[RemovalResult]) -> None:
+        for result in batch_results:
+            results[result.file.path] = result
+        if on_progress:
+            on_progress(len(results), len(files))
+
+    if action == Action.RECYCLE:
+        for batch in _trash_batches(files):
+            if is_cancelled and is_cancelled():
+                break
+            report(_recycle_batch(batch))
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="remover") as executor:
+            def delete(file: File) -> RemovalResult:
+                if is_cancelled and is_cancelled():
+                    return RemovalResult(file, CANCELLED)
+                return _delete(file)
+
+            # Results are reported in order as they complete, the executor keeps max_workers unlinks in flight
+            for result in executor.map(delete, files):
+                report([result])
+
+    return [results.get(file.path) or RemovalResult(file, CANCELLED) for file in files]
+
+
+def _delete(file: File) -> RemovalResult:
+    try:
+        os.remove(file.path)
+    except FileNotFoundError:
+        # Removed by something else since the scan, it is gone either way (as in _recycle)
+        pass
+    except OSError as error:
+        return RemovalResult(file, error.strerror or str(error))
+    return RemovalResult(file, None)
+
+
+def _trash_batches(files: list[File]) -> Iterable[list[File]]:
+    """
+    Groups the files by the volume they are on, then cuts each group into batches of up to TRASH_BATCH_SIZE
+    Files whose folder cannot be stat'ed are put in a group of their own, where they fail one by one
+    """
+    devices: dict[str, Optional[int]] = dict()
+    volumes: dict[Optional[int], list[File]] = dict()
+
+    for file in files:
+        directory = file.directory
+        if directory not in devices:
+            try:
+                devices[directory] = os.stat(directory).st_dev
+            except OSError:
+                devices[directory] = None
+        volumes.setdefault(devices[directory], list()).append(file)
+
+    for volume_files in volumes.values():
+        for start in range(0, len(volume_files), TRASH_BATCH_SIZE):
+            yield volume_files[start:start + TRASH_BATCH_SIZE]
+
+
+def _recycle_batch(batch: list[File]) -> list[RemovalResult]:
+    # Imported on first use, like in File.recycle, so that deleting never loads the trash support
+    import send2trash
+
+    try:
+        send2trash.send2trash([file.path for file in batch])
+    except (send2trash.TrashPermissionError, OSError):
+        # The batch stops at the first failure without saying which file it was, so find out one by one
+        return [_recycle(file) for file in batch]
+    return [RemovalResult(file, None) for file in batch]
+
+
+def _recycle(file: File) -> RemovalResult:
+    import send2trash
+
+    if not os.path.lexists(file.path):
+        # Already sent to the trash by the failed batch (or removed by something else), either way it is gone
+        return RemovalResult(file, None)
+
+    try:
+        send2trash.send2trash(file.path)
+    except (send2trash.TrashPermissionError, OSError) as error:
+        return RemovalResult(file, getattr(error, "strerror", None) or str(error))
+    return RemovalResult(file, None)
@@ -0,0 +1,85 @@
+"""
+Description:
+This file contains the settings of which folders the GUI manages, kept as JSON in the
+user's configuration directory, for example:
+
+    {"roots": [
+        {"path": "~/Downloads", "depth": 1},
+        {"path": "~/Desktop", "depth": 0},
+        {"path": "/mnt/shared/drop", "depth": 2, "exclude": ["*.part", "node_modules"]}
+    ]}
+
+depth is the number of subfolder levels below the folder to scan and exclude lists glob
+patterns of files and folders to leave out (see scanner.ScanRoot). Only the Downloads
+folder is managed until the file is created.
+
+Authors: Evan Donohoe, Adam Lahouar, Nolan Donovan
+"""
+
+import json
+import os
+from typing import Iterable, Optional
+
+from paths import get_config_dir
+from scanner import DEFAULT_MAX_DEPTH, DOWNLOADS_FOLDER, ScanRoot
+
+ROOTS_FILENAME = "roots.json"
+
+DEFAULT_ROOTS = [ScanRoot(DOWNLOADS_FOLDER)]
+
+
+def get_roots_path() -> str:
+    return os.path.join(get_config_dir(), ROOTS_FILENAME)
+
+
+def make_root(path: str, max_depth: int = DEFAULT_MAX_DEPTH, excludes: Iterable[str] = ()) -> ScanRoot:
+    """
+    Returns a ScanRoot for path with ~ expanded and the path made absolute, as the scanner expects
+    """
+    if isinstance(excludes, str):
+        excludes = [excludes]
+    return ScanRoot(os.path.abspath(os.path.expanduser(path)), max(0, int(max_depth)),
+                    tuple(str(pattern) for pattern in excludes))
+
+
+def load_roots(path: Optional[str] = None) -> list[ScanRoot]:
+    """
+    Returns the roots saved at path (the user configuration directory by default)
+    Entries that are not valid are left out; if the file is missing, unreadable or lists no
+    valid root, only the Downloads folder is managed
+    """
+    try:
+        with open(path or get_roots_path(), "r", encoding="utf-8") as stream:
+            entries = json.load(stream).get("roots", [])
+    except (OSError, ValueError, AttributeError):
+        return list(DEFAULT_ROOTS)
+
+    roots: list[ScanRoot] = list()
+    paths: set[str] = set()
+    for entry in entries if isinstance(entries, list) else []:
+        try:
+            root = make_root(entry["path"], entry.get("depth", DEFAULT_MAX_DEPTH), entry.get("exclude", ()))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        # The same folder listed twice would be scanned twice for nothing
+        if root.path not in paths:
+            paths.add(root.path)
+            roots.append(root)
+
+    return roots or list(DEFAULT_ROOTS)
+
+
+def save_roots(roots: Iterable[ScanRoot], path: Optional[str] = None) -> None:
+    """
+    Saves the roots at path (the user configuration directory by default), replacing the file at once
+    """
+    path = path or get_roots_path()
+    entries = [
+        {"path": root.path, "depth": root.max_depth, **({"exclude": list(root.excludes)} if root.excludes else {})}
+        for root in roots
+    ]
+
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as stream:
+        json.dump({"roots": entries}, stream, indent=2)
+    os.replace(temporary_path, path)
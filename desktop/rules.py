@@ -0,0 +1,199 @@
+"""
+Description:
+This file contains the rule engine behind "Identify All". A rule combines cleanup criteria
+(extensions, name substrings, a size or age threshold, being a duplicate, the kind of
+contents found by classifier.py) that a file has to meet all of. Every rule is compiled
+into boolean masks over one FileStore, so all the rules are answered by vectorized
+operations over the same columns instead of one Python pass over the files per query,
+and criteria shared by several rules are only computed once.
+The result is one combined selection, with the first rule (in order) each file matched.
+
+Besides the built-in rules, users can add their own as JSON in the user configuration
+directory, for example:
+
+    {"rules": [
+        {"name": "Old screenshots", "name_contains": ["screenshot"], "extensions": ["png"], "older_than_days": 90},
+        {"name": "Large videos", "extensions": ["mp4", "mov"], "larger_than_mb": 1024},
+        {"name": "Duplicate PDFs", "extensions": ["pdf"], "duplicate": true},
+        {"name": "Disk images", "kinds": ["dmg"]}
+    ]}
+
+Authors: Nolan Donovan, Evan Donohoe, Adam Lahouar
+"""
+
+import json
+import os
+from datetime import timedelta
+from typing import Callable, Iterable, NamedTuple, Optional, Union
+
+import numpy as np
+
+import instrumentation
+from classifier import classify_files
+from duplicates import get_duplicate_files
+from file import File
+from filestore import FileStore
+from paths import get_config_dir
+
+RULES_FILENAME = "rules.json"
+
+
+class Rule(NamedTuple):
+    """
+    A file matches when it meets every criterion that is set. A rule without any criterion matches nothing
+    """
+    name: str
+    # Lowercase extensions without the dot, any of which matches
+    extensions: frozenset[str] = frozenset()
+    # Lowercase substrings of the file name (without extension), any of which matches
+    name_contains: tuple[str, ...] = ()
+    # Bytes
+    larger_than: Optional[int] = None
+    # Neither created nor accessed within this long
+    older_than: Optional[timedelta] = None
+    # Only files whose contents duplicate another file, see duplicates.py
+    duplicate: bool = False
+    # Kinds of contents (see classifier.py), any of which matches
+    kinds: frozenset[str] = frozenset()
+
+    @property
+    def has_criteria(self) -> bool:
+        return bool(self.extensions or self.name_contains or self.larger_than is not None
+                    or self.older_than is not None or self.duplicate or self.kinds)
+
+
+class RuleMatch(NamedTuple):
+    file: File
+    # Name of the first rule the file matched
+    rule: str
+
+
+def make_rule(name: str, extensions: Iterable[str] = (), name_contains: Iterable[str] = (),
+              larger_than: Optional[int] = None, older_than: Optional[timedelta] = None,
+              duplicate: bool = False, kinds: Iterable[str] = ()) -> Rule:
+    """
+    Returns a Rule with its extensions and substrings normalized the way the file store compares them
+    """
+    return Rule(name, frozenset(extension.strip(".").lower() for extension in extensions),
+                tuple(substring.lower() for substring in name_contains), larger_than, older_than, duplicate,
+                frozenset(kinds))
+
+
+def get_rules_path() -> str:
+    return os.path.join(get_config_dir(), RULES_FILENAME)
+
+
+def load_rules(path: Optional[str] = None) -> list[Rule]:
+    """
+    Returns the user's rules saved at path (the user configuration directory by default)
+    Rules that are not valid or have no criterion are left out; a missing or unreadable file has no rules
+    """
+    try:
+        with open(path or get_rules_path(), "r", encoding="utf-8") as stream:
+            entries = json.load(stream).get("rules", [])
+    except (OSError, ValueError, AttributeError):
+        return list()
+
+    rules: list[Rule] = list()
+    for entry in entries if isinstance(entries, list) else []:
+        try:
+            larger_than_mb = entry.get("larger_than_mb")
+            older_than_days = entry.get("older_than_days")
+            rule = make_rule(
+                str(entry["name"]),
+                _strings(entry.get("extensions", ())),
+                _strings(entry.get("name_contains", ())),
+                None if larger_than_mb is None else int(float(larger_than_mb) * 1024 ** 2),
+                None if older_than_days is None else timedelta(days=float(older_than_days)),
+                bool(entry.get("duplicate", False)),
+                _strings(entry.get("kinds", ())),
+            )
+        except (KeyError, TypeError, ValueError, AttributeError, OverflowError):
+            continue
+        if rule.has_criteria:
+            rules.append(rule)
+
+    return rules
+
+
+def _strings(value: Union[str, Iterable]) -> list[str]:
+    # A single string is taken as a list of one, not as its characters
+    return [value] if isinstance(value, str) else [str(item) for item in value]
+
+
+@instrumentation.traced("identify.rules")
+def evaluate_rules(rules: Iterable[Rule], files: Union[Iterable[File], FileStore], now: Optional[float] = None,
+                   find_duplicates: Callable[..., list[File]] = get_duplicate_files,
+                   classify: Callable[..., dict[str, Optional[str]]] = classify_files,
+                   on_progress: Optional[Callable[[int, int], None]] = None,
+                   is_cancelled: Optional[Callable[[], bool]] = None) -> list[RuleMatch]:
+    """
+    Returns a match for every file that meets at least one of the rules, in the order of the files,
+    naming the first rule it met. Duplicates are only looked for if a rule asks for them, and contents
+    are only classified for the files that meet every other criterion of a rule asking for kinds
+    find_duplicates and classify take the files along with on_progress and is_cancelled keywords
+
+    on_progress is called with the work done so far and the total, each rule counting as an equal share
+    Once is_cancelled returns True no further rule is evaluated and the matches are incomplete
+    """
+    rules = [rule for rule in rules if rule.has_criteria]
+    store = files if isinstance(files, FileStore) else FileStore(files)
+    count = len(store)
+
+    # Masks of the individual criteria, shared between rules that use the same one
+    cache: dict[tuple, np.ndarray] = dict()
+    # Kind of every file classified so far, by path
+    kinds: dict[str, Optional[str]] = dict()
+
+    def rule_progress(number: int) -> Optional[Callable[[int, int], None]]:
+        # The progress of a slow stage (hashing, reading) within the share of the rule it runs for
+        if on_progress is None:
+            return None
+        return lambda done, total: on_progress(number * total + done, len(rules) * total)
+
+    def kind_mask(wanted: frozenset[str], candidates: np.ndarray, number: int) -> np.ndarray:
+        indices = np.flatnonzero(candidates)
+        files_to_classify = [store.files[index] for index in indices if store.files[index].path not in kinds]
+        if files_to_classify:
+            kinds.update(classify(files_to_classify, on_progress=rule_progress(number), is_cancelled=is_cancelled))
+
+        mask = np.zeros(count, dtype=bool)
+        mask[indices] = [kinds.get(store.files[index].path) in wanted for index in indices]
+        return mask
+
+    def criterion(key: tuple, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        mask = cache.get(key)
+        if mask is None:
+            mask = cache[key] = compute()
+        return mask
+
+    # Index of the first rule each file matched, len(rules) for files that matched none
+    first_rule = np.full(count, len(rules), dtype=np.int32)
+    for number, rule in enumerate(rules):
+        if is_cancelled and is_cancelled():
+            break
+        mask = np.ones(count, dtype=bool)
+        if rule.extensions:
+            mask &= criterion(("extensions", rule.extensions), lambda: store.extension_mask(rule.extensions))
+        if rule.larger_than is not None:
+            mask &= criterion(("larger_than", rule.larger_than), lambda: store.larger_than_mask(rule.larger_than))
+        if rule.older_than is not None:
+            mask &= criterion(("older_than", rule.older_than), lambda: store.older_than_mask(rule.older_than, now))
+        if rule.duplicate:
+            mask &= criterion(("duplicate",), lambda: store.files_mask(
+                find_duplicates(store.files, on_progress=rule_progress(number), is_cancelled=is_cancelled)))
+        if rule.name_contains:
+            # Only checked for the files still matching, names are slow to compare
+            mask &= store.name_mask(rule.name_contains, mask)
+        if rule.kinds:
+            # Last, as reading the files is slower still
+            mask &= kind_mask(rule.kinds, mask, number)
+
+        unmatched = first_rule == len(rules)
+        first_rule[mask & unmatched] = number
+        if on_progress:
+            on_progress(number + 1, len(rules))
+
+    matched = np.flatnonzero(first_rule < len(rules))
+    return [RuleMatch(file, rules[number].name)
+            for file, number in zip(store.select(matched), first_rule[matched].tolist())]
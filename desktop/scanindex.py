@@ -0,0 +1,229 @@
+"""
+Description:
+This file contains the ScanIndex class, a SQLite index of previously scanned files
+kept in the user's cache directory. A refresh only lists the directories whose
+modification time changed since the last scan and only writes the rows that differ,
+so rescanning an unchanged folder costs one stat call per directory.
+
+Note that a directory's modification time only changes when entries are added,
+removed or renamed, so files modified in place keep their indexed size and dates
+until their directory changes.
+
+Listed directories are indexed in full and exclude patterns are applied to what is
+returned, so changing a root's patterns never leaves the index missing files.
+
+Authors: Adam Lahouar, Nolan Donovan, Evan Donohoe
+"""
+
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, TypeVar
+
+import instrumentation
+from file import File
+from paths import get_cache_dir
+from scanner import DEFAULT_MAX_DEPTH, DEFAULT_MAX_WORKERS, list_directory, walk_directories
+
+INDEX_FILENAME = "scan_index.sqlite3"
+
+T = TypeVar("T")
+
+# Bump whenever the tables below change; older indexes are dropped and rebuilt
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    subdirectories TEXT NOT NULL,
+    PRIMARY KEY (root, path)
+);
+CREATE TABLE IF NOT EXISTS files (
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_accessed REAL NOT NULL,
+    date_added REAL NOT NULL,
+    PRIMARY KEY (root, path)
+);
+CREATE INDEX IF NOT EXISTS files_by_directory ON files (root, directory);
+"""
+
+# (size, last_accessed, date_added)
+FileRow = tuple[int, float, float]
+
+# (directory mtime in ns, files, subdirectories, whether it changed since the last refresh)
+DirectoryState = tuple[int, list[File], list[str], bool]
+
+
+class ScanIndex:
+    """
+    Initializes the index stored at the given database path (the user cache directory by default)
+    """
+
+    def __init__(self, database_path: str = None):
+        self.database_path: str = database_path or os.path.join(get_cache_dir(), INDEX_FILENAME)
+
+        with self._connect() as connection:
+            if connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS directories")
+                connection.execute("DROP TABLE IF EXISTS files")
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A fresh connection per operation keeps the index usable from worker threads
+        connection = sqlite3.connect(self.database_path)
+        try:
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @instrumentation.traced("scan_index.load")
+    def load(self, root: str, max_depth: int = DEFAULT_MAX_DEPTH,
+             exclude: Optional[Callable[[str], bool]] = None) -> dict[str, File]:
+        """
+        Returns the files indexed for root by the last refresh without touching the disk
+        Returns an empty dict if root has never been indexed
+        """
+        root = os.path.abspath(root)
+        with instrumentation.span("scan_index.read"), self._connect() as connection:
+            known_directories = self._load_directories(connection, root)
+            known_files = self._load_files(connection, root)
+
+        if root not in known_directories:
+            return dict()
+
+        def visit(directory: str) -> tuple[dict[str, FileRow], list[str]]:
+            if directory not in known_directories:
+                return dict(), list()
+            return known_files.get(directory, dict()), _included(known_directories[directory][1], exclude)
+
+        all_files: dict[str, File] = dict()
+        for directory, rows in walk_directories(root, visit, max_depth):
+            for path, row in sorted(rows.items()):
+                if exclude is None or not exclude(path):
+                    all_files[path] = File.from_metadata(path, *row, root)
+
+        return all_files
+
+    @instrumentation.traced("scan_index.refresh")
+    def refresh(self, root: str, max_depth: int = DEFAULT_MAX_DEPTH,
+                max_workers: int = DEFAULT_MAX_WORKERS,
+                on_batch: Optional[Callable[[list[File]], None]] = None,
+                is_cancelled: Optional[Callable[[], bool]] = None,
+                exclude: Optional[Callable[[str], bool]] = None) -> dict[str, File]:
+        """
+        Brings the index for root up to date and returns its files, ordered like scanner.scan_directory
+        Directories whose modification time is unchanged are served from the index
+
+        on_batch, is_cancelled and exclude behave as in scanner.scan_directory. A cancelled refresh
+        still saves the directories it got to, but leaves the rest of the index untouched
+        """
+        root = os.path.abspath(root)
+        with instrumentation.span("scan_index.read"), self._connect() as connection:
+            known_directories = self._load_directories(connection, root)
+            known_files = self._load_files(connection, root)
+
+        def visit(directory: str) -> tuple[Optional[DirectoryState], list[str]]:
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                return None, list()
+
+            known = known_directories.get(directory)
+            if known is not None and known[0] == mtime_ns:
+                rows = sorted(known_files.get(directory, dict()).items())
+                files = [File.from_metadata(path, *row, root) for path, row in rows]
+                return (mtime_ns, files, known[1], False), _included(known[1], exclude)
+
+            # Stat before listing, so changes made while listing bump the mtime and are seen next time
+            files, subdirectories = list_directory(directory)
+            for file in files:
+                file.root = root
+            return (mtime_ns, files, subdirectories, True), _included(subdirectories, exclude)
+
+        def on_visit(directory: str, state: Optional[DirectoryState]) -> None:
+            if state is not None:
+                files = _included(state[1], exclude, key=lambda file: file.path)
+                if files:
+                    on_batch(files)
+
+        all_files: dict[str, File] = dict()
+        directory_rows: list[tuple[str, str, int, str]] = list()
+        file_rows: list[tuple[str, str, str, int, float, float]] = list()
+        deleted_files: list[tuple[str, str]] = list()
+        visited: set[str] = set()
+
+        states = walk_directories(root, visit, max_depth, max_workers, on_visit if on_batch else None, is_cancelled)
+        for directory, state in states:
+            if state is None:
+                continue
+
+            visited.add(directory)
+            mtime_ns, files, subdirectories, changed = state
+            for file in _included(files, exclude, key=lambda file: file.path):
+                all_files[file.path] = file
+
+            if not changed:
+                continue
+
+            # Only the rows that differ from the index are written
+            old_rows = known_files.get(directory, dict())
+            for file in files:
+                row = (file.size, file.last_accessed, file.date_added)
+                if old_rows.get(file.path) != row:
+                    file_rows.append((root, file.path, directory, *row))
+
+            current_paths = {file.path for file in files}
+            deleted_files.extend((root, path) for path in old_rows if path not in current_paths)
+            directory_rows.append((root, directory, mtime_ns, json.dumps(subdirectories)))
+
+        # Directories that vanished or are now deeper than max_depth drop out of the index
+        removed_directories: list[tuple[str, str]] = list()
+        if not (is_cancelled and is_cancelled()):
+            removed_directories = [(root, directory) for directory in known_directories if directory not in visited]
+        deleted_files.extend(
+            (root, path)
+            for _, directory in removed_directories
+            for path in known_files.get(directory, dict())
+        )
+
+        with instrumentation.span("scan_index.write", files=len(file_rows)), self._connect() as connection:
+            connection.executemany("DELETE FROM directories WHERE root = ? AND path = ?", removed_directories)
+            connection.executemany("DELETE FROM files WHERE root = ? AND path = ?", deleted_files)
+            connection.executemany("INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?)", directory_rows)
+            connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", file_rows)
+
+        return all_files
+
+    @staticmethod
+    def _load_directories(connection: sqlite3.Connection, root: str) -> dict[str, tuple[int, list[str]]]:
+        rows = connection.execute("SELECT path, mtime_ns, subdirectories FROM directories WHERE root = ?", (root,))
+        return {path: (mtime_ns, json.loads(subdirectories)) for path, mtime_ns, subdirectories in rows}
+
+    @staticmethod
+    def _load_files(connection: sqlite3.Connection, root: str) -> dict[str, dict[str, FileRow]]:
+        files_by_directory: dict[str, dict[str, FileRow]] = dict()
+        rows = connection.execute(
+            "SELECT directory, path, size, last_accessed, date_added FROM files WHERE root = ?", (root,)
+        )
+        for directory, path, size, last_accessed, date_added in rows:
+            files_by_directory.setdefault(directory, dict())[path] = (size, last_accessed, date_added)
+
+        return files_by_directory
+
+
+def _included(items: list[T], exclude: Optional[Callable[[str], bool]],
+              key: Callable[[T], str] = lambda item: item) -> list[T]:
+    if exclude is None:
+        return items
+    return [item for item in items if not exclude(key(item))]
@@ -0,0 +1,305 @@
+"""
+Description:
+This file contains the directory scanner used to build File objects for a folder.
+It walks the folder with os.scandir, stops descending once the configured depth
+is reached and builds each File from the stat result of its directory entry.
+Directories can optionally be listed on a thread pool, which helps on network
+mounts where every stat call waits on the server.
+
+Several folders (scan roots, each with its own depth and exclude patterns) can be
+scanned at once, each on its own thread, so scanning them takes as long as the
+slowest one rather than the sum of all of them.
+
+Authors: Nolan Donovan, Evan Donohoe, Adam Lahouar
+"""
+
+import fnmatch
+import functools
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, NamedTuple, Optional, TypeVar
+
+import instrumentation
+from file import File
+
+DOWNLOADS_FOLDER = os.path.join(os.path.expanduser("~"), "Downloads")
+
+# Files directly inside the scanned folder are at depth 0, files inside one of its
+# subfolders are at depth 1, and so on.
+DEFAULT_MAX_DEPTH = 1
+
+# Number of threads used to list directories. 1 scans serially on the calling thread.
+DEFAULT_MAX_WORKERS = 1
+
+T = TypeVar("T")
+
+
+class ScanRoot(NamedTuple):
+    """
+    A folder to scan, how many subfolder levels below it to scan and the glob patterns of the
+    files and folders to leave out. A pattern is matched against both the entry's name and its
+    path relative to the root (with / separators), so "*.part", "node_modules" and "Archive/*" all work
+    """
+    path: str
+    max_depth: int = DEFAULT_MAX_DEPTH
+    excludes: tuple[str, ...] = ()
+
+    def is_excluded(self, path: str) -> bool:
+        pattern = _exclude_pattern(self.excludes)
+        if pattern is None:
+            return False
+        # Scanned paths start with the root, so slicing is enough and much cheaper than os.path.relpath
+        relative_path = path[len(self.path):].lstrip(os.sep).replace(os.sep, "/")
+        return bool(pattern.match(os.path.normcase(os.path.basename(path)))
+                    or pattern.match(os.path.normcase(relative_path)))
+
+    @property
+    def exclude(self) -> Optional[Callable[[str], bool]]:
+        """
+        is_excluded, or None when nothing is excluded so that scanning skips the check
+        """
+        return self.is_excluded if self.excludes else None
+
+
+@functools.lru_cache(maxsize=None)
+def _exclude_pattern(excludes: tuple[str, ...]) -> Optional[re.Pattern]:
+    # One regex for all the patterns, matched case-insensitively where the file system is
+    if not excludes:
+        return None
+    return re.compile("|".join(fnmatch.translate(os.path.normcase(pattern)) for pattern in excludes))
+
+
+@instrumentation.traced("scan")
+def scan_directory(path: str, max_depth: int = DEFAULT_MAX_DEPTH,
+                   max_workers: int = DEFAULT_MAX_WORKERS,
+                   on_batch: Optional[Callable[[list[File]], None]] = None,
+                   is_cancelled: Optional[Callable[[], bool]] = None,
+                   exclude: Optional[Callable[[str], bool]] = None) -> dict[str, File]:
+    """
+    Returns a dict of file paths to File objects for every file at most max_depth
+    subfolders below the given path. Subfolders deeper than max_depth are never opened,
+    neither are the files and subfolders exclude returns True for. Every file's root is the given path.
+
+    With max_workers > 1 directories are listed and stat'ed concurrently. The result is
+    ordered the same way in both modes: a directory's files sorted by name, followed by
+    the contents of each of its subfolders, also sorted by name.
+
+    on_batch, if given, receives the files of each directory as soon as it is listed.
+    Once is_cancelled returns True no further directories are listed and the files
+    found so far are returned.
+    """
+    def visit(directory: str) -> tuple[list[File], list[str]]:
+        files, subdirectories = list_directory(directory, exclude)
+        for file in files:
+            file.root = path
+        return files, subdirectories
+
+    def on_visit(directory: str, files: list[File]) -> None:
+        if files:
+            on_batch(files)
+
+    all_files: dict[str, File] = dict()
+    listings = walk_directories(path, visit, max_depth, max_workers, on_visit if on_batch else None, is_cancelled)
+    for directory, files in listings:
+        for file in files:
+            all_files[file.path] = file
+
+    return all_files
+
+
+@instrumentation.traced("scan.roots")
+def scan_roots(roots: Iterable[ScanRoot], max_workers: int = DEFAULT_MAX_WORKERS,
+               on_batch: Optional[Callable[[list[File]], None]] = None,
+               is_cancelled: Optional[Callable[[], bool]] = None,
+               scan_root: Optional[Callable[..., dict[str, File]]] = None) -> dict[str, File]:
+    """
+    Scans every root on its own thread and merges their files into one dict, in the order of roots
+    Each root lists its directories on max_workers threads of its own
+    A file reached from more than one root (e.g. one root inside another) belongs to the root listed first,
+    whichever of them reaches it first
+
+    scan_root(root, on_batch, is_cancelled) scans a single root, scan_directory by default; the
+    index uses it to serve unchanged folders. on_batch is never called by two roots at once and
+    only receives files whose root is settled: a file found by a root nested in (or containing)
+    a root listed earlier is held back until the earlier root has finished without finding it
+    """
+    roots = list(roots)
+    lock = threading.Lock()
+    # Files of every root that has finished scanning, by root number
+    finished: dict[int, dict[str, File]] = dict()
+    # Files found by each root that may still belong to an earlier root, by root number
+    held_back: dict[int, list[File]] = dict()
+    # Earlier roots whose folders overlap each root's, only these can own the root's files
+    overlapping = [
+        [earlier for earlier in range(number) if _overlaps(roots[earlier].path, root.path)]
+        for number, root in enumerate(roots)
+    ]
+
+    if scan_root is None:
+        def scan_root(root: ScanRoot, on_root_batch, root_is_cancelled) -> dict[str, File]:
+            return scan_directory(root.path, root.max_depth, max_workers, on_root_batch, root_is_cancelled,
+                                  root.exclude)
+
+    def settle(number: int, files: Iterable[File]) -> list[File]:
+        """
+        Returns the files found by the given root that belong to it, holding back the ones that cannot tell yet
+        """
+        settled: list[File] = list()
+        for file in files:
+            earlier_roots = [earlier for earlier in overlapping[number] if _is_within(file.path, roots[earlier].path)]
+            if any(earlier not in finished for earlier in earlier_roots):
+                held_back.setdefault(number, list()).append(file)
+            elif not any(file.path in finished[earlier] for earlier in earlier_roots):
+                settled.append(file)
+        return settled
+
+    def stream(files: list[File]) -> None:
+        if on_batch and files:
+            on_batch(files)
+
+    def scan(number: int) -> dict[str, File]:
+        def on_root_batch(files: list[File]) -> None:
+            with lock:
+                stream(settle(number, files))
+
+        files = scan_root(roots[number], on_root_batch if on_batch else None, is_cancelled)
+        with lock:
+            finished[number] = files
+            # Files held back for this root may be settled now
+            for later in sorted(held_back):
+                if number in overlapping[later]:
+                    stream(settle(later, held_back.pop(later)))
+        return files
+
+    if len(roots) == 1:
+        results = [scan(0)]
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, len(roots)), thread_name_prefix="scan-root") as executor:
+            results = list(executor.map(scan, range(len(roots))))
+
+    all_files: dict[str, File] = dict()
+    for files in results:
+        for path, file in files.items():
+            all_files.setdefault(path, file)
+    return all_files
+
+
+def _overlaps(first: str, second: str) -> bool:
+    return _is_within(first, second) or _is_within(second, first)
+
+
+def _is_within(path: str, directory: str) -> bool:
+    path, directory = os.path.normcase(path), os.path.normcase(directory)
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def list_directory(directory: str, exclude: Optional[Callable[[str], bool]] = None) -> tuple[list[File], list[str]]:
+    """
+    Lists a single directory without descending into it
+    Returns the files it contains and the paths of its subfolders, both sorted by name,
+    leaving out the ones exclude returns True for
+    """
+    files: list[File] = list()
+    subdirectories: list[str] = list()
+
+    try:
+        with instrumentation.span("scan.listdir"), os.scandir(directory) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name)
+    except OSError:
+        return files, subdirectories
+
+    if exclude is not None:
+        entries = [entry for entry in entries if not exclude(entry.path)]
+
+    with instrumentation.span("scan.stat"):
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.is_file():
+                    files.append(File(entry.path, entry.stat()))
+            except OSError:
+                # Broken symlinks and files removed mid-scan are skipped
+                continue
+
+    instrumentation.count("directories_listed")
+    instrumentation.count("files_stated", len(files))
+    return files, subdirectories
+
+
+def walk_directories(path: str, visit: Callable[[str], tuple[T, list[str]]],
+                     max_depth: int = DEFAULT_MAX_DEPTH,
+                     max_workers: int = DEFAULT_MAX_WORKERS,
+                     on_visit: Optional[Callable[[str, T], None]] = None,
+                     is_cancelled: Optional[Callable[[], bool]] = None) -> list[tuple[str, T]]:
+    """
+    Calls visit on the given path and on every subfolder at most max_depth levels below it
+    visit returns a result for the directory along with the subfolders to descend into
+    Returns (directory, result) pairs in pre-order, with subfolders in the order visit gave them
+
+    on_visit is called on the calling thread with each (directory, result) as soon as it is available,
+    so in parallel mode it sees directories in completion order rather than pre-order
+    Once is_cancelled returns True no further directories are visited
+    """
+    if max_workers > 1:
+        return _walk_parallel(path, visit, max_depth, max_workers, on_visit, is_cancelled)
+
+    results: list[tuple[str, T]] = list()
+    _walk_into(path, visit, 0, max_depth, results, on_visit, is_cancelled)
+    return results
+
+
+def _walk_into(directory: str, visit: Callable[[str], tuple[T, list[str]]], depth: int, max_depth: int,
+               results: list[tuple[str, T]], on_visit: Optional[Callable[[str, T], None]],
+               is_cancelled: Optional[Callable[[], bool]]) -> None:
+    if is_cancelled and is_cancelled():
+        return
+
+    result, subdirectories = visit(directory)
+    results.append((directory, result))
+    if on_visit:
+        on_visit(directory, result)
+
+    if depth >= max_depth:
+        return
+
+    for subdirectory in subdirectories:
+        _walk_into(subdirectory, visit, depth + 1, max_depth, results, on_visit, is_cancelled)
+
+
+def _walk_parallel(path: str, visit: Callable[[str], tuple[T, list[str]]], max_depth: int, max_workers: int,
+                   on_visit: Optional[Callable[[str, T], None]],
+                   is_cancelled: Optional[Callable[[], bool]]) -> list[tuple[str, T]]:
+    visited: dict[str, tuple[T, list[str]]] = dict()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scanner") as executor:
+        pending: dict[Future, tuple[str, int]] = {executor.submit(visit, path): (path, 0)}
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            cancelled = bool(is_cancelled and is_cancelled())
+
+            for future in done:
+                directory, depth = pending.pop(future)
+                result, subdirectories = future.result()
+                visited[directory] = (result, subdirectories if depth < max_depth and not cancelled else [])
+                if on_visit:
+                    on_visit(directory, result)
+
+                # Queue subfolders as soon as their parent is visited so the pool stays busy
+                if depth < max_depth and not cancelled:
+                    for subdirectory in subdirectories:
+                        pending[executor.submit(visit, subdirectory)] = (subdirectory, depth + 1)
+
+    # Merge the results in the same order the serial walk produces
+    results: list[tuple[str, T]] = list()
+    stack = [path] if path in visited else []
+    while stack:
+        directory = stack.pop()
+        result, subdirectories = visited[directory]
+        results.append((directory, result))
+        stack.extend(subdirectory for subdirectory in reversed(subdirectories) if subdirectory in visited)
+
+    return results
@@ -0,0 +1,323 @@
+"""
+Description:
+This file contains the near-duplicate image detection used by "Identify Similar Images".
+Unlike duplicates.py, which only matches identical bytes, it also finds images that were
+re-downloaded, resized or re-encoded, by comparing perceptual hashes:
+    1. Every image is decoded with Qt at a small size, turned to grayscale and reduced to
+       a 9x8 grid, and each row's brightness gradient gives 64 bits (a difference hash)
+    2. A multi-index search finds every pair of hashes within a Hamming distance of each
+       other, comparing only the pairs that share a run of bits instead of all pairs
+    3. Images linked by such pairs are grouped together
+Decoding runs on a thread pool, and hashes are cached in the user's cache directory under
+each file's (device, inode), size and modification time, so only new or changed images are
+decoded again.
+
+Authors: Adam Lahouar, Evan Donohoe, Nolan Donovan
+"""
+
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+import numpy as np
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QImage, QImageReader
+
+import instrumentation
+from file import File
+from paths import get_cache_dir
+
+T = TypeVar("T")
+
+CACHE_FILENAME = "imagehashes.sqlite3"
+
+# Bump whenever the hash is computed differently or the table changes, so that cached hashes are computed again
+SCHEMA_VERSION = 2
+
+# The hash compares HASH_WIDTH + 1 columns of HASH_HEIGHT rows, giving HASH_WIDTH * HASH_HEIGHT bits
+HASH_WIDTH = 8
+HASH_HEIGHT = 8
+HASH_BITS = HASH_WIDTH * HASH_HEIGHT
+
+# Images are decoded at this many pixels per cell of the grid, so that averaging smooths out noise.
+# JPEG images are scaled while they are decoded, which is much faster than decoding them in full
+SAMPLES_PER_CELL = 4
+
+# Hashes differing in at most this many of their 64 bits are taken to be the same picture
+DEFAULT_MAX_DISTANCE = 6
+
+# Decoding is mostly done by Qt outside the interpreter lock, so it scales with the cores
+DEFAULT_IMAGE_WORKERS = min(8, os.cpu_count() or 1)
+
+# Images decoded per task on the thread pool
+IMAGE_BATCH_SIZE = 32
+
+
+def image_hash(path: str) -> Optional[int]:
+    """
+    Returns the 64 bit difference hash of the image at path, None if Qt cannot decode it
+    """
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    reader.setScaledSize(QSize((HASH_WIDTH + 1) * SAMPLES_PER_CELL, HASH_HEIGHT * SAMPLES_PER_CELL))
+    image = reader.read()
+    if image.isNull():
+        return None
+
+    image = image.convertToFormat(QImage.Format_Grayscale8)
+    # Qt pads every line to a multiple of 4 bytes, and may ignore the scaled size for some formats
+    height, width, line = image.height(), image.width(), image.bytesPerLine()
+    if width < HASH_WIDTH + 1 or height < HASH_HEIGHT:
+        image = image.scaled((HASH_WIDTH + 1) * SAMPLES_PER_CELL, HASH_HEIGHT * SAMPLES_PER_CELL)
+        height, width, line = image.height(), image.width(), image.bytesPerLine()
+
+    pointer = image.constBits()
+    pointer.setsize(height * line)
+    pixels = np.frombuffer(pointer, dtype=np.uint8).reshape(height, line)[:, :width].astype(np.float32)
+
+    grid = _reduce(pixels, HASH_HEIGHT, HASH_WIDTH + 1)
+    bits = (grid[:, 1:] > grid[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _reduce(pixels: np.ndarray, rows: int, columns: int) -> np.ndarray:
+    """
+    Returns the mean of each cell of a rows x columns grid laid over pixels
+    """
+    row_edges = np.linspace(0, pixels.shape[0], rows + 1).astype(int)
+    column_edges = np.linspace(0, pixels.shape[1], columns + 1).astype(int)
+    sums = np.add.reduceat(np.add.reduceat(pixels, row_edges[:-1], axis=0), column_edges[:-1], axis=1)
+    return sums / np.outer(np.diff(row_edges), np.diff(column_edges))
+
+
+def close_pairs(hashes: np.ndarray, max_distance: int) -> np.ndarray:
+    """
+    Returns the (first, second) indices, first < second, of every pair of distinct hashes within max_distance
+    Hashes are split into max_distance + 1 chunks of bits. Two hashes that differ in at most max_distance
+    bits cannot differ in every chunk, so only the pairs that share a chunk exactly are compared. Each
+    chunk is sorted once, and the pairs sharing it are walked through with one vectorized step per offset
+    """
+    if not 0 <= max_distance < HASH_BITS:
+        raise ValueError(f"max_distance must be between 0 and {HASH_BITS - 1}")
+
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    edges = np.linspace(0, HASH_BITS, max_distance + 2).astype(int)
+    found: list[np.ndarray] = list()
+    compared = 0
+
+    for low, high in zip(edges[:-1], edges[1:]):
+        chunk = (hashes >> np.uint64(low)) & np.uint64((1 << int(high - low)) - 1)
+        order = np.argsort(chunk, kind="stable")
+        sorted_chunk = chunk[order]
+
+        # Hashes sharing the chunk are neighbours once sorted, offset apart for every pair among them
+        offset = 1
+        while offset < len(order):
+            same = np.flatnonzero(sorted_chunk[offset:] == sorted_chunk[:-offset])
+            if not len(same):
+                break
+            first, second = order[same], order[same + offset]
+            compared += len(same)
+            close = _popcount(hashes[first] ^ hashes[second]) <= max_distance
+            found.append(np.stack([np.minimum(first, second)[close], np.maximum(first, second)[close]], axis=1))
+            offset += 1
+
+    instrumentation.count("hash_pairs_compared", compared)
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    # A pair sharing several chunks is found once per chunk
+    return np.unique(np.concatenate(found), axis=0)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """
+    Returns the number of set bits of every 64 bit value, counted in parallel within each value
+    """
+    values = values - ((values >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    values = (values & np.uint64(0x3333333333333333)) + ((values >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    values = (values + (values >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (values * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+class ImageHashCache:
+    """
+    Initializes the cache stored at the given database path (the user cache directory by default)
+    Files are looked up by (device, inode), so renamed and moved images are still found, and a hash
+    only counts while the file keeps the size and modification time it had when it was decoded
+    """
+
+    def __init__(self, database_path: str = None):
+        self.database_path: str = database_path or os.path.join(get_cache_dir(), CACHE_FILENAME)
+
+        with self._connect() as connection:
+            if connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS hashes")
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            # Hashes, devices and inodes are stored as 8 byte blobs, SQLite integers are signed
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS hashes (device BLOB NOT NULL, inode BLOB NOT NULL, "
+                "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash BLOB, PRIMARY KEY (device, inode))"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A fresh connection per operation keeps the cache usable from worker threads
+        connection = sqlite3.connect(self.database_path)
+        try:
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def load(self) -> dict[tuple[int, int], tuple[int, int, Optional[int]]]:
+        """
+        Returns (size, mtime_ns, hash) of every cached image by (device, inode)
+        """
+        with self._connect() as connection:
+            rows = connection.execute("SELECT device, inode, size, mtime_ns, hash FROM hashes")
+            return {(_from_blob(device), _from_blob(inode)):
+                    (size, mtime_ns, None if blob is None else _from_blob(blob))
+                    for device, inode, size, mtime_ns, blob in rows}
+
+    def save(self, rows: list[tuple[int, int, int, int, Optional[int]]]) -> None:
+        """
+        Saves (device, inode, size, mtime_ns, hash) rows, replacing what was cached for the same images
+        """
+        if rows:
+            with self._connect() as connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                    [(_to_blob(row[0]), _to_blob(row[1]), *row[2:4], None if row[4] is None else _to_blob(row[4]))
+                     for row in rows]
+                )
+
+
+def _to_blob(number: int) -> bytes:
+    return number.to_bytes(8, "big")
+
+
+def _from_blob(blob: bytes) -> int:
+    return int.from_bytes(blob, "big")
+
+
+@instrumentation.traced("identify.similar_images.hash")
+def hash_images(files: Iterable[File], cache: Optional[ImageHashCache] = None,
+                max_workers: int = DEFAULT_IMAGE_WORKERS,
+                on_progress: Optional[Callable[[int, int], None]] = None,
+                is_cancelled: Optional[Callable[[], bool]] = None) -> dict[str, Optional[int]]:
+    """
+    Returns the hash of every image by path (None if it could not be decoded), decoding only the images
+    the cache has no current hash for
+    on_progress is called with the images hashed so far and the total after every batch
+    Once is_cancelled returns True no more images are decoded; the ones left out are missing from the result
+    """
+    files = list(files)
+    known = cache.load() if cache is not None else dict()
+
+    def hash_batch(batch: list[File]) -> list[tuple[str, Optional[int], Optional[tuple]]]:
+        # (path, hash, row to cache) of every image, the row is None for images that were not decoded
+        results = list()
+        for file in batch:
+            if is_cancelled and is_cancelled():
+                break
+            try:
+                stat_result = os.stat(file.path)
+            except OSError:
+                results.append((file.path, None, None))
+                continue
+
+            key = (stat_result.st_dev, stat_result.st_ino)
+            cached = known.get(key)
+            if cached is not None and cached[:2] == (stat_result.st_size, stat_result.st_mtime_ns):
+                results.append((file.path, cached[2], None))
+                continue
+
+            value = image_hash(file.path)
+            results.append((file.path, value, (*key, stat_result.st_size, stat_result.st_mtime_ns, value)))
+        return results
+
+    hashes: dict[str, Optional[int]] = dict()
+    new_rows: list[tuple] = list()
+    batches = [files[start:start + IMAGE_BATCH_SIZE] for start in range(0, len(files), IMAGE_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="imagehasher") as executor:
+        for results in executor.map(hash_batch, batches):
+            for path, value, row in results:
+                hashes[path] = value
+                # File systems without inode numbers report 0, such images are decoded every time
+                if row is not None and row[1]:
+                    new_rows.append(row)
+            instrumentation.count("images_decoded", sum(row is not None for _, _, row in results))
+            if on_progress:
+                on_progress(len(hashes), len(files))
+
+    # Saved even if cancelled, so the images decoded so far are not decoded again
+    if cache is not None:
+        cache.save(new_rows)
+    return hashes
+
+
+@instrumentation.traced("identify.similar_images.group")
+def group_similar(hashes: dict[T, Optional[int]], max_distance: int = DEFAULT_MAX_DISTANCE) -> list[list[T]]:
+    """
+    Returns groups of the keys whose hashes are within max_distance of each other, directly or through
+    other keys of the group, each group holding at least two keys. Keys without a hash are left out
+    """
+    keys = [key for key, value in hashes.items() if value is not None]
+    values, groups_of_keys = np.unique(np.array([hashes[key] for key in keys], dtype=np.uint64),
+                                       return_inverse=True)
+
+    # Union-find over the distinct hashes, joined for every pair close enough
+    parents = list(range(len(values)))
+
+    def find(index: int) -> int:
+        root = index
+        while parents[root] != root:
+            root = parents[root]
+        while parents[index] != root:
+            parents[index], index = root, parents[index]
+        return root
+
+    for first, second in close_pairs(values, max_distance).tolist():
+        first, second = find(first), find(second)
+        if first != second:
+            parents[second] = first
+
+    groups: dict[int, list[T]] = dict()
+    for key, index in zip(keys, groups_of_keys.ravel().tolist()):
+        groups.setdefault(find(index), list()).append(key)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_similar_groups(files: Iterable[File], max_distance: int = DEFAULT_MAX_DISTANCE,
+                        cache: Optional[ImageHashCache] = None, max_workers: int = DEFAULT_IMAGE_WORKERS,
+                        on_progress: Optional[Callable[[int, int], None]] = None,
+                        is_cancelled: Optional[Callable[[], bool]] = None) -> list[list[File]]:
+    """
+    Returns groups of images that look alike, each group holding at least two files
+    Images that cannot be read or decoded are never reported
+    """
+    files = {file.path: file for file in files}
+    hashes = hash_images(files.values(), cache, max_workers, on_progress, is_cancelled)
+    return [[files[path] for path in group] for group in group_similar(hashes, max_distance)]
+
+
+@instrumentation.traced("identify.similar_images")
+def get_similar_images(files: Iterable[File], max_distance: int = DEFAULT_MAX_DISTANCE,
+                       cache: Optional[ImageHashCache] = None, max_workers: int = DEFAULT_IMAGE_WORKERS,
+                       on_progress: Optional[Callable[[int, int], None]] = None,
+                       is_cancelled: Optional[Callable[[], bool]] = None) -> list[File]:
+    """
+    Returns every similar image except one file per group, which is kept as the original
+    The original is the largest file, as resized and re-encoded copies are usually smaller,
+    then the one with the shortest name (so "photo.jpg" is kept over "photo (1).jpg")
+    """
+    similar: list[File] = list()
+    for group in find_similar_groups(files, max_distance, cache, max_workers, on_progress, is_cancelled):
+        group.sort(key=lambda file: (-file.size, len(file.name), file.date_added, file.path))
+        similar.extend(group[1:])
+
+    return similar
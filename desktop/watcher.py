@@ -0,0 +1,205 @@
+"""
+Description:
+This file contains the DownloadsWatcher class, which watches the scanned folders with
+QFileSystemWatcher and turns their change notifications into incremental updates.
+Notifications are debounced and coalesced per directory, then only the directories
+that changed are listed again and compared with what was known about them, so a
+burst of downloads costs work proportional to the folders that changed rather than
+to the whole tree.
+
+Directory notifications cover files being created, deleted and renamed (which is how
+browsers finish a download). A file rewritten in place is picked up the next time its
+directory changes or on Refresh.
+
+Authors: Nolan Donovan, Adam Lahouar, Evan Donohoe
+"""
+
+import os
+import time
+from typing import Iterable
+
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+from file import File
+from scanner import ScanRoot, list_directory
+
+# Changes are processed once no new notification arrived for DEBOUNCE_MS,
+# but never later than MAX_DELAY_MS after the first one of a burst
+DEBOUNCE_MS = 300
+MAX_DELAY_MS = 2000
+
+# (size, last_accessed, date_added) of a file as last seen
+FileState = tuple[int, float, float]
+
+
+def _state(file: File) -> FileState:
+    return file.size, file.last_accessed, file.date_added
+
+
+class DownloadsWatcher(QObject):
+    """
+    Watches every root and its subfolders down to the root's depth, leaving out what the root excludes
+    files_changed is emitted with the files that were added or modified and the paths that were removed
+    Changing roots takes effect on the next start
+    """
+
+    files_changed = pyqtSignal(list, list)
+
+    def __init__(self, roots: Iterable[ScanRoot], *args, **kwargs):
+        super(DownloadsWatcher, self).__init__(*args, **kwargs)
+
+        self.roots: list[ScanRoot] = list(roots)
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._process_changes)
+
+        # (root number, depth below that root) of every root reaching each watched directory, in root order.
+        # A file belongs to the first of them that does not exclude it, as it does in scanner.scan_roots
+        self._coverage: dict[str, list[tuple[int, int]]] = dict()
+        # Every subfolder of each watched directory, excluded or not
+        self._subdirectories: dict[str, list[str]] = dict()
+        self._known_files: dict[str, dict[str, FileState]] = dict()
+        self._dirty: set[str] = set()
+        self._first_change = 0.0
+
+    def start(self, files: dict[str, File]) -> None:
+        """
+        Starts watching, treating the given files as the current contents of the watched folders
+        """
+        self.stop()
+
+        for file in files.values():
+            self._known_files.setdefault(file.directory, dict())[file.path] = _state(file)
+
+        for number, root in enumerate(self.roots):
+            self._watch_tree(root.path, 0, number)
+
+    def stop(self) -> None:
+        watched = self._watcher.directories()
+        if watched:
+            self._watcher.removePaths(watched)
+
+        self._timer.stop()
+        self._coverage.clear()
+        self._subdirectories.clear()
+        self._known_files.clear()
+        self._dirty.clear()
+
+    def is_watching(self) -> bool:
+        return bool(self._coverage)
+
+    def _watch_tree(self, directory: str, depth: int, number: int) -> list[str]:
+        """
+        Watches directory and its subfolders within the depth of the given root, without stat'ing any files
+        A directory already reached from another root is watched once, but descended into for this root too
+        Returns the directories that are now watched and were not before
+        """
+        coverage = self._coverage.get(directory)
+        if coverage is None:
+            self._watcher.addPath(directory)
+            coverage = self._coverage[directory] = list()
+            watched = [directory]
+
+            subdirectories: list[str] = list()
+            try:
+                with os.scandir(directory) as iterator:
+                    subdirectories = sorted(entry.path for entry in iterator if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                pass
+            self._subdirectories[directory] = subdirectories
+        elif any(covering == number for covering, _ in coverage):
+            return []
+        else:
+            watched = []
+
+        coverage.append((number, depth))
+        coverage.sort()
+
+        root = self.roots[number]
+        if depth < root.max_depth:
+            for subdirectory in self._subdirectories[directory]:
+                if not root.is_excluded(subdirectory):
+                    watched.extend(self._watch_tree(subdirectory, depth + 1, number))
+
+        return watched
+
+    def _on_directory_changed(self, directory: str) -> None:
+        if not self._dirty:
+            self._first_change = time.monotonic()
+        self._dirty.add(directory)
+
+        elapsed_ms = (time.monotonic() - self._first_change) * 1000
+        self._timer.start(int(max(0, min(DEBOUNCE_MS, MAX_DELAY_MS - elapsed_ms))))
+
+    def _process_changes(self) -> None:
+        dirty, self._dirty = self._dirty, set()
+
+        updated: list[File] = list()
+        removed: list[str] = list()
+
+        # Parents first, so a folder that was removed along with its parent is only handled once
+        for directory in sorted(dirty, key=len):
+            if directory in self._coverage:
+                self._rescan_directory(directory, updated, removed)
+
+        if updated or removed:
+            self.files_changed.emit(updated, removed)
+
+    def _rescan_directory(self, directory: str, updated: list[File], removed: list[str]) -> None:
+        if not os.path.isdir(directory):
+            self._forget_tree(directory, removed)
+            return
+
+        coverage = self._coverage[directory]
+        files, subdirectories = list_directory(directory)
+        known = self._known_files.get(directory, dict())
+        current: dict[str, FileState] = dict()
+
+        for file in files:
+            root = next((self.roots[number] for number, _ in coverage
+                         if not self.roots[number].is_excluded(file.path)), None)
+            if root is None:
+                continue
+            file.root = root.path
+            state = _state(file)
+            current[file.path] = state
+            if known.get(file.path) != state:
+                updated.append(file)
+
+        removed.extend(path for path in known if path not in current)
+        self._known_files[directory] = current
+
+        # Folders created or removed inside a watched folder
+        old_subdirectories = set(self._subdirectories.get(directory, list()))
+        self._subdirectories[directory] = subdirectories
+
+        for subdirectory in old_subdirectories.difference(subdirectories):
+            self._forget_tree(subdirectory, removed)
+
+        # Every root reaching a new folder watches it before any is listed, so its files get the right root
+        new_directories: list[str] = list()
+        for number, depth in list(coverage):
+            root = self.roots[number]
+            if depth < root.max_depth:
+                for subdirectory in subdirectories:
+                    if subdirectory not in old_subdirectories and not root.is_excluded(subdirectory):
+                        new_directories.extend(self._watch_tree(subdirectory, depth + 1, number))
+
+        for new_directory in new_directories:
+            self._rescan_directory(new_directory, updated, removed)
+
+    def _forget_tree(self, directory: str, removed: list[str]) -> None:
+        if directory not in self._coverage:
+            return
+
+        # The folder is gone along with everything in it, whichever roots reached it
+        for subdirectory in self._subdirectories.pop(directory, list()):
+            self._forget_tree(subdirectory, removed)
+
+        removed.extend(self._known_files.pop(directory, dict()))
+        del self._coverage[directory]
+        self._watcher.removePath(directory)
@@ -0,0 +1,34 @@
+"""
+Description:
+Shared setup of the tests. The modules in desktop/ import each other by their plain names,
+the way the application runs them, so that folder is put on the import path here.
+
+Authors: Nolan Donovan, Evan Donohoe, Adam Lahouar
+"""
+
+import os
+import sys
+from typing import Callable, Union
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "desktop"))
+
+from file import File  # noqa: E402
+
+
+@pytest.fixture
+def make_file(tmp_path) -> Callable[..., File]:
+    """
+    Returns a function writing contents to a path relative to tmp_path (creating its folders) and returning its File
+    """
+
+    def make(relative_path: str, contents: Union[bytes, str] = b"", root: str = None) -> File:
+        path = tmp_path / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(contents.encode() if isinstance(contents, str) else contents)
+        file = File(str(path))
+        file.root = root
+        return file
+
+    return make
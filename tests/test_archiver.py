@@ -0,0 +1,140 @@
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+import archiver
+from archiver import archive_files, discard_unfinished_archive, unfinished_archives, verify_archive
+
+
+@pytest.fixture
+def downloads(make_file):
+    return [make_file(f"downloads/{name}", os.urandom(size) if name.endswith(".jpg") else b"text " * size)
+            for name, size in [("a.txt", 1000), ("sub/b.txt", 300000), ("photo.jpg", 50000), ("empty.txt", 0),
+                               ("sub/deeper/c.txt", 20), ("é.txt", 10)]]
+
+
+@pytest.fixture(autouse=True)
+def commit_every_member(monkeypatch):
+    # So that a cancelled archive has checkpointed some of its members
+    monkeypatch.setattr(archiver, "CHECKPOINT_BYTES", 0)
+
+
+def cancel_after(calls: int):
+    remaining = [calls]
+
+    def is_cancelled() -> bool:
+        remaining[0] -= 1
+        return remaining[0] < 0
+
+    return is_cancelled
+
+
+def assert_archive_holds(archive_name, files):
+    with zipfile.ZipFile(archive_name) as archive:
+        assert archive.testzip() is None
+        root = os.path.commonpath([file.directory for file in files])
+        assert sorted(archive.namelist()) == sorted(os.path.relpath(file.path, root).replace(os.sep, "/")
+                                                    for file in files)
+        for file in files:
+            with open(file.path, "rb") as stream:
+                assert archive.read(os.path.relpath(file.path, root).replace(os.sep, "/")) == stream.read()
+
+
+def test_archive_holds_every_file_and_stores_compressed_ones(tmp_path, downloads):
+    archive_name = str(tmp_path / "out.zip")
+
+    assert archive_files(downloads, archive_name, stored_extensions={"jpg"}, max_workers=2) == []
+
+    assert_archive_holds(archive_name, downloads)
+    with zipfile.ZipFile(archive_name) as archive:
+        assert archive.getinfo("photo.jpg").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("sub/b.txt").compress_type == zipfile.ZIP_DEFLATED
+    assert verify_archive(archive_name) == []
+    assert unfinished_archives(str(tmp_path)) == []
+
+
+def test_unreadable_files_are_skipped(tmp_path, downloads):
+    os.remove(downloads[0].path)
+
+    assert archive_files(downloads, str(tmp_path / "out.zip")) == [downloads[0].path]
+    assert_archive_holds(str(tmp_path / "out.zip"), downloads[1:])
+
+
+def test_a_cancelled_archive_is_resumed_from_its_checkpoint(tmp_path, downloads):
+    archive_name = str(tmp_path / "out.zip")
+
+    archive_files(downloads, archive_name, max_workers=1, is_cancelled=cancel_after(5))
+    assert unfinished_archives(str(tmp_path)) == [archive_name]
+    committed, _ = archiver._Checkpoint(archive_name + archiver.CHECKPOINT_SUFFIX).load()
+    assert 0 < len(committed) < len(downloads)
+
+    archive_files(downloads, archive_name, max_workers=1)
+
+    assert_archive_holds(archive_name, downloads)
+    assert unfinished_archives(str(tmp_path)) == []
+
+
+def test_resuming_drops_what_was_recorded_after_the_last_commit(tmp_path, downloads):
+    archive_name = str(tmp_path / "out.zip")
+    checkpoint_path = archive_name + archiver.CHECKPOINT_SUFFIX
+    archive_files(downloads, archive_name, max_workers=1, is_cancelled=cancel_after(5))
+    committed, end_offset = archiver._Checkpoint(checkpoint_path).load()
+
+    # A crash while committing: a member recorded without its commit line, then a line cut short
+    record = archiver._zinfo_to_record(committed[0])
+    record.update(filename="stale.txt", header_offset=end_offset + 10)
+    with open(checkpoint_path, "a", encoding="utf-8") as stream:
+        stream.write(json.dumps(record) + '\n{"filena')
+
+    archive_files(downloads, archive_name, max_workers=1, is_cancelled=cancel_after(5))
+    resumed, _ = archiver._Checkpoint(checkpoint_path).load()
+    assert len(resumed) > len(committed)
+    assert "stale.txt" not in [zinfo.filename for zinfo in resumed]
+
+    archive_files(downloads, archive_name, max_workers=1)
+    assert_archive_holds(archive_name, downloads)
+
+
+def test_starting_over_discards_the_unfinished_archive(tmp_path, downloads):
+    archive_name = str(tmp_path / "out.zip")
+    archive_files(downloads, archive_name, is_cancelled=cancel_after(5))
+
+    discard_unfinished_archive(archive_name)
+
+    assert unfinished_archives(str(tmp_path)) == []
+    archive_files(downloads, archive_name, resume=False)
+    assert_archive_holds(archive_name, downloads)
+
+
+def test_verification_finds_damaged_members(tmp_path, downloads):
+    archive_name = str(tmp_path / "out.zip")
+    archive_files(downloads, archive_name, stored_extensions={"jpg"})
+    with zipfile.ZipFile(archive_name) as archive:
+        zinfo = archive.getinfo("photo.jpg")
+    with open(archive_name, "r+b") as stream:
+        # Past the local header, into the stored data
+        stream.seek(zinfo.header_offset + 100)
+        stream.write(b"damaged")
+
+    assert verify_archive(archive_name) == ["photo.jpg"]
+
+
+def test_zip64_end_records_are_written_for_many_members(monkeypatch):
+    # Committing needs a real file, which an in-memory archive does not have
+    monkeypatch.setattr(archiver, "CHECKPOINT_BYTES", 1 << 62)
+    stream = io.BytesIO()
+    writer = archiver._MemberWriter(stream, [], 0, None, archiver._Checkpoint(os.devnull))
+    count = 0x10000 + 1
+    for number in range(count):
+        zinfo = zipfile.ZipInfo(f"{number}.txt", (2020, 1, 2, 3, 4, 6))
+        zinfo.compress_type = zipfile.ZIP_STORED
+        for kind, value in [("start", zinfo), ("chunk", b"x"), ("raw", b"x"), ("end", None)]:
+            writer.handle(kind, value)
+    writer.finish()
+
+    with zipfile.ZipFile(stream) as archive:
+        assert len(archive.infolist()) == count
+        assert archive.read(f"{count - 1}.txt") == b"x"
@@ -0,0 +1,80 @@
+import os
+
+from backup import BackupStore, SnapshotInfo
+
+
+def read_tree(directory) -> dict[str, bytes]:
+    contents = dict()
+    for folder, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(folder, filename)
+            with open(path, "rb") as stream:
+                contents[os.path.relpath(path, directory)] = stream.read()
+    return contents
+
+
+def test_restore_writes_back_every_file_of_the_snapshot(tmp_path, make_file):
+    files = [make_file("downloads/a.txt", "first"), make_file("downloads/sub/b.bin", os.urandom(10000)),
+             make_file("downloads/empty")]
+    store = BackupStore(str(tmp_path / "store"))
+
+    result = store.backup(files, str(tmp_path / "downloads"))
+    failed = store.restore(result.snapshot.id, str(tmp_path / "restored"))
+
+    assert failed == [] and result.skipped == []
+    assert read_tree(tmp_path / "restored") == read_tree(tmp_path / "downloads")
+    restored = tmp_path / "restored" / "sub" / "b.bin"
+    assert restored.stat().st_mtime_ns == os.stat(files[1].path).st_mtime_ns
+
+
+def test_unchanged_and_duplicated_files_write_no_new_chunks(tmp_path, make_file):
+    contents = os.urandom(5000)
+    files = [make_file("downloads/a.bin", contents), make_file("downloads/copy of a.bin", contents)]
+    store = BackupStore(str(tmp_path / "store"))
+
+    first = store.backup(files, str(tmp_path / "downloads"))
+    second = store.backup(files, str(tmp_path / "downloads"))
+
+    assert first.new_bytes == len(contents)
+    assert second.new_bytes == 0
+    assert [snapshot.id for snapshot in store.list_snapshots(str(tmp_path / "downloads"))] == \
+           [second.snapshot.id, first.snapshot.id]
+
+
+def test_restore_never_writes_outside_the_destination(tmp_path, make_file):
+    store = BackupStore(str(tmp_path / "store"))
+    result = store.backup([make_file("downloads/a.txt", "contents")], str(tmp_path / "downloads"))
+    _, size, mtime_ns, chunk_hashes = store._read_entries(result.snapshot.id)[0]
+
+    # A snapshot naming files outside of its folder, e.g. one that was tampered with
+    outside = tmp_path / "outside.txt"
+    entries = [("../outside.txt", size, mtime_ns, chunk_hashes), (str(outside), size, mtime_ns, chunk_hashes),
+               ("inside.txt", size, mtime_ns, chunk_hashes)]
+    store._write_snapshot(SnapshotInfo("tampered", str(tmp_path), 0.0, len(entries), 3 * size), entries)
+
+    failed = store.restore("tampered", str(tmp_path / "restored"))
+
+    assert failed == ["../outside.txt", str(outside)]
+    assert not outside.exists()
+    assert read_tree(tmp_path / "restored") == {"inside.txt": b"contents"}
+
+
+def test_a_corrupted_chunk_fails_its_file_without_leaving_part_of_it(tmp_path, make_file):
+    store = BackupStore(str(tmp_path / "store"))
+    result = store.backup([make_file("downloads/a.txt", "contents")], str(tmp_path / "downloads"))
+    chunk_hash = store._read_entries(result.snapshot.id)[0][3][0]
+    with open(store._chunk_path(chunk_hash), "wb") as stream:
+        stream.write(b"Rtampered")
+
+    assert store.restore(result.snapshot.id, str(tmp_path / "restored")) == ["a.txt"]
+    assert read_tree(tmp_path / "restored") == {}
+
+
+def test_a_cancelled_backup_takes_no_snapshot(tmp_path, make_file):
+    store = BackupStore(str(tmp_path / "store"))
+
+    result = store.backup([make_file("downloads/a.txt", "contents")], str(tmp_path / "downloads"),
+                          is_cancelled=lambda: True)
+
+    assert result.snapshot is None
+    assert store.list_snapshots() == []
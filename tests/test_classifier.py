@@ -0,0 +1,84 @@
+import pytest
+
+import classifier
+from classifier import MSI_CLSID, OLE_SIGNATURE, ClassificationCache, classify_files, classify_path, content_category
+
+
+def ole_header(sector_shift: int = 9, first_directory_sector: int = 0) -> bytearray:
+    header = bytearray(4096)
+    header[:8] = OLE_SIGNATURE
+    header[0x1E:0x20] = sector_shift.to_bytes(2, "little")
+    header[0x30:0x34] = first_directory_sector.to_bytes(4, "little")
+    return header
+
+
+def msi() -> bytes:
+    header = ole_header()
+    root_entry = 512 + 0x50
+    header[root_entry:root_entry + 16] = MSI_CLSID
+    return bytes(header)
+
+
+@pytest.mark.parametrize("contents, kind", [
+    (b"MZ" + bytes(100), "exe"),
+    (b"PK\x03\x04" + bytes(22) + b"\x05\x00\x00\x00a.txt", "zip"),
+    (b"%PDF-1.7\n", "pdf"),
+    (msi(), "msi"),
+    (bytes(ole_header()), "ole"),
+    # Malformed OLE headers are no MSI, and must not fail the classification
+    (bytes(ole_header(sector_shift=0xFFFF)), "ole"),
+    (bytes(ole_header(first_directory_sector=0xFFFFFFF0)), "ole"),
+    (b"just some text", None),
+])
+def test_files_are_recognized_by_their_contents(make_file, contents, kind):
+    assert classify_path(make_file("download.bin", contents).path) == kind
+
+
+def test_unreadable_files_have_no_kind(tmp_path):
+    assert classify_path(str(tmp_path / "missing.exe")) is None
+
+
+def test_only_extensions_not_fitting_the_contents_change_the_category():
+    assert content_category("exe", "exe") is None
+    assert content_category("exe", "pdf") == "Executables"
+    assert content_category("zip", "docx") is None
+    assert content_category(None, "pdf") is None
+
+
+def test_cache_keeps_inode_numbers_sqlite_integers_cannot_hold(tmp_path):
+    cache = ClassificationCache(str(tmp_path / "cache.sqlite3"))
+    rows = [(2 ** 64 - 1, 2 ** 63, 10, 20, "exe"), (1, 2, 30, 40, None)]
+
+    cache.save(rows)
+
+    assert cache.lookup([(2 ** 64 - 1, 2 ** 63), (1, 2), (3, 4)]) == {(2 ** 64 - 1, 2 ** 63): (10, 20, "exe"),
+                                                                        (1, 2): (30, 40, None)}
+
+
+def test_cached_files_are_not_read_again_until_they_change(make_file, tmp_path, monkeypatch):
+    files = [make_file("setup.exe", b"MZ" + bytes(100)), make_file("notes.txt", "notes")]
+    cache = ClassificationCache(str(tmp_path / "cache.sqlite3"))
+    read = list()
+    classify = classifier.classify_path
+    monkeypatch.setattr(classifier, "classify_path", lambda path: read.append(path) or classify(path))
+
+    assert classify_files(files, cache) == {files[0].path: "exe", files[1].path: None}
+    assert len(read) == 2
+
+    assert classify_files(files, cache) == {files[0].path: "exe", files[1].path: None}
+    assert len(read) == 2
+
+    with open(files[1].path, "wb") as stream:
+        stream.write(b"%PDF-1.7 and more")
+    assert classify_files(files, cache)[files[1].path] == "pdf"
+    assert read[2:] == [files[1].path]
+
+
+def test_cancelled_classification_reads_nothing_more(make_file):
+    files = [make_file(f"{number}.exe", b"MZ") for number in range(10)]
+    progress = list()
+
+    assert classify_files(files, is_cancelled=lambda: True, on_progress=lambda *args: progress.append(args)) == {}
+    assert classify_files(files, on_progress=lambda *args: progress.append(args)) == {file.path: "exe"
+                                                                                      for file in files}
+    assert progress[-1] == (10, 10)
@@ -0,0 +1,86 @@
+import errno
+import os
+
+import pytest
+
+import copier
+from copier import CANCELLED, COPYING_SUFFIX, copy_files
+
+
+def test_copies_keep_contents_and_modification_times(tmp_path, make_file):
+    files = [make_file("a.txt", "first"), make_file("sub/b.bin", os.urandom(100000))]
+    os.utime(files[0].path, (1000000000, 1000000000))
+    progress = list()
+
+    results = copy_files(files, str(tmp_path / "copies"), on_progress=lambda done, total: progress.append(done))
+
+    assert [result.copied for result in results] == [True, True]
+    assert (tmp_path / "copies" / "a.txt").read_text() == "first"
+    assert (tmp_path / "copies" / "b.bin").read_bytes() == (tmp_path / "sub" / "b.bin").read_bytes()
+    assert os.stat(tmp_path / "copies" / "a.txt").st_mtime == 1000000000
+    assert progress[-1] == sum(file.size for file in files)
+
+
+def test_identical_copies_are_skipped_and_changed_ones_replaced(tmp_path, make_file):
+    files = [make_file("a.txt", "first"), make_file("b.txt", "second")]
+    copy_files(files, str(tmp_path / "copies"))
+    (tmp_path / "copies" / "b.txt").write_text("changed since")
+
+    results = copy_files(files, str(tmp_path / "copies"))
+
+    assert [(result.skipped, result.copied) for result in results] == [(True, False), (False, True)]
+    assert (tmp_path / "copies" / "b.txt").read_text() == "second"
+
+
+def test_files_with_the_same_name_do_not_overwrite_each_other(tmp_path, make_file):
+    files = [make_file("one/report.pdf", "first"), make_file("two/report.pdf", "second")]
+
+    results = copy_files(files, str(tmp_path / "copies"))
+
+    assert [os.path.basename(result.destination) for result in results] == ["report.pdf", "report (1).pdf"]
+    assert (tmp_path / "copies" / "report (1).pdf").read_text() == "second"
+
+
+@pytest.mark.parametrize("unsupported", [["reflink"], ["reflink", "copy_file_range"],
+                                         ["reflink", "copy_file_range", "sendfile"]])
+def test_each_fallback_copies_the_whole_file(monkeypatch, tmp_path, make_file, unsupported):
+    def not_supported(*args):
+        raise OSError(errno.ENOSYS, os.strerror(errno.ENOSYS))
+
+    monkeypatch.setattr(copier, "COPY_CHUNK_SIZE", 4096)
+    if "reflink" in unsupported:
+        monkeypatch.setattr(copier, "_reflink", lambda source_fd, destination_fd: False)
+    if "copy_file_range" in unsupported:
+        monkeypatch.setattr(copier.os, "copy_file_range", not_supported, raising=False)
+    if "sendfile" in unsupported:
+        monkeypatch.setattr(copier, "_sendfile", not_supported)
+    contents = os.urandom(50000)
+    file = make_file("a.bin", contents)
+
+    [result] = copy_files([file], str(tmp_path / "copies"))
+
+    assert result.copied
+    assert (tmp_path / "copies" / "a.bin").read_bytes() == contents
+
+
+def test_a_cancelled_copy_leaves_no_partial_file(monkeypatch, tmp_path, make_file):
+    monkeypatch.setattr(copier, "COPY_CHUNK_SIZE", 4096)
+    monkeypatch.setattr(copier, "_reflink", lambda source_fd, destination_fd: False)
+    file = make_file("a.bin", os.urandom(50000))
+    checks = iter([False, False])
+
+    [result] = copy_files([file], str(tmp_path / "copies"), is_cancelled=lambda: next(checks, True))
+
+    assert result.error == CANCELLED
+    assert os.listdir(tmp_path / "copies") == []
+
+
+def test_a_file_that_cannot_be_read_fails_alone(tmp_path, make_file):
+    files = [make_file("gone.txt", "contents"), make_file("kept.txt", "contents")]
+    os.remove(files[0].path)
+
+    results = copy_files(files, str(tmp_path / "copies"))
+
+    assert results[0].error and results[1].copied
+    assert sorted(os.listdir(tmp_path / "copies")) == ["kept.txt"]
+    assert not any(name.endswith(COPYING_SUFFIX) for name in os.listdir(tmp_path / "copies"))
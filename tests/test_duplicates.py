@@ -0,0 +1,66 @@
+import os
+
+from duplicates import PARTIAL_HASH_BYTES, find_duplicate_groups, get_duplicate_files
+
+
+def test_files_with_identical_contents_are_grouped(make_file):
+    first = make_file("a.txt", "same contents")
+    second = make_file("sub/b.txt", "same contents")
+    make_file("c.txt", "different one")
+
+    groups = find_duplicate_groups([first, second, make_file("d.txt", "other")])
+
+    assert [sorted(file.path for file in group) for group in groups] == [sorted([first.path, second.path])]
+
+
+def test_same_size_files_are_not_duplicates_by_name(make_file):
+    files = [make_file("report.pdf", "aaaa"), make_file("report (1).pdf", "bbbb")]
+
+    assert get_duplicate_files(files) == []
+
+
+def test_large_files_differing_only_in_the_middle_are_told_apart(make_file):
+    size = 4 * PARTIAL_HASH_BYTES
+    contents = os.urandom(size)
+    changed = bytearray(contents)
+    changed[size // 2] ^= 0xFF
+    first = make_file("first.bin", contents)
+    second = make_file("second.bin", bytes(changed))
+    third = make_file("third.bin", contents)
+
+    groups = find_duplicate_groups([first, second, third])
+
+    assert [sorted(file.name for file in group) for group in groups] == [["first", "third"]]
+
+
+def test_empty_and_unreadable_files_are_never_reported(make_file):
+    empty = [make_file("empty1"), make_file("empty2")]
+    kept = make_file("kept.txt", "contents")
+    missing = make_file("missing.txt", "contents")
+    os.remove(missing.path)
+
+    assert get_duplicate_files(empty + [kept, missing]) == []
+
+
+def test_the_shortest_name_is_kept_then_the_file_added_first(make_file):
+    original = make_file("report.pdf", "contents")
+    copy = make_file("report (1).pdf", "contents")
+    earlier = make_file("b.pdf", "contents")
+    earlier.date_added, original.date_added = 1.0, 2.0
+
+    # "b" and "report" differ in length, so "b" is kept whatever the dates
+    assert sorted(file.name for file in get_duplicate_files([copy, original, earlier])) == ["report", "report (1)"]
+
+    twin = make_file("a.pdf", "contents")
+    twin.date_added = 0.5
+    assert sorted(file.name for file in get_duplicate_files([earlier, twin])) == ["b"]
+
+
+def test_progress_ends_complete_and_cancelling_reports_nothing(make_file):
+    files = [make_file(f"{number}.txt", "contents") for number in range(4)]
+    progress = list()
+
+    get_duplicate_files(files, on_progress=lambda done, total: progress.append(done / total))
+
+    assert progress == sorted(progress) and progress[-1] == 1
+    assert get_duplicate_files(files, is_cancelled=lambda: True) == []
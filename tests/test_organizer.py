@@ -0,0 +1,79 @@
+import errno
+import os
+
+import organizer
+from organizer import execute_moves, free_name, plan_moves
+
+
+def by_extension(file) -> str:
+    return file.type or "Other"
+
+
+def test_only_files_directly_in_the_root_are_planned(tmp_path, make_file):
+    files = [make_file("a.txt", "a"), make_file("sub/b.txt", "b")]
+
+    moves = plan_moves(files, str(tmp_path), by_extension)
+
+    assert [(move.file, move.destination) for move in moves] == [(files[0], str(tmp_path / "txt" / "a.txt"))]
+
+
+def test_taken_names_get_the_lowest_free_number(tmp_path, make_file):
+    make_file("txt/report.txt", "already organized")
+    make_file("txt/report (1).txt", "already organized")
+    files = [make_file("report.txt", "new"), make_file("notes", "no extension")]
+
+    moves = plan_moves(files, str(tmp_path), by_extension)
+
+    assert [move.destination for move in moves] == [str(tmp_path / "txt" / "report (2).txt"),
+                                                   str(tmp_path / "Other" / "notes")]
+    assert free_name("a.txt", {os.path.normcase("a.txt")}) == "a (1).txt"
+
+
+def test_executing_the_plan_moves_every_file(tmp_path, make_file):
+    files = [make_file(f"{number}.{extension}", extension) for number in range(3) for extension in ("txt", "pdf")]
+    moves = plan_moves(files, str(tmp_path), by_extension)
+
+    results = execute_moves(moves, max_workers=2)
+
+    assert all(result.moved for result in results)
+    assert sorted(os.listdir(tmp_path / "pdf")) == ["0.pdf", "1.pdf", "2.pdf"]
+    assert (tmp_path / "txt" / "1.txt").read_text() == "txt"
+    assert not any(os.path.exists(file.path) for file in files)
+
+
+def test_moves_to_another_device_are_copied_then_removed(monkeypatch, tmp_path, make_file):
+    file = make_file("a.txt", "contents")
+    os.utime(file.path, (1000000000, 1000000000))
+
+    def rename(source, destination):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(organizer.os, "rename", rename)
+    [result] = execute_moves(plan_moves([file], str(tmp_path), by_extension))
+
+    assert result.moved
+    assert (tmp_path / "txt" / "a.txt").read_text() == "contents"
+    assert os.stat(tmp_path / "txt" / "a.txt").st_mtime == 1000000000
+    assert not os.path.exists(file.path)
+
+
+def test_a_folder_that_cannot_be_created_fails_its_moves_only(tmp_path, make_file):
+    # A file already has the name of the txt folder
+    make_file("txt", "in the way")
+    files = [make_file("a.txt", "a"), make_file("b.pdf", "b")]
+    moves = plan_moves(files, str(tmp_path), by_extension)
+
+    results = execute_moves(moves)
+
+    assert [result.moved for result in results] == [False, True]
+    assert results[0].error.startswith("Could not create")
+    assert os.path.exists(files[0].path)
+
+
+def test_cancelled_moves_leave_the_files(tmp_path, make_file):
+    files = [make_file("a.txt", "a")]
+
+    results = execute_moves(plan_moves(files, str(tmp_path), by_extension), is_cancelled=lambda: True)
+
+    assert [result.error for result in results] == [organizer.CANCELLED]
+    assert os.path.exists(files[0].path)
@@ -0,0 +1,77 @@
+import os
+import sys
+import types
+
+import pytest
+
+import removal
+from file import Action, File
+from removal import CANCELLED, remove_files
+
+
+def test_deleting_reports_every_file_in_order(tmp_path, make_file):
+    files = [make_file(f"{number}.txt", "contents") for number in range(5)]
+    # Removed by something else since the scan, it is gone either way
+    os.remove(files[1].path)
+    # A folder cannot be unlinked like a file
+    (tmp_path / "folder").mkdir()
+    folder = File(str(tmp_path / "folder"))
+
+    results = remove_files(files + [folder], Action.DELETE, max_workers=2)
+
+    assert [result.file for result in results] == files + [folder]
+    assert [result.removed for result in results] == [True] * 5 + [False]
+    assert not any(os.path.exists(file.path) for file in files)
+
+
+def test_cancelled_deletes_leave_the_files(make_file):
+    files = [make_file(f"{number}.txt", "contents") for number in range(3)]
+
+    results = remove_files(files, Action.DELETE, is_cancelled=lambda: True)
+
+    assert [result.error for result in results] == [CANCELLED] * 3
+    assert all(os.path.exists(file.path) for file in files)
+
+
+@pytest.fixture
+def trash(monkeypatch):
+    """
+    Replaces send2trash with a fake whose batches fail whenever they hold a path containing "locked"
+    Returns the calls it got
+    """
+    calls = list()
+
+    class TrashPermissionError(PermissionError):
+        pass
+
+    def send2trash(paths):
+        paths = [paths] if isinstance(paths, str) else paths
+        calls.append(list(paths))
+        for path in paths:
+            if "locked" in path:
+                raise TrashPermissionError(13, "Permission denied", path)
+            os.remove(path)
+
+    module = types.SimpleNamespace(send2trash=send2trash, TrashPermissionError=TrashPermissionError)
+    monkeypatch.setitem(sys.modules, "send2trash", module)
+    return calls
+
+
+def test_recycling_sends_files_to_the_trash_in_batches(monkeypatch, make_file, trash):
+    monkeypatch.setattr(removal, "TRASH_BATCH_SIZE", 2)
+    files = [make_file(f"{number}.txt", "contents") for number in range(5)]
+
+    results = remove_files(files, Action.RECYCLE)
+
+    assert all(result.removed for result in results)
+    assert [len(batch) for batch in trash] == [2, 2, 1]
+
+
+def test_a_failed_batch_is_retried_file_by_file(make_file, trash):
+    files = [make_file("a.txt", "contents"), make_file("locked.txt", "contents"), make_file("c.txt", "contents")]
+
+    results = remove_files(files, Action.RECYCLE)
+
+    assert [result.removed for result in results] == [True, False, True]
+    assert "Permission denied" in results[1].error
+    assert os.path.exists(files[1].path) and not os.path.exists(files[2].path)
@@ -0,0 +1,105 @@
+import json
+from datetime import timedelta
+
+from file import File
+from rules import Rule, evaluate_rules, load_rules, make_rule
+
+NOW = 1700000000.0
+DAY = 24 * 60 * 60
+
+
+def make(name: str, size: int = 100, age_days: float = 0) -> File:
+    return File.from_metadata(f"/downloads/{name}", size, NOW - age_days * DAY, NOW - age_days * DAY)
+
+
+def no_duplicates(files, **_):
+    return []
+
+
+def test_each_file_is_attributed_to_the_first_rule_it_matches():
+    files = [make("setup.exe", 10 ** 9), make("movie.mp4", 10 ** 9), make("notes.txt"), make("old.txt", age_days=400)]
+    rules = [make_rule("Installers", extensions=["exe"], name_contains=["setup"]),
+             make_rule("Large files", larger_than=10 ** 8),
+             make_rule("Old files", older_than=timedelta(days=365))]
+
+    matches = evaluate_rules(rules, files, now=NOW, find_duplicates=no_duplicates)
+
+    assert [(match.file.name, match.rule) for match in matches] == \
+           [("setup", "Installers"), ("movie", "Large files"), ("old", "Old files")]
+
+
+def test_a_file_has_to_meet_every_criterion_of_a_rule():
+    files = [make("Screenshot 1.png", age_days=100), make("Screenshot 2.png", age_days=10),
+             make("photo.png", age_days=100), make("screenshot.jpg", age_days=100)]
+    rule = make_rule("Old screenshots", extensions=[".PNG"], name_contains=["SCREENSHOT"],
+                     older_than=timedelta(days=90))
+
+    assert [match.file.name for match in evaluate_rules([rule], files, now=NOW)] == ["Screenshot 1"]
+
+
+def test_rules_without_criteria_match_nothing():
+    assert evaluate_rules([Rule("Everything")], [make("a.txt")], now=NOW) == []
+
+
+def test_duplicates_are_looked_for_once_and_only_when_asked():
+    files = [make("a.txt"), make("b.pdf"), make("c.pdf")]
+    calls = list()
+
+    def find_duplicates(candidates, **_):
+        calls.append(candidates)
+        return [candidates[2]]
+
+    rules = [make_rule("Large", larger_than=10 ** 9), make_rule("Duplicate PDFs", extensions=["pdf"], duplicate=True),
+             make_rule("Any duplicate", duplicate=True)]
+
+    matches = evaluate_rules(rules, files, now=NOW, find_duplicates=find_duplicates)
+
+    assert [(match.file.name, match.rule) for match in matches] == [("c", "Duplicate PDFs")]
+    assert len(calls) == 1
+    evaluate_rules(rules[:1], files, now=NOW, find_duplicates=find_duplicates)
+    assert len(calls) == 1
+
+
+def test_only_files_meeting_the_other_criteria_are_classified():
+    files = [make("tool.exe"), make("mystery"), make("notes.txt"), make("archive.zip")]
+    classified = list()
+
+    def classify(candidates, **_):
+        classified.extend(file.name for file in candidates)
+        return {file.path: "msi" if file.name == "mystery" else "exe" for file in candidates}
+
+    rules = [make_rule("Installers", extensions=["", "exe"], kinds=["msi"]),
+             make_rule("Programs", extensions=["", "exe"], kinds=["exe"])]
+
+    matches = evaluate_rules(rules, files, now=NOW, classify=classify)
+
+    assert [(match.file.name, match.rule) for match in matches] == [("tool", "Programs"), ("mystery", "Installers")]
+    # The second rule asks about the same files, which are not read again
+    assert sorted(classified) == ["mystery", "tool"]
+
+
+def test_progress_and_cancellation():
+    files = [make("a.txt", 10 ** 9)]
+    rules = [make_rule("Large", larger_than=10), make_rule("Text", extensions=["txt"])]
+    progress = list()
+
+    assert len(evaluate_rules(rules, files, now=NOW, on_progress=lambda done, total: progress.append(done / total)))
+    assert progress[-1] == 1
+    assert evaluate_rules(rules, files, now=NOW, is_cancelled=lambda: True) == []
+
+
+def test_user_rules_are_loaded_leaving_out_invalid_ones(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": [
+        {"name": "Large videos", "extensions": "mp4", "larger_than_mb": 1024},
+        {"name": "Old screenshots", "name_contains": ["Screenshot"], "older_than_days": 90},
+        {"extensions": ["iso"]},
+        {"name": "No criteria"},
+        {"name": "Bad size", "larger_than_mb": "huge"},
+    ]}))
+
+    rules = load_rules(str(path))
+
+    assert rules == [make_rule("Large videos", extensions=["mp4"], larger_than=1024 ** 3),
+                     make_rule("Old screenshots", name_contains=["screenshot"], older_than=timedelta(days=90))]
+    assert load_rules(str(tmp_path / "missing.json")) == []
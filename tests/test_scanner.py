@@ -0,0 +1,63 @@
+import os
+import time
+
+import pytest
+
+from scanner import ScanRoot, scan_directory, scan_roots
+
+
+@pytest.fixture
+def tree(tmp_path, make_file):
+    for relative_path in ["a.txt", "b.part", "sub/c.txt", "sub/deeper/d.txt", "sub/deeper/deepest/e.txt",
+                          "Archive/old.zip", "node_modules/module.js", "other/f.txt"]:
+        make_file(relative_path, relative_path)
+    return tmp_path
+
+
+def relative_paths(files, root) -> list[str]:
+    return [os.path.relpath(path, root).replace(os.sep, "/") for path in files]
+
+
+def test_subfolders_deeper_than_max_depth_are_not_scanned(tree):
+    assert relative_paths(scan_directory(str(tree), max_depth=0), tree) == ["a.txt", "b.part"]
+    assert "sub/deeper/d.txt" not in relative_paths(scan_directory(str(tree), max_depth=1), tree)
+    assert "sub/deeper/deepest/e.txt" in relative_paths(scan_directory(str(tree), max_depth=3), tree)
+
+
+def test_parallel_scans_find_the_same_files_in_the_same_order(tree):
+    serial = scan_directory(str(tree), max_depth=5)
+
+    assert list(scan_directory(str(tree), max_depth=5, max_workers=4)) == list(serial)
+    assert all(file.root == str(tree) for file in serial.values())
+
+
+def test_excluded_files_and_folders_are_left_out(tree):
+    root = ScanRoot(str(tree), 5, ("*.part", "node_modules", "Archive/*"))
+
+    found = relative_paths(scan_directory(root.path, root.max_depth, exclude=root.exclude), tree)
+
+    assert found == ["a.txt", "other/f.txt", "sub/c.txt", "sub/deeper/d.txt", "sub/deeper/deepest/e.txt"]
+
+
+def test_cancelling_returns_what_was_found_so_far(tree):
+    assert scan_directory(str(tree), max_depth=5, is_cancelled=lambda: True) == {}
+
+
+@pytest.mark.parametrize("slow_root", [0, 1])
+def test_files_of_overlapping_roots_belong_to_the_root_listed_first(tree, slow_root):
+    roots = [ScanRoot(str(tree / "sub"), 5), ScanRoot(str(tree), 5)]
+
+    def scan_root(root, on_batch, is_cancelled):
+        # Whichever root finishes first, ownership must not change
+        if root == roots[slow_root]:
+            time.sleep(0.1)
+        return scan_directory(root.path, root.max_depth, 1, on_batch, is_cancelled)
+
+    streamed = list()
+    files = scan_roots(roots, on_batch=streamed.extend, scan_root=scan_root)
+
+    in_sub = [file for path, file in files.items() if path.startswith(str(tree / "sub") + os.sep)]
+    assert len(in_sub) == 3 and all(file.root == str(tree / "sub") for file in in_sub)
+    assert files[str(tree / "a.txt")].root == str(tree)
+    assert sorted(file.path for file in streamed) == sorted(files)
+    assert {file.path: file.root for file in streamed} == {path: file.root for path, file in files.items()}